@@ -0,0 +1,586 @@
+"""
+Benchmark offline da ingestão e da busca.
+
+O que faz:
+- Gera um corpus sintético (TXT e PDFs mínimos escritos à mão) numa pasta temporária.
+- Mede `load_sections`, chunking, throughput de embedding (chunks/s), upsert
+  (linhas/s) e latência de `search` (p50/p95/p99) em vários tamanhos de coleção.
+- Mede o tempo de import dos módulos e a latência da primeira busca num
+  processo novo, com e sem o aquecimento (`rag.warmup`) usado pelo servidor.
+- Usa por padrão um embedding falso determinístico (hash do texto) e um
+  PersistentClient local descartável: roda sem rede nem modelo baixado.
+- Grava os resultados em JSON; com `--baseline` compara com uma execução salva
+  e aponta regressões acima da tolerância.
+
+Execução:
+  python scripts/benchmark.py --out bench.json
+  python scripts/benchmark.py --baseline bench.json --fail-on-regression
+  python scripts/benchmark.py --real-embeddings --sizes 1000,5000
+
+Os caches de consulta ficam desligados para medir o caminho completo.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+WORDS = (
+    "contrato cláusula prestação serviço prazo pagamento reajuste índice parte "
+    "contratante contratada rescisão multa notificação vigência anual mensal "
+    "fornecimento entrega garantia responsabilidade obrigação documento anexo "
+    "relatório auditoria fiscal tributo imposto nota emissão cadastro cliente "
+    "fornecedor estoque pedido compra venda valor total parcela juros correção "
+    "processo procedimento norma política segurança acesso sistema usuário "
+    "informação dados pessoais tratamento consentimento finalidade prazo legal"
+).split()
+
+
+# -- corpus sintético -----------------------------------------------------
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 22))]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(3, 7)))
+
+
+def _wrap(text: str, width: int = 90) -> list[str]:
+    lines: list[str] = []
+    current = ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _pdf_escape(line: str) -> bytes:
+    line = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return line.encode("cp1252", errors="replace")
+
+
+def write_pdf(path: Path, pages: list[list[str]]) -> None:
+    """PDF mínimo (Helvetica/WinAnsi, uma linha por `T*`) legível pelo pypdf."""
+    count = len(pages)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(count))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {count} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+        b"/Encoding /WinAnsiEncoding >>",
+    ]
+    for i, lines in enumerate(pages):
+        body = b"BT /F1 9 Tf 12 TL 40 800 Td " + b" T* ".join(
+            b"(" + _pdf_escape(line) + b") Tj" for line in lines
+        ) + b" ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(body) + body + b"\nendstream"
+        )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    path.write_bytes(bytes(out))
+
+
+def build_corpus(folder: Path, *, txt_files: int, pdf_files: int, pages: int, seed: int) -> list[Path]:
+    """Gera TXTs (parágrafos separados por linha em branco) e PDFs de `pages` páginas."""
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    paths: list[Path] = []
+    for i in range(txt_files):
+        path = folder / f"doc_{i:03d}.txt"
+        path.write_text(
+            "\n\n".join(_paragraph(rng) for _ in range(pages * 4)), encoding="utf-8"
+        )
+        paths.append(path)
+    for i in range(pdf_files):
+        path = folder / f"doc_{i:03d}.pdf"
+        page_lines = []
+        for _ in range(pages):
+            lines: list[str] = []
+            while len(lines) < 55:
+                lines.extend(_wrap(_paragraph(rng)) + [""])
+            page_lines.append(lines[:60])
+        write_pdf(path, page_lines)
+        paths.append(path)
+    return paths
+
+
+# -- embedding falso --------------------------------------------------------
+
+
+def fake_engine_class():
+    from src.embedding import EmbeddingEngine
+
+    class FakeEngine(EmbeddingEngine):
+        """Vetores unitários determinísticos derivados do hash do texto (sem modelo)."""
+
+        def __init__(self, dim: int, **kwargs) -> None:
+            super().__init__("fake-embedding", **kwargs)
+            self._dim = dim
+
+        @property
+        def dimension(self) -> int:
+            return self._dim
+
+        @property
+        def model(self):
+            return None  # sem pesos para carregar
+
+        def _encode_batch(self, texts):
+            out = np.empty((len(texts), self._dim), dtype=np.float32)
+            for row, text in enumerate(texts):
+                seed = int.from_bytes(
+                    hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little"
+                )
+                vector = np.random.default_rng(seed).standard_normal(self._dim)
+                out[row] = vector / np.linalg.norm(vector)
+            return out
+
+    return FakeEngine
+
+
+def install_engine(engine) -> None:
+    """Faz ingestão, busca e a EmbeddingFunction do Chroma usarem `engine`."""
+    from src import chroma_setup, embedding, rag
+
+    for module in (embedding, chroma_setup, rag):
+        module.get_engine = lambda: engine
+    chroma_setup._embedding_function.cache_clear()
+    rag.query_batcher.cache_clear()
+
+
+# -- medições ---------------------------------------------------------------
+
+
+def _timed(fn: Callable[[], object]) -> tuple[object, float]:
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def _rate(count: float, seconds: float) -> float:
+    return round(count / seconds, 3) if seconds > 0 else 0.0
+
+
+def _latency(samples: list[float]) -> dict:
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def bench_load(paths: list[Path]) -> tuple[list, dict]:
+    from src.chunker import load_sections
+
+    sections, seconds = _timed(lambda: [s for p in paths for s in load_sections(p)])
+    size = sum(p.stat().st_size for p in paths)
+    chars = sum(len(text) for text, _ in sections)
+    return sections, {
+        "files": len(paths),
+        "sections": len(sections),
+        "chars": chars,
+        "seconds": round(seconds, 4),
+        "sections_per_sec": _rate(len(sections), seconds),
+        "mb_per_sec": _rate(size / 1e6, seconds),
+    }
+
+
+def bench_chunk(sections: list, *, mode: str, chunk_size: int, overlap: int) -> tuple[list[str], dict]:
+    from src.chunker import chunk_text, chunk_text_tokens
+
+    if mode == "tokens":
+        split = lambda text: chunk_text_tokens(text, chunk_size, overlap)  # noqa: E731
+    else:
+        split = lambda text: chunk_text(text, chunk_size, overlap)  # noqa: E731
+    texts, seconds = _timed(lambda: [c for text, _ in sections for c in split(text)])
+    chars = sum(len(text) for text, _ in sections)
+    return texts, {
+        "mode": mode,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "chunks": len(texts),
+        "seconds": round(seconds, 4),
+        "chunks_per_sec": _rate(len(texts), seconds),
+        "mb_per_sec": _rate(chars / 1e6, seconds),
+    }
+
+
+def bench_embed(engine, texts: list[str]) -> tuple[np.ndarray, dict]:
+    vectors, seconds = _timed(lambda: engine.encode(texts, use_cache=False))
+    return vectors, {
+        "chunks": len(texts),
+        "batch_size": engine.batch_size,
+        "seconds": round(seconds, 4),
+        "chunks_per_sec": _rate(len(texts), seconds),
+    }
+
+
+def bench_collection(
+    texts: list[str],
+    vectors: np.ndarray,
+    *,
+    sizes: list[int],
+    queries: int,
+    top_k: int,
+    upsert_batch: int,
+    seed: int,
+) -> tuple[dict, dict]:
+    """Cresce a coleção até cada tamanho medindo upsert e, em seguida, as buscas."""
+    from src import rag
+    from src.chroma_setup import get_collection
+    from src.chunker import Chunk
+
+    rng = np.random.default_rng(seed)
+    qrng = random.Random(seed + 1)
+    questions = [_sentence(qrng) for _ in range(queries)]
+    collection = get_collection()
+    upserts: dict = {}
+    searches: dict = {}
+    current = 0
+    for size in sorted(sizes):
+        added = size - current
+        seconds = 0.0
+        for start in range(current, size, upsert_batch):
+            stop = min(start + upsert_batch, size)
+            rows = [i % len(texts) for i in range(start, stop)]
+            # Repete o corpus com ruído para ter vetores distintos em qualquer tamanho.
+            batch = vectors[rows] + rng.normal(0, 0.01, (len(rows), vectors.shape[1]))
+            batch = (batch / np.linalg.norm(batch, axis=1, keepdims=True)).astype(np.float32)
+            chunks = [
+                Chunk(id=f"bench-{i}", text=texts[r], source=f"bench-{r}", page=None, chunk_index=i)
+                for i, r in zip(range(start, stop), rows)
+            ]
+            _, took = _timed(lambda: rag._upsert_chunks(chunks, batch))
+            seconds += took
+        current = size
+        upserts[str(size)] = {
+            "rows": added,
+            "seconds": round(seconds, 4),
+            "rows_per_sec": _rate(added, seconds),
+        }
+
+        for question in questions[:5]:  # aquecimento
+            rag.search(question, top_k=top_k)
+        e2e = []
+        for question in questions:
+            _, took = _timed(lambda: rag.search(question, top_k=top_k))
+            e2e.append(took)
+        query_vectors = rag.get_engine().encode(questions, use_cache=False)
+        raw = []
+        for vector in query_vectors:
+            _, took = _timed(
+                lambda: collection.query(query_embeddings=[vector.tolist()], n_results=top_k)
+            )
+            raw.append(took)
+        searches[str(size)] = {"search": _latency(e2e), "chroma_query": _latency(raw)}
+    return upserts, searches
+
+
+IMPORT_MODULES = ("src.settings", "src.cli", "src.rag", "src.server")
+
+_IMPORT_PROBE = """
+import json, time
+started = time.perf_counter()
+import {module}
+print(json.dumps({{"ms": (time.perf_counter() - started) * 1000}}))
+"""
+
+_FIRST_QUERY_PROBE = """
+import json, sys, time
+sys.path.insert(0, {scripts!r})
+started = time.perf_counter()
+import benchmark
+from src import rag
+out = {{"import_ms": (time.perf_counter() - started) * 1000}}
+if not {real}:
+    benchmark.install_engine(benchmark.fake_engine_class()({dim}, batch_size={batch}))
+if {warm}:
+    step = time.perf_counter()
+    rag.warmup()
+    out["warmup_ms"] = (time.perf_counter() - step) * 1000
+for name, text in (("first", "primeira consulta de teste"), ("second", "segunda consulta")):
+    step = time.perf_counter()
+    rag.search(text, top_k={top_k})
+    out[name + "_search_ms"] = (time.perf_counter() - step) * 1000
+print(json.dumps(out))
+"""
+
+
+def _probe(code: str) -> dict:
+    """Roda `code` num interpretador novo (imports frios) e lê o JSON da última linha."""
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True,
+        timeout=900,
+    )
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        error = proc.stderr.strip().splitlines()
+        return {"error": error[-1] if error else f"código {proc.returncode}"}
+    return json.loads(lines[-1])
+
+
+def _median(runs: list[dict]) -> dict:
+    ok = [r for r in runs if "error" not in r]
+    if not ok:
+        return runs[0]
+    return {key: round(statistics.median(r[key] for r in ok), 3) for key in ok[0]}
+
+
+def bench_startup(args: argparse.Namespace) -> dict:
+    """Import frio de cada módulo e primeira busca em processo novo (com/sem warmup)."""
+    imports = {}
+    for module in IMPORT_MODULES:
+        runs = [_probe(_IMPORT_PROBE.format(module=module)) for _ in range(args.startup_repeats)]
+        result = _median(runs)
+        key = module.replace(".", "_") + "_ms"
+        imports[key] = result.get("ms", result)
+
+    first_request = {}
+    for label, warm in (("cold", False), ("warm", True)):
+        code = _FIRST_QUERY_PROBE.format(
+            scripts=str(Path(__file__).resolve().parent),
+            real=args.real_embeddings,
+            dim=args.dim,
+            batch=args.batch_size,
+            warm=warm,
+            top_k=args.top_k,
+        )
+        first_request[label] = _median([_probe(code) for _ in range(args.startup_repeats)])
+    return {"import": imports, "first_request": first_request}
+
+
+# -- comparação -------------------------------------------------------------
+
+
+def _flatten(data: dict, prefix: str = "") -> dict[str, float]:
+    flat: dict[str, float] = {}
+    for key, value in data.items():
+        name = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[dict]:
+    """Compara métricas de taxa (`*_per_sec`, maior é melhor) e latência (`*_ms`)."""
+    now = _flatten(current)
+    before = _flatten(baseline)
+    rows = []
+    for name in sorted(now.keys() & before.keys()):
+        if name.endswith("_per_sec"):
+            higher_is_better = True
+        elif name.endswith("_ms"):
+            higher_is_better = False
+        else:
+            continue
+        old, new = before[name], now[name]
+        if old == 0:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        status = "regressão" if worse > tolerance else "melhora" if worse < -tolerance else "ok"
+        rows.append(
+            {
+                "metric": name,
+                "baseline": old,
+                "current": new,
+                "change_pct": round(change * 100, 2),
+                "status": status,
+            }
+        )
+    return rows
+
+
+def _print_comparison(rows: list[dict]) -> None:
+    width = max((len(r["metric"]) for r in rows), default=10)
+    for row in rows:
+        print(
+            f"{row['metric']:<{width}}  {row['baseline']:>12.3f} -> {row['current']:>12.3f}"
+            f"  {row['change_pct']:>+8.2f}%  {row['status']}"
+        )
+
+
+# -- main -------------------------------------------------------------------
+
+
+def _configure_env(workdir: Path, args: argparse.Namespace) -> None:
+    """Aponta settings para a pasta temporária (precisa vir antes de importar `src`)."""
+    os.environ.update(
+        {
+            "ADK_CHROMA_PATH": str(workdir / "chroma"),
+            "ADK_CHROMA_HOST": "",
+            "ADK_COLLECTION_NAME": "benchmark",
+            "ADK_MANIFEST_PATH": str(workdir / "manifest.json"),
+            "ADK_EMBEDDING_CACHE_SIZE": "0",
+            "ADK_QUERY_CACHE_SIZE": "0",
+            "ADK_EMBEDDING_BATCH_SIZE": str(args.batch_size),
+        }
+    )
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+
+def run(args: argparse.Namespace, workdir: Path) -> dict:
+    _configure_env(workdir, args)
+    from src.chunker import resolve_chunking
+    from src.embedding import get_engine
+
+    paths = build_corpus(
+        workdir / "raw",
+        txt_files=args.txt_files,
+        pdf_files=args.pdf_files,
+        pages=args.pages,
+        seed=args.seed,
+    )
+    if args.real_embeddings:
+        engine = get_engine()
+    else:
+        engine = fake_engine_class()(args.dim, batch_size=args.batch_size)
+        install_engine(engine)
+
+    mode, chunk_size, overlap = resolve_chunking(args.chunk_mode, args.chunk_size, args.overlap)
+    sections, load_stats = bench_load(paths)
+    texts, chunk_stats = bench_chunk(sections, mode=mode, chunk_size=chunk_size, overlap=overlap)
+    vectors, embed_stats = bench_embed(engine, texts)
+    upserts, searches = bench_collection(
+        texts,
+        vectors,
+        sizes=args.sizes,
+        queries=args.queries,
+        top_k=args.top_k,
+        upsert_batch=args.upsert_batch,
+        seed=args.seed,
+    )
+
+    startup = None if args.skip_startup else bench_startup(args)
+
+    import chromadb
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "chromadb": chromadb.__version__,
+            "embedding": engine.model_path,
+            "dimension": int(vectors.shape[1]),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        },
+        "results": {
+            "load_sections": load_stats,
+            "chunk_text": chunk_stats,
+            "embed": embed_stats,
+            "upsert": upserts,
+            "search": searches,
+            **({"startup": startup} if startup is not None else {}),
+        },
+    }
+
+
+def _sizes(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--out", type=Path, default=Path("bench_output.json"), help="JSON de saída.")
+    parser.add_argument("--baseline", type=Path, help="JSON de uma execução anterior para comparar.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Variação aceita (0.10 = 10%%).")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Sai com código 1 se houver regressão.")
+    parser.add_argument("--sizes", type=_sizes, default=[1000, 5000, 20000], help="Tamanhos da coleção, ex.: 1000,5000.")
+    parser.add_argument("--queries", type=int, default=200, help="Buscas medidas por tamanho.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--txt-files", type=int, default=20)
+    parser.add_argument("--pdf-files", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=10, help="Páginas por PDF (e ~4 parágrafos/página nos TXTs).")
+    parser.add_argument("--chunk-mode", choices=("chars", "tokens"), default="chars")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--overlap", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=64, help="Lote do encoder.")
+    parser.add_argument("--upsert-batch", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=384, help="Dimensão do embedding falso.")
+    parser.add_argument("--real-embeddings", action="store_true", help="Usa o modelo de settings.embedding_model_path.")
+    parser.add_argument("--startup-repeats", type=int, default=3, help="Processos por medição de startup (mediana).")
+    parser.add_argument("--skip-startup", action="store_true", help="Não mede import/primeira busca.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, help="Pasta de trabalho (padrão: temporária, apagada ao fim).")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    if args.workdir:
+        args.workdir.mkdir(parents=True, exist_ok=True)
+        report = run(args, args.workdir.resolve())
+    else:
+        with tempfile.TemporaryDirectory(prefix="rag-bench-") as tmp:
+            report = run(args, Path(tmp))
+
+    code = 0
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        rows = compare(report["results"], baseline.get("results", {}), args.tolerance)
+        report["comparison"] = {"baseline": str(args.baseline), "tolerance": args.tolerance, "metrics": rows}
+        _print_comparison(rows)
+        if args.fail_on_regression and any(r["status"] == "regressão" for r in rows):
+            code = 1
+
+    args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(json.dumps(report["results"], indent=2, ensure_ascii=False))
+    print(f"Resultados gravados em {args.out}")
+    return code
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,15 +1,27 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import contextvars
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import AsyncGenerator, Optional
 
 from google.adk import Agent, Runner
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.apps.app import App
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.adk.events import Event
+from google.adk.sessions import Session
+from google.adk.sessions.base_session_service import BaseSessionService
 from google.genai import types
 
-from .rag import search
+from .answer_cache import CachedAnswer, answer_cache, prompt_scope
+from .chroma_setup import index_generation
+from .compaction import compact_hits
+from .metrics import CONTEXT_TOKENS, QUERIES, QUERY_STAGE_SECONDS
+from .rag import embed_query_async, search_async
+from .sessions import build_session_service
 from .settings import settings
 from dotenv import load_dotenv
 
@@ -22,7 +34,10 @@ def _format_hit(hit: dict) -> str:
     citation_parts = []
     if src := hit.get("source"):
         citation_parts.append(Path(src).name)
-    if chunk := hit.get("chunk"):
+    chunks = hit.get("chunks") or []
+    if len(chunks) > 1:
+        citation_parts.append(f"chunk{chunks[0]}-{chunks[-1]}")
+    elif chunk := hit.get("chunk"):
         citation_parts.append(f"chunk{chunk}")
     if page := hit.get("page"):
         citation_parts.append(f"p{page}")
@@ -31,53 +46,382 @@ def _format_hit(hit: dict) -> str:
     return f"{text} [fonte: {citation}]"
 
 
-def local_rag(query: str, top_k: int = settings.top_k) -> dict:
+# Relatórios de compactação da requisição corrente (o tool roda dentro do run_async).
+_context_reports: contextvars.ContextVar[list[dict] | None] = contextvars.ContextVar(
+    "context_reports", default=None
+)
+
+
+def _prepare_context(hits: list[dict]) -> tuple[list[str], dict]:
+    """Formata os hits para o prompt, compactando-os se `context_compaction`."""
+    if not settings.context_compaction:
+        return [_format_hit(h) for h in hits], {}
+    compaction = compact_hits(hits, format_hit=_format_hit)
+    report = compaction.report()
+    CONTEXT_TOKENS.labels("before").inc(compaction.tokens_before)
+    CONTEXT_TOKENS.labels("after").inc(compaction.tokens_after)
+    if (reports := _context_reports.get()) is not None:
+        reports.append(report)
+    return [_format_hit(h) for h in compaction.hits], report
+
+
+def _sum_reports(reports: list[dict]) -> dict:
+    total: dict = {}
+    for report in reports:
+        for key, value in report.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+async def local_rag(query: str, top_k: int = settings.top_k) -> dict:
     """Busca vetorial local no ChromaDB usando embeddings SentenceTransformers.
 
     Retorna até `top_k` trechos relevantes com rótulos de fonte para citação.
     """
-    hits = search(query, top_k=top_k)
-    return {"hits": [_format_hit(h) for h in hits]}
+    hits = await search_async(query, top_k=top_k)
+    lines, _ = _prepare_context(hits)
+    return {"hits": lines}
 
 
-def build_runner() -> Runner:
-    """Monta Agent + Runner com memória em RAM (suficiente para VPN interna)."""
-    agent = Agent(
-        name="local_rag_agent",
-        instruction=settings.system_prompt,
-        model=settings.openai_model,
-        tools=[local_rag],
-    )
-    app = App(name="local_rag_app", root_agent=agent)
+APP_NAME = "local_rag_app"
+
+# Chave de estado com os trechos pré-recuperados no modo direto.
+CONTEXT_STATE_KEY = "rag_context"
+
+
+@dataclass
+class Answer:
+    text: str
+    mode: str  # "agent" (tool local_rag) ou "direct" (contexto pré-recuperado)
+    timings: dict[str, float] = field(default_factory=dict)  # em ms
+    context: dict = field(default_factory=dict)  # tokens economizados na compactação
+    citations: list[str] = field(default_factory=list)
+    cached: bool = False  # servida do cache semântico (sem chamar o LLM)
+
+
+def build_runner(
+    *,
+    direct: bool = False,
+    session_service: Optional[BaseSessionService] = None,
+) -> Runner:
+    """Monta Agent + Runner com sessões em RAM limitadas (ver `sessions.py`).
+
+    `direct=True` cria um agente sem tools que recebe os trechos já buscados
+    no estado da sessão: uma única chamada ao LLM por pergunta. Passe o mesmo
+    `session_service` aos dois runners para que compartilhem o histórico.
+    """
+    if direct:
+        agent = Agent(
+            name="local_rag_direct_agent",
+            instruction=(
+                f"{settings.direct_system_prompt}\n\n"
+                f"Trechos recuperados:\n{{{CONTEXT_STATE_KEY}?}}"
+            ),
+            model=settings.openai_model,
+        )
+    else:
+        agent = Agent(
+            name="local_rag_agent",
+            instruction=settings.system_prompt,
+            model=settings.openai_model,
+            tools=[local_rag],
+        )
+    app = App(name=APP_NAME, root_agent=agent)
     return Runner(
         app=app,
-        session_service=InMemorySessionService(),
+        session_service=session_service or build_session_service(),
         auto_create_session=True,
     )
 
 
-async def generate_answer(
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+# Chaves de `timings` com outro nome no histograma de etapas.
+_STAGE_LABELS = {"generation": "llm"}
+
+
+def _observe(timings: dict[str, float], mode: str) -> None:
+    QUERIES.labels(mode).inc()
+    for key, ms in timings.items():
+        QUERY_STAGE_SECONDS.labels(_STAGE_LABELS.get(key, key)).observe(ms / 1000)
+
+
+def _final_text(event) -> Optional[str]:
+    if event.is_final_response() and event.content and event.content.parts:
+        return "".join(
+            part.text or "" for part in event.content.parts if not part.thought
+        )
+    return None
+
+
+async def _ensure_session(runner: Runner, user_id: str, session_id: str) -> Session:
+    service = runner.session_service
+    session = await service.get_session(
+        app_name=runner.app_name, user_id=user_id, session_id=session_id
+    )
+    if session is None:
+        session = await service.create_session(
+            app_name=runner.app_name, user_id=user_id, session_id=session_id
+        )
+    return session
+
+
+async def _append_cached_turn(
+    runner: Runner, session: Session, message: types.Content, text: str
+) -> None:
+    """Registra pergunta e resposta do cache na sessão, como um turno normal."""
+    invocation_id = f"cache-{Event.new_id()}"
+    service = runner.session_service
+    await service.append_event(
+        session, Event(invocation_id=invocation_id, author="user", content=message)
+    )
+    await service.append_event(
+        session,
+        Event(
+            invocation_id=invocation_id,
+            author=runner.agent.name,
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+        ),
+    )
+
+
+def _cache_scope(agent: Agent, *, direct: bool, top_k: int | None) -> tuple:
+    """Escopo do cache de respostas: índice + prompt/modelo (+ top_k no modo direto).
+
+    No modo agente o `top_k` do pedido não chega ao tool `local_rag` (o modelo
+    escolhe o próprio), então não pode separar respostas no cache.
+    """
+    k = (top_k or settings.top_k) if direct else None
+    return index_generation(), prompt_scope(agent.instruction, agent.model, k)
+
+
+async def stream_query(
     query: str,
     *,
     user_id: str = "user",
     session_id: str | None = None,
     runner: Optional[Runner] = None,
-) -> str:
-    """Executa o agente e retorna somente a resposta final."""
-    runner = runner or build_runner()
+    direct: bool = False,
+    top_k: int | None = None,
+    partial: bool = True,
+    use_cache: bool = True,
+) -> AsyncGenerator[dict, None]:
+    """Executa o agente emitindo eventos à medida que acontecem.
+
+    Tipos: `retrieval` (trechos do modo direto), `tool_call`, `tool_result`,
+    `delta` (texto parcial, só com `partial=True`) e `final` (resposta,
+    citações, tempos por etapa e `context`, a economia de tokens da
+    compactação). No modo direto a busca roda antes (em paralelo com a carga
+    da sessão) e os trechos formatados entram no prompt de uma única geração;
+    `runner` deve ter sido criado com `build_runner(direct=True)`.
+
+    Com o cache semântico ativo (`answer_cache_size` > 0 e `use_cache`), a
+    primeira pergunta de uma sessão, se parecida com outra já respondida no
+    mesmo índice e prompt, recebe direto o `final` guardado (`cached: true`),
+    sem LLM; o turno é gravado na sessão. Perguntas com histórico dependem
+    da conversa e nunca usam nem alimentam o cache.
+
+    Fechar o gerador (ex.: cliente desconectou) fecha também o `run_async`,
+    cancelando a chamada ao LLM em andamento.
+    """
+    runner = runner or build_runner(direct=direct)
     session_id = session_id or user_id
     new_message = types.Content(role="user", parts=[types.Part(text=query)])
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+    reports: list[dict] = []
+    _context_reports.set(reports)
+    citations: list[str] = []
+    mode = "direct" if direct else "agent"
+
+    cache = answer_cache() if settings.answer_cache_size > 0 else None
+    vector: list[float] | None = None
+    scope = None
+    found = None
+    if cache is not None and not use_cache:
+        cache.bypasses += 1
+    elif cache is not None:
+        t0 = time.perf_counter()
+        session = await _ensure_session(runner, user_id, session_id)
+        if session.events:
+            cache.bypasses += 1  # continuação: a resposta depende do histórico
+        else:
+            vector = await embed_query_async(query)
+            scope = _cache_scope(runner.agent, direct=direct, top_k=top_k)
+            found = cache.lookup(vector, scope)
+        timings["answer_cache"] = _ms(t0)
+        if found is not None:
+            entry, similarity = found
+            await _append_cached_turn(runner, session, new_message, entry.text)
+            timings["total"] = _ms(started)
+            cache.record_saving(entry.elapsed_ms - timings["total"])
+            _observe(timings, mode)
+            yield {
+                "type": "final",
+                "text": entry.text,
+                "mode": mode,
+                "timings": timings,
+                "context": {},
+                "citations": entry.citations,
+                "cached": True,
+                "similarity": round(similarity, 4),
+                "cached_question": entry.question,
+            }
+            return
 
+    state_delta = None
+    if direct:
+        async def timed_search() -> list[dict]:
+            t0 = time.perf_counter()
+            hits = await search_async(query, top_k=top_k or settings.top_k)
+            timings["retrieval"] = _ms(t0)
+            return hits
+
+        async def timed_session() -> None:
+            t0 = time.perf_counter()
+            await _ensure_session(runner, user_id, session_id)
+            timings["session"] = _ms(t0)
+
+        hits, _ = await asyncio.gather(timed_search(), timed_session())
+        formatted, _ = _prepare_context(hits)
+        citations.extend(formatted)
+        context = "\n".join(f"- {line}" for line in formatted)
+        state_delta = {CONTEXT_STATE_KEY: context or "(nenhum trecho encontrado)"}
+        timings["prepare"] = _ms(started)
+        yield {"type": "retrieval", "hits": formatted}
+    else:
+        t0 = time.perf_counter()
+        await _ensure_session(runner, user_id, session_id)
+        timings["session"] = _ms(t0)
+
+    run_config = RunConfig(
+        streaming_mode=StreamingMode.SSE if partial else StreamingMode.NONE
+    )
     final_text: Optional[str] = None
-    async for event in runner.run_async(
-        user_id=user_id, session_id=session_id, new_message=new_message
+    tool_started: Optional[float] = None
+    tool_ms = 0.0
+    generation_started = time.perf_counter()
+    async with contextlib.aclosing(
+        runner.run_async(
+            user_id=user_id,
+            session_id=session_id,
+            new_message=new_message,
+            state_delta=state_delta,
+            run_config=run_config,
+        )
+    ) as events:
+        async for event in events:
+            if event.partial:
+                if event.content and event.content.parts:
+                    text = "".join(
+                        p.text or "" for p in event.content.parts if not p.thought
+                    )
+                    if text:
+                        yield {"type": "delta", "text": text}
+                continue
+
+            for call in event.get_function_calls():
+                tool_started = time.perf_counter()
+                yield {"type": "tool_call", "name": call.name, "args": call.args or {}}
+            for response in event.get_function_responses():
+                if tool_started is not None:
+                    tool_ms += (time.perf_counter() - tool_started) * 1000
+                    tool_started = None
+                result = response.response or {}
+                citations.extend(result.get("hits", []))
+                yield {
+                    "type": "tool_result",
+                    "name": response.name,
+                    "hits": result.get("hits", []),
+                }
+            if (text := _final_text(event)) is not None:
+                final_text = text
+
+    generation_ms = _ms(generation_started)
+    if direct:
+        timings["generation"] = generation_ms
+    else:
+        timings["retrieval"] = round(tool_ms, 2)
+        timings["llm"] = round(generation_ms - tool_ms, 2)
+    timings["total"] = _ms(started)
+    _observe(timings, mode)
+    if cache is not None and vector is not None and final_text:
+        cache.store(
+            vector,
+            scope,
+            CachedAnswer(
+                text=final_text,
+                citations=citations,
+                question=query,
+                elapsed_ms=timings["total"],
+            ),
+        )
+    yield {
+        "type": "final",
+        "text": final_text or "",
+        "mode": mode,
+        "timings": timings,
+        "context": _sum_reports(reports),
+        "citations": citations,
+        "cached": False,
+    }
+
+
+async def run_query(
+    query: str,
+    *,
+    user_id: str = "user",
+    session_id: str | None = None,
+    runner: Optional[Runner] = None,
+    direct: bool = False,
+    top_k: int | None = None,
+    use_cache: bool = True,
+) -> Answer:
+    """Executa o agente e retorna a resposta final com tempos por etapa."""
+    final: dict = {}
+    async for item in stream_query(
+        query,
+        user_id=user_id,
+        session_id=session_id,
+        runner=runner,
+        direct=direct,
+        top_k=top_k,
+        partial=False,
+        use_cache=use_cache,
     ):
-        if event.is_final_response() and event.content and event.content.parts:
-            final_text = "".join(
-                part.text or "" for part in event.content.parts if not part.thought
-            )
+        if item["type"] == "final":
+            final = item
+    return Answer(
+        text=final.get("text", ""),
+        mode=final.get("mode", "direct" if direct else "agent"),
+        timings=final.get("timings", {}),
+        context=final.get("context", {}),
+        citations=final.get("citations", []),
+        cached=final.get("cached", False),
+    )
 
-    return final_text or ""
+
+async def generate_answer(
+    query: str,
+    *,
+    user_id: str = "user",
+    session_id: str | None = None,
+    runner: Optional[Runner] = None,
+    direct: bool = False,
+    top_k: int | None = None,
+) -> str:
+    """Executa o agente e retorna somente a resposta final."""
+    answer = await run_query(
+        query,
+        user_id=user_id,
+        session_id=session_id,
+        runner=runner,
+        direct=direct,
+        top_k=top_k,
+    )
+    return answer.text
 
 
 def generate_answer_sync(query: str, **kwargs) -> str:
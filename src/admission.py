@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+
+class Rejected(Exception):
+    """Pedido recusado na entrada: `status` HTTP (429/503) e `retry_after` em segundos."""
+
+    def __init__(self, status: int, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """Vaga concedida; `release` é idempotente (pode ser chamado em qualquer saída)."""
+
+    def __init__(self, controller: "AdmissionController", user_id: str, waited: float) -> None:
+        self._controller = controller
+        self.user_id = user_id
+        self.waited = waited
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+
+class AdmissionController:
+    """Limita as perguntas em execução e enfileira o excedente com justiça por usuário.
+
+    Até `limit` pedidos rodam ao mesmo tempo; os demais esperam numa fila por
+    `user_id`, atendida em rodízio (um pedido de cada usuário por vez), para
+    que um cliente com muitas perguntas não atrase os outros. Fila cheia dá
+    503, usuário com `per_user` pedidos já esperando dá 429, e espera acima
+    de `timeout` dá 503 — sempre com `Retry-After` estimado pelo tempo médio
+    de atendimento. Só usado no event loop (sem locks).
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        *,
+        queue_size: int = 32,
+        per_user: int = 4,
+        timeout: float = 30.0,
+    ) -> None:
+        self.limit = limit  # <= 0: sem limite
+        self.queue_size = max(0, queue_size)
+        self.per_user = per_user  # <= 0: sem limite por usuário
+        self.timeout = timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected: dict[str, int] = {"queue_full": 0, "user_quota": 0, "timeout": 0}
+        self._queues: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        self._waiting = 0
+        self._service_time = 1.0  # média móvel (s) de um atendimento
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def retry_after(self) -> int:
+        """Segundos estimados até a fila atual andar."""
+        slots = self.limit if self.limit > 0 else 1
+        return max(1, math.ceil(self._service_time * (self._waiting + 1) / slots))
+
+    def _reject(self, status: int, reason: str) -> Rejected:
+        self.rejected[reason] += 1
+        return Rejected(status, reason, self.retry_after())
+
+    async def acquire(self, user_id: str) -> Ticket:
+        started = time.monotonic()
+        if self.limit <= 0 or (self.active < self.limit and not self._waiting):
+            self.active += 1
+            self.admitted += 1
+            return Ticket(self, user_id, 0.0)
+        queue = self._queues.get(user_id)
+        if self.per_user > 0 and queue is not None and len(queue) >= self.per_user:
+            raise self._reject(429, "user_quota")
+        if self._waiting >= self.queue_size:
+            raise self._reject(503, "queue_full")
+
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+        queue.append(fut)
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.timeout if self.timeout > 0 else None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if fut.done() and not fut.cancelled():
+                # A vaga chegou junto com o timeout/cancelamento: devolve.
+                self.active -= 1
+                self._dispatch()
+            else:
+                fut.cancel()
+                self._discard(user_id, fut)
+            if isinstance(exc, asyncio.TimeoutError):
+                raise self._reject(503, "timeout") from None
+            raise
+        self.admitted += 1
+        return Ticket(self, user_id, time.monotonic() - started)
+
+    def _discard(self, user_id: str, fut: asyncio.Future) -> None:
+        queue = self._queues.get(user_id)
+        if queue is not None and fut in queue:
+            queue.remove(fut)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[user_id]
+
+    def _release(self, ticket: Ticket) -> None:
+        elapsed = time.monotonic() - ticket.started
+        self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Entrega vagas livres em rodízio: o 1º da fila do próximo usuário."""
+        while self._queues and (self.limit <= 0 or self.active < self.limit):
+            user_id, queue = next(iter(self._queues.items()))
+            fut = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if fut.done():
+                continue
+            self.active += 1
+            fut.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self._waiting,
+            "waiting_users": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "service_time_s": round(self._service_time, 3),
+        }
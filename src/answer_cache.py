@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Hashable, Sequence
+
+import numpy as np
+
+from .settings import settings
+
+
+@dataclass
+class CachedAnswer:
+    text: str
+    citations: list[str]
+    question: str
+    elapsed_ms: float  # custo original da resposta (para estimar a economia)
+    scope: Hashable = None
+    vector: np.ndarray = field(default=None, repr=False)  # type: ignore[assignment]
+    expires: float = float("inf")
+
+
+def prompt_scope(*parts: object) -> str:
+    """Resumo curto de prompt/modelo/parâmetros que definem a resposta."""
+    raw = "\x1f".join(str(p) for p in parts).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+class SemanticAnswerCache:
+    """Respostas prontas para perguntas iguais ou parecidas (cosseno >= `threshold`).
+
+    Cada resposta fica num escopo (geração do índice + prompt/modelo); só
+    perguntas do mesmo escopo a reutilizam, então uma reindexação ou troca de
+    prompt invalida tudo. LRU limitado por `maxsize`, com TTL (ttl <= 0 desativa).
+    """
+
+    def __init__(self, maxsize: int, ttl: float = 0.0, threshold: float = 0.95) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.saved_ms = 0.0
+        self._ids = itertools.count()
+        self._data: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self._matrix: dict[Hashable, tuple[list[int], np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _scope_matrix(self, scope: Hashable) -> tuple[list[int], np.ndarray] | None:
+        cached = self._matrix.get(scope)
+        if cached is None:
+            ids = [k for k, entry in self._data.items() if entry.scope == scope]
+            if not ids:
+                return None
+            cached = ids, np.stack([self._data[k].vector for k in ids])
+            self._matrix[scope] = cached
+        return cached
+
+    def lookup(self, vector: Sequence[float], scope: Hashable) -> tuple[CachedAnswer, float] | None:
+        """Resposta mais parecida do escopo e sua similaridade, se passar do limiar."""
+        query = self._unit(vector)
+        with self._lock:
+            found = self._scope_matrix(scope)
+            if found is not None:
+                ids, matrix = found
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                entry = self._data.get(ids[best])
+                similarity = float(scores[best])
+                if entry is not None and similarity >= self.threshold:
+                    if entry.expires >= time.monotonic():
+                        self._data.move_to_end(ids[best])
+                        self.hits += 1
+                        return entry, similarity
+                    self._remove(ids[best])
+            self.misses += 1
+            return None
+
+    def store(self, vector: Sequence[float], scope: Hashable, answer: CachedAnswer) -> None:
+        if self.maxsize <= 0:
+            return
+        answer.scope = scope
+        answer.vector = self._unit(vector)
+        answer.expires = time.monotonic() + self.ttl if self.ttl > 0 else float("inf")
+        with self._lock:
+            self._data[next(self._ids)] = answer
+            self._matrix.pop(scope, None)
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+
+    def record_saving(self, ms: float) -> None:
+        self.saved_ms += max(0.0, ms)
+
+    def _remove(self, key: int) -> None:
+        entry = self._data.pop(key)
+        self._matrix.pop(entry.scope, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._matrix.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_ms": round(self.saved_ms, 2),
+        }
+
+
+@lru_cache
+def answer_cache() -> SemanticAnswerCache:
+    return SemanticAnswerCache(
+        settings.answer_cache_size,
+        settings.answer_cache_ttl,
+        settings.answer_cache_threshold,
+    )
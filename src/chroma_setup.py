@@ -1,18 +1,100 @@
+import asyncio
+import contextlib
+import threading
+import weakref
 from functools import lru_cache
 from pathlib import Path
+from typing import Any, Iterator
 
 import chromadb
-from chromadb.utils import embedding_functions
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings, Space
+from chromadb.utils.embedding_functions.schemas import validate_config_schema
 
+from .embedding import EmbeddingEngine, get_engine
+from .file_lock import file_lock
+from .manifest import manifest_file
 from .settings import settings
+from .vector_store import BACKENDS, VectorStore, numpy_store
+
+
+class EngineEmbeddingFunction(EmbeddingFunction[Documents]):
+    """EmbeddingFunction do Chroma que delega ao `EmbeddingEngine` compartilhado.
+
+    Declara o mesmo nome e config da SentenceTransformerEmbeddingFunction
+    ("sentence_transformer"), que ficam persistidos na coleção: coleções
+    antigas continuam abrindo, sem carregar um segundo modelo.
+    """
+
+    def __init__(self, engine: EmbeddingEngine) -> None:
+        self._engine = engine
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return list(np.asarray(self._engine.encode(list(input)), dtype=np.float32))
+
+    @staticmethod
+    def name() -> str:
+        return "sentence_transformer"
+
+    def default_space(self) -> Space:
+        return "cosine"
+
+    def supported_spaces(self) -> list[Space]:
+        return ["cosine", "l2", "ip"]
+
+    def get_config(self) -> dict[str, Any]:
+        return {
+            "model_name": self._engine.model_path,
+            "device": self._engine.device,
+            "normalize_embeddings": self._engine.normalize,
+            "kwargs": {},
+        }
+
+    @staticmethod
+    def build_from_config(config: dict[str, Any]) -> "EngineEmbeddingFunction":
+        # O encoder vem do settings; o config salvo só identifica o modelo.
+        return EngineEmbeddingFunction(get_engine())
+
+    def validate_config_update(
+        self, old_config: dict[str, Any], new_config: dict[str, Any]
+    ) -> None:
+        return  # o caminho do modelo pode mudar (ex.: pasta movida)
+
+    @staticmethod
+    def validate_config(config: dict[str, Any]) -> None:
+        validate_config_schema(config, "sentence_transformer")
+
+
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def index_generation() -> tuple[int, int]:
+    """Versão do índice para chavear caches: contador local + mtime do manifesto.
+
+    O contador muda a cada escrita deste processo; o manifesto é salvo ao fim
+    de toda ingestão/importação, então seu mtime também cobre as feitas por
+    outro processo (CLI, outro worker da API).
+    """
+    try:
+        shared = manifest_file().stat().st_mtime_ns
+    except OSError:
+        shared = 0
+    return _generation, shared
+
+
+def bump_generation() -> int:
+    """Invalida caches de busca (chamado em upsert/delete/reset)."""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        return _generation
 
 
 @lru_cache
-def _embedding_function() -> embedding_functions.SentenceTransformerEmbeddingFunction:
+def _embedding_function() -> EngineEmbeddingFunction:
     """Carrega uma única instância do encoder local."""
-    return embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name=str(settings.embedding_model_path)
-    )
+    return EngineEmbeddingFunction(get_engine())
 
 
 @lru_cache
@@ -27,8 +109,44 @@ def _client():
     return chromadb.PersistentClient(path=str(settings.chroma_path))
 
 
-def get_collection():
-    """Retorna (ou cria) a coleção padrão com embedding local."""
+def is_remote() -> bool:
+    """True quando as consultas vão para um servidor Chroma (`chroma_host`)."""
+    return bool(settings.chroma_host) and settings.vector_backend == "chroma"
+
+
+def _numpy_backend() -> bool:
+    if settings.vector_backend not in BACKENDS:
+        raise ValueError(
+            f"vector_backend inválido: {settings.vector_backend} (use {'/'.join(BACKENDS)})"
+        )
+    return settings.vector_backend == "numpy"
+
+
+@lru_cache
+def max_batch_size() -> int:
+    """Maior lote aceito pelo Chroma numa escrita (-1 se o servidor não informar)."""
+    if _numpy_backend():
+        return -1
+    try:
+        return int(_client().get_max_batch_size())
+    except Exception:
+        return -1
+
+
+def get_collection() -> VectorStore:
+    """Retorna (ou cria) a coleção padrão com embedding local.
+
+    Com `vector_backend="numpy"` devolve o `NumpyVectorStore` do processo,
+    que responde à mesma API de coleção usada por `rag`.
+    """
+    if _numpy_backend():
+        return numpy_store(
+            settings.collection_name,
+            root=settings.vector_store_path,
+            dtype=settings.vector_store_dtype,
+            persist_delay=settings.vector_store_persist_delay,
+            embedding_function=_embedding_function(),
+        )
     return _client().get_or_create_collection(
         name=settings.collection_name,
         embedding_function=_embedding_function(),
@@ -36,13 +154,88 @@ def get_collection():
     )
 
 
+# Um AsyncHttpClient por event loop (o httpx assíncrono fica preso ao loop).
+_async_collections: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def get_collection_async(*, refresh: bool = False):
+    """Versão assíncrona de `get_collection` para Chroma remoto (`chroma_host`).
+
+    A coleção fica em cache por loop e é buscada de novo quando a geração do
+    índice muda (ex.: após `reset_collection`).
+    """
+    if not is_remote():
+        raise RuntimeError("get_collection_async requer settings.chroma_host (backend chroma)")
+
+    loop = asyncio.get_running_loop()
+    cached = _async_collections.get(loop)
+    if cached is not None and not refresh and cached[1] == _generation:
+        return cached[2]
+
+    client = cached[0] if cached is not None else None
+    if client is None:
+        client = await chromadb.AsyncHttpClient(host=settings.chroma_host)
+    collection = await client.get_or_create_collection(
+        name=settings.collection_name,
+        embedding_function=_embedding_function(),
+        metadata={"hnsw:space": "cosine"},
+    )
+    _async_collections[loop] = (client, _generation, collection)
+    return collection
+
+
+_write_depth = threading.local()
+
+
+@contextlib.contextmanager
+def collection_write_lock() -> Iterator[None]:
+    """Exclusão entre processos (API, CLI, watcher, workers) para escrever na coleção.
+
+    `flock` em `processed_dir`; reentrante na mesma thread, então funções de
+    ingestão podem chamar umas às outras sem travar.
+    """
+    depth = getattr(_write_depth, "value", 0)
+    if depth:
+        _write_depth.value = depth + 1
+        try:
+            yield
+        finally:
+            _write_depth.value = depth
+        return
+    with file_lock(settings.processed_dir / f".{settings.collection_name}.ingest.lock"):
+        _write_depth.value = 1
+        try:
+            yield
+        finally:
+            _write_depth.value = 0
+
+
+def flush_collection() -> None:
+    """Garante no disco o que foi escrito na coleção (antes de salvar o manifesto).
+
+    O Chroma grava cada escrita na hora; o backend numpy agrupa gravações
+    com atraso e precisa ser forçado, senão uma queda deixaria o manifesto
+    apontando para chunks que não existem.
+    """
+    if _numpy_backend():
+        get_collection().persist()  # type: ignore[attr-defined]
+
+
 def reset_collection() -> None:
     """Apaga a coleção, útil para reindexar do zero."""
+    if _numpy_backend():
+        get_collection().clear()  # type: ignore[attr-defined]
+        bump_generation()
+        return
     try:
         _client().delete_collection(settings.collection_name)
     except Exception:
         # Coleção pode não existir ainda.
         pass
+    finally:
+        bump_generation()
 
 
 def persist_directory() -> str:
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Sequence
+
+import httpx
+import numpy as np
+from chromadb.errors import ChromaError, NotFoundError
+
+from .chroma_setup import get_collection, is_remote, max_batch_size
+from .metrics import UPSERT_BYTES, UPSERT_RETRIES, UPSERT_ROWS
+from .settings import settings
+
+
+# Códigos que indicam sobrecarga/indisponibilidade momentânea do servidor.
+_TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def _is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, NotFoundError):
+        return True  # coleção recriada por outro processo: reabre e tenta de novo
+    if isinstance(exc, ChromaError):
+        return exc.code() in _TRANSIENT_CODES
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if type(exc) is not Exception:
+        return False
+    # Resposta sem corpo JSON (ex.: 502 do proxy/VPN): o cliente do Chroma
+    # levanta Exception(resp.text) dentro do `except HTTPStatusError`.
+    status = exc.__context__
+    if isinstance(status, httpx.HTTPStatusError):
+        return status.response.status_code in _TRANSIENT_CODES
+    return not str(exc).strip()
+
+
+@dataclass
+class WriteStats:
+    rows: int = 0
+    bytes: int = 0
+    batches: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    def add(self, other: "WriteStats") -> None:
+        self.rows += other.rows
+        self.bytes += other.bytes
+        self.batches += other.batches
+        self.retries += other.retries
+        self.seconds += other.seconds
+
+    def as_dict(self) -> dict:
+        rate = (lambda n: round(n / self.seconds, 1)) if self.seconds else (lambda n: None)
+        return {
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "batches": self.batches,
+            "retries": self.retries,
+            "seconds": round(self.seconds, 3),
+            "rows_per_sec": rate(self.rows),
+            "bytes_per_sec": rate(self.bytes),
+        }
+
+
+def _payload_bytes(ids, documents, embeddings, metadatas) -> int:
+    """Tamanho aproximado do lote: textos/ids em UTF-8, vetores em float32, metadados em JSON."""
+    size = sum(len(i.encode("utf-8")) for i in ids)
+    if documents is not None:
+        size += sum(len(d.encode("utf-8")) for d in documents)
+    if embeddings is not None:
+        size += np.asarray(embeddings, dtype=np.float32).nbytes
+    if metadatas is not None:
+        size += sum(len(json.dumps(m, ensure_ascii=False)) for m in metadatas)
+    return size
+
+
+class ChromaWriter:
+    """Escritas na coleção em lotes do tamanho aceito pelo servidor.
+
+    Um upsert grande é dividido em lotes de até `batch_size` linhas (nunca
+    acima do `max_batch_size` anunciado pelo Chroma) e até `concurrency`
+    lotes seguem em paralelo pelo mesmo cliente HTTP, que reaproveita as
+    conexões keep-alive do pool. Falhas transitórias são repetidas com
+    backoff exponencial (upsert/delete são idempotentes).
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = 256,
+        concurrency: int = 1,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ) -> None:
+        limit = max_batch_size()
+        self.batch_size = max(1, min(batch_size, limit) if limit > 0 else batch_size)
+        self.concurrency = max(1, concurrency)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="chroma-write"
+        )
+        self._collection: Any = None
+        self._lock = threading.Lock()
+
+    def _get_collection(self, *, refresh: bool = False):
+        with self._lock:
+            if self._collection is None or refresh:
+                self._collection = get_collection()
+            return self._collection
+
+    def _call(self, op: Callable[[Any], None], stats: WriteStats) -> None:
+        refresh = False
+        for attempt in range(self.retries + 1):
+            try:
+                op(self._get_collection(refresh=refresh))
+                return
+            except Exception as exc:
+                if attempt == self.retries or not _is_transient(exc):
+                    raise
+                # Só reabre a coleção se ela sumiu (recriada por outro processo).
+                refresh = isinstance(exc, NotFoundError)
+                stats.retries += 1
+                UPSERT_RETRIES.inc()
+                time.sleep(self.backoff * 2**attempt * (0.5 + random.random()))
+
+    def _run(self, jobs: list[Callable[[WriteStats], None]]) -> WriteStats:
+        total = WriteStats()
+        started = time.perf_counter()
+        if len(jobs) == 1 or self.concurrency == 1:
+            for job in jobs:
+                job(total)
+        else:
+            parts = [WriteStats() for _ in jobs]
+            futures = [self._executor.submit(job, part) for job, part in zip(jobs, parts)]
+            for fut in futures:
+                fut.result()
+            for part in parts:
+                total.add(part)
+        total.seconds = time.perf_counter() - started
+        return total
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        *,
+        documents: Sequence[str] | None = None,
+        embeddings: np.ndarray | None = None,
+        metadatas: Sequence[dict] | None = None,
+    ) -> WriteStats:
+        """Grava as linhas em lotes paralelos; retorna linhas, bytes e tempo."""
+
+        def job(start: int, stop: int) -> Callable[[WriteStats], None]:
+            batch = {
+                "ids": list(ids[start:stop]),
+                "documents": list(documents[start:stop]) if documents is not None else None,
+                "embeddings": embeddings[start:stop] if embeddings is not None else None,
+                "metadatas": list(metadatas[start:stop]) if metadatas is not None else None,
+            }
+            size = _payload_bytes(**batch)
+
+            def run(stats: WriteStats) -> None:
+                self._call(lambda collection: collection.upsert(**batch), stats)
+                stats.rows += stop - start
+                stats.bytes += size
+                stats.batches += 1
+                UPSERT_ROWS.inc(stop - start)
+                UPSERT_BYTES.inc(size)
+
+            return run
+
+        return self._run(
+            [
+                job(start, min(start + self.batch_size, len(ids)))
+                for start in range(0, len(ids), self.batch_size)
+            ]
+        )
+
+    def delete(self, ids: Sequence[str]) -> WriteStats:
+        def job(chunk: list[str]) -> Callable[[WriteStats], None]:
+            def run(stats: WriteStats) -> None:
+                self._call(lambda collection: collection.delete(ids=chunk), stats)
+                stats.rows += len(chunk)
+                stats.batches += 1
+
+            return run
+
+        return self._run(
+            [
+                job(list(ids[start : start + self.batch_size]))
+                for start in range(0, len(ids), self.batch_size)
+            ]
+        )
+
+    def reset(self) -> None:
+        """Esquece a coleção aberta (após `reset_collection`)."""
+        with self._lock:
+            self._collection = None
+
+
+@lru_cache
+def chroma_writer() -> ChromaWriter:
+    """Writer único do processo; paralelismo só faz sentido no Chroma remoto."""
+    return ChromaWriter(
+        batch_size=settings.upsert_batch_size,
+        concurrency=settings.upsert_concurrency if is_remote() else 1,
+        retries=settings.upsert_retries,
+        backoff=settings.upsert_backoff,
+    )
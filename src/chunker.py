@@ -1,14 +1,24 @@
 from __future__ import annotations
 
 import hashlib
+import json
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List, Tuple
+from typing import Iterable, List, Optional, Tuple
 
 from pypdf import PdfReader
 
+from .settings import settings
+
 
 SUPPORTED_EXTENSIONS = {".pdf", ".txt"}
+CHUNK_MODES = ("chars", "tokens")
+# Menor chunk_size aceito em cada modo (trechos menores não dão contexto útil).
+MIN_CHUNK_SIZE = {"chars": 200, "tokens": 32}
+
+# (texto, página, índice local na página, tokens do modelo ou None)
+Piece = Tuple[str, Optional[int], int, Optional[int]]
 
 
 @dataclass
@@ -18,10 +28,17 @@ class Chunk:
     source: str
     page: int | None
     chunk_index: int
+    tokens: int | None = None  # tokens do modelo de embedding (None sem tokenizer)
+
 
+def load_sections(
+    file_path: Path, pages: Tuple[int, int] | None = None
+) -> List[Tuple[str, int | None]]:
+    """Lê PDF/TXT e retorna lista de pares (texto, página).
 
-def load_sections(file_path: Path) -> List[Tuple[str, int | None]]:
-    """Lê PDF/TXT e retorna lista de pares (texto, página)."""
+    `pages` limita a leitura de PDFs a um intervalo [início, fim) de índices
+    (base 0), usado para dividir PDFs grandes entre processos.
+    """
     suffix = file_path.suffix.lower()
     if suffix == ".txt":
         text = file_path.read_text(encoding="utf-8")
@@ -29,14 +46,19 @@ def load_sections(file_path: Path) -> List[Tuple[str, int | None]]:
 
     if suffix == ".pdf":
         reader = PdfReader(str(file_path))
+        start, stop = pages if pages is not None else (0, len(reader.pages))
         return [
-            (page.extract_text() or "", page_number)
-            for page_number, page in enumerate(reader.pages, start=1)
+            (reader.pages[idx].extract_text() or "", idx + 1)
+            for idx in range(start, min(stop, len(reader.pages)))
         ]
 
     raise ValueError(f"Extensão não suportada: {suffix}")
 
 
+def pdf_page_count(file_path: Path) -> int:
+    return len(PdfReader(str(file_path)).pages)
+
+
 def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
     """Quebra texto em blocos com sobreposição."""
     if chunk_size <= overlap:
@@ -51,22 +73,166 @@ def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
     return [c.strip() for c in chunks if c.strip()]
 
 
-def build_chunks(file_path: Path, *, chunk_size: int, overlap: int) -> Iterable[Chunk]:
-    """Gera chunks para um arquivo."""
-    base = _make_base_id(file_path)
-    section_index = 0
-    for section_text, page in load_sections(file_path):
+def chunk_text_tokens(
+    text: str, size: int, overlap: int, tokenizer=None
+) -> List[str]:
+    """Quebra texto por tokens do modelo de embedding, com sobreposição.
+
+    O texto é tokenizado uma única vez; os offsets dos tokens dão os cortes.
+    Cada bloco termina, se possível, num fim de parágrafo ou de frase da
+    segunda metade da janela, e a sobreposição começa num início de frase.
+    """
+    if size <= overlap:
+        raise ValueError("chunk_size deve ser maior que overlap.")
+
+    tokenizer = tokenizer or get_tokenizer()
+    offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+    total = len(offsets)
+    chunks: List[str] = []
+    start = 0
+    while start < total:
+        end = min(start + size, total)
+        if end < total:
+            end = _snap_end(text, offsets, start + size // 2, end)
+        chunks.append(text[offsets[start][0] : offsets[end - 1][1]])
+        if end >= total:
+            break
+        start = max(_snap_start(text, offsets, end - overlap, end), start + 1)
+    return [c.strip() for c in chunks if c.strip()]
+
+
+def split_sections(
+    sections: Iterable[Tuple[str, int | None]],
+    *,
+    chunk_size: int,
+    overlap: int,
+    mode: str = "chars",
+) -> List[Piece]:
+    """Quebra seções em trechos (texto, página, índice local, tokens).
+
+    No modo "tokens", `chunk_size`/`overlap` são contados em tokens do modelo
+    e cada trecho leva sua contagem de tokens; no modo "chars", em caracteres,
+    e a contagem (um passe extra do tokenizer, só para medir truncamento) fica
+    atrás de `settings.chunk_report_truncation`.
+    """
+    if mode == "tokens":
+        tokenizer = get_tokenizer()
+    else:
+        tokenizer = _optional_tokenizer() if settings.chunk_report_truncation else None
+    pieces: List[Piece] = []
+    for section_text, page in sections:
         section_text = _sanitize(section_text)
-        for local_idx, text in enumerate(chunk_text(section_text, chunk_size, overlap)):
-            chunk_id = f"{base}-{section_index}"
-            section_index += 1
-            yield Chunk(
-                id=chunk_id,
-                text=text,
-                source=str(file_path),
-                page=page,
-                chunk_index=local_idx,
-            )
+        if mode == "tokens":
+            texts = chunk_text_tokens(section_text, chunk_size, overlap, tokenizer)
+        else:
+            texts = chunk_text(section_text, chunk_size, overlap)
+        counts = count_tokens(texts, tokenizer) if tokenizer else [None] * len(texts)
+        for local_idx, (text, tokens) in enumerate(zip(texts, counts)):
+            pieces.append((text, page, local_idx, tokens))
+    return pieces
+
+
+def make_chunks(file_path: Path, pieces: Iterable[Piece]) -> List[Chunk]:
+    """Atribui ids sequenciais (por arquivo) aos trechos, na ordem recebida."""
+    base = _make_base_id(file_path)
+    return [
+        Chunk(
+            id=chunk_id(file_path, section_index, base=base),
+            text=text,
+            source=str(file_path),
+            page=page,
+            chunk_index=local_idx,
+            tokens=tokens,
+        )
+        for section_index, (text, page, local_idx, tokens) in enumerate(pieces)
+    ]
+
+
+def build_chunks(
+    file_path: Path, *, chunk_size: int, overlap: int, mode: str = "chars"
+) -> Iterable[Chunk]:
+    """Gera chunks para um arquivo."""
+    pieces = split_sections(
+        load_sections(file_path), chunk_size=chunk_size, overlap=overlap, mode=mode
+    )
+    return make_chunks(file_path, pieces)
+
+
+def resolve_chunking(
+    mode: str | None = None,
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+) -> Tuple[str, int, int]:
+    """Completa (modo, tamanho, overlap) com os padrões do modo escolhido.
+
+    Recusa tamanho abaixo de `MIN_CHUNK_SIZE` do modo e overlap negativo. No
+    modo "tokens" o tamanho nunca passa do que o modelo embeda; nos dois
+    modos o overlap é reduzido para continuar menor que o tamanho (o padrão,
+    a no máximo 1/4 dele).
+    """
+    mode = mode or settings.chunk_mode
+    if mode not in CHUNK_MODES:
+        raise ValueError(f"Modo de chunking inválido: {mode} (use {'/'.join(CHUNK_MODES)})")
+    if chunk_size is not None and chunk_size < MIN_CHUNK_SIZE[mode]:
+        raise ValueError(
+            f"chunk_size {chunk_size} abaixo do mínimo do modo {mode} ({MIN_CHUNK_SIZE[mode]})"
+        )
+    if overlap is not None and overlap < 0:
+        raise ValueError("overlap não pode ser negativo.")
+    if mode == "tokens":
+        limit = max_tokens()
+        size = min(chunk_size or settings.chunk_tokens or limit, limit)
+        default_overlap = settings.chunk_overlap_tokens
+    else:
+        size = chunk_size or settings.chunk_size
+        default_overlap = settings.chunk_overlap
+    if overlap is None:
+        overlap = min(default_overlap, size // 4)
+    else:
+        overlap = min(overlap, size - 1)
+    return mode, size, overlap
+
+
+@lru_cache
+def get_tokenizer(model_path: str | None = None):
+    """Tokenizer rápido (`tokenizers`) do modelo de embedding; um por processo."""
+    from tokenizers import Tokenizer
+
+    path = Path(model_path or settings.embedding_model_path) / "tokenizer.json"
+    tokenizer = Tokenizer.from_file(str(path))
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
+
+@lru_cache
+def max_tokens(model_path: str | None = None) -> int:
+    """Tokens de conteúdo que o modelo embeda (max_seq_length sem [CLS]/[SEP])."""
+    path = Path(model_path or settings.embedding_model_path)
+    limit = 512
+    for name, key in (
+        ("sentence_bert_config.json", "max_seq_length"),
+        ("tokenizer_config.json", "model_max_length"),
+    ):
+        config = path / name
+        if config.exists():
+            value = json.loads(config.read_text(encoding="utf-8")).get(key)
+            if isinstance(value, int) and value > 0:
+                limit = min(value, limit)
+                break
+    return limit - get_tokenizer(model_path).num_special_tokens_to_add(False)
+
+
+def count_tokens(texts: List[str], tokenizer=None) -> List[int]:
+    tokenizer = tokenizer or get_tokenizer()
+    return [
+        len(enc.ids) for enc in tokenizer.encode_batch(texts, add_special_tokens=False)
+    ]
+
+
+def chunk_id(file_path: Path, index: int, *, base: str | None = None) -> str:
+    """Id do `index`-ésimo chunk de um arquivo (estável entre execuções)."""
+    return f"{base or _make_base_id(file_path)}-{index}"
 
 
 def is_supported_file(path: Path) -> bool:
@@ -78,6 +244,39 @@ def _make_base_id(path: Path) -> str:
     return f"{path.stem}-{digest}"
 
 
+def _optional_tokenizer():
+    """Tokenizer para contagem no modo "chars"; None se o modelo não tiver um."""
+    try:
+        return get_tokenizer()
+    except Exception:  # sem `tokenizers` instalado ou sem tokenizer.json
+        return None
+
+
+_PARAGRAPH = "\n\n"
+_SENTENCE_END = ".!?…"
+
+
+def _snap_end(text: str, offsets, low: int, end: int) -> int:
+    """Fim exclusivo do bloco: último parágrafo, senão última frase, em [low, end]."""
+    sentence = 0
+    for idx in range(end, max(low, 1) - 1, -1):
+        gap = text[offsets[idx - 1][1] : offsets[idx][0]]
+        if _PARAGRAPH in gap:
+            return idx
+        if not sentence and gap and text[offsets[idx - 1][1] - 1] in _SENTENCE_END:
+            sentence = idx
+    return sentence or end
+
+
+def _snap_start(text: str, offsets, low: int, end: int) -> int:
+    """Início da sobreposição: primeira frase que começa em [low, end)."""
+    for idx in range(max(low, 1), end):
+        gap = text[offsets[idx - 1][1] : offsets[idx][0]]
+        if gap and text[offsets[idx - 1][1] - 1] in _SENTENCE_END:
+            return idx
+    return max(low, 0)
+
+
 def _sanitize(text: str) -> str:
     """Remove caracteres inválidos/surrogates para o tokenizer HF."""
     return (
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
 import asyncio
+import json
+import random
 from pathlib import Path
+from typing import Optional
 
 import typer
 
-from .rag import ingest_directory, search
 from .settings import settings
-from .watcher import watch_folder
+
+# Imports pesados (chromadb, numpy, pypdf, modelos) ficam dentro de cada
+# comando: `--help` e comandos que não usam o Chroma sobem sem pagá-los.
 
 
 app = typer.Typer(help="Pipeline local de ingestão e teste de busca.")
@@ -16,23 +20,61 @@ app = typer.Typer(help="Pipeline local de ingestão e teste de busca.")
 @app.command()
 def ingest(
     source_dir: Path = typer.Option(settings.data_dir, help="Pasta com PDFs/TXTs"),
-    chunk_size: int = typer.Option(settings.chunk_size, min=200, max=2000),
-    overlap: int = typer.Option(settings.chunk_overlap, min=0, max=1000),
+    chunk_size: Optional[int] = typer.Option(
+        None,
+        max=2000,
+        help=f"Tamanho do chunk em caracteres (mín. 200) ou tokens (mín. 32); padrão: "
+        f"{settings.chunk_size} chars / max_seq_length do modelo.",
+    ),
+    overlap: Optional[int] = typer.Option(None, min=0, max=1000),
+    mode: str = typer.Option(
+        settings.chunk_mode,
+        help='"chars" ou "tokens" (usa o tokenizer do modelo de embedding).',
+    ),
     reset: bool = typer.Option(
         False, "--reset", help="Apaga a coleção antes de reindexar."
     ),
+    workers: int = typer.Option(
+        settings.ingest_workers,
+        help="Processos para extração/chunking (0 = núcleos - 1, 1 = sequencial).",
+    ),
 ) -> None:
+    from .chunker import resolve_chunking
+    from .rag import ingest_directory
+
+    try:
+        mode, chunk_size, overlap = resolve_chunking(mode, chunk_size, overlap)
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc)) from None
     result = ingest_directory(
-        source_dir=source_dir, chunk_size=chunk_size, overlap=overlap, reset=reset
+        source_dir=source_dir,
+        chunk_size=chunk_size,
+        overlap=overlap,
+        mode=mode,
+        reset=reset,
+        workers=workers,
     )
     typer.echo(f"Ingestão concluída: {result}")
 
 
 @app.command("search")
 def search_cli(
-    query: str = typer.Argument(..., help="Pergunta para teste manual."),
+    query: Optional[str] = typer.Argument(None, help="Pergunta para teste manual."),
     top_k: int = typer.Option(settings.top_k, help="Número de trechos a retornar."),
+    file: Optional[Path] = typer.Option(
+        None,
+        "--file",
+        help="Arquivo com uma pergunta por linha; imprime um JSON por linha.",
+    ),
 ) -> None:
+    if file is not None:
+        _search_file(file, top_k=top_k)
+        return
+    if query is None:
+        raise typer.BadParameter("Informe a pergunta ou --file.")
+
+    from .rag import search
+
     matches = search(query, top_k=top_k)
     if not matches:
         typer.echo("Nenhum resultado encontrado.")
@@ -48,14 +90,159 @@ def search_cli(
         )
 
 
+def _search_file(file: Path, *, top_k: int) -> None:
+    """Modo em lote: lê perguntas em blocos e escreve JSONL conforme responde."""
+    from .rag import search_many
+
+    batch: list[str] = []
+
+    def flush() -> None:
+        for question, matches in zip(batch, search_many(batch, top_k=top_k)):
+            typer.echo(
+                json.dumps({"question": question, "matches": matches}, ensure_ascii=False)
+            )
+        batch.clear()
+
+    with file.open(encoding="utf-8") as fh:
+        for line in fh:
+            if question := line.strip():
+                batch.append(question)
+            if len(batch) >= settings.search_batch_size:
+                flush()
+    flush()
+
+
+@app.command("embed-parity")
+def embed_parity(
+    backend: str = typer.Option(
+        settings.embedding_backend,
+        help="Backend a comparar com o torch (onnx, onnx-int8, openvino).",
+    ),
+    quantization: str = typer.Option(
+        settings.embedding_quantization, help="onnx-int8: arm64, avx2, avx512 ou avx512_vnni."
+    ),
+    source_dir: Path = typer.Option(settings.data_dir, help="Pasta de onde amostrar chunks."),
+    sample: int = typer.Option(256, help="Chunks na amostra."),
+    queries: int = typer.Option(64, help="Consultas (primeira frase de chunks sorteados)."),
+    k: int = typer.Option(10, help="Top-k para o recall."),
+    threads: int = typer.Option(settings.embedding_threads, help="Threads intra-op (0 = padrão)."),
+) -> None:
+    """Mede concordância (cosseno, recall@k) e velocidade de um backend vs. torch."""
+    if backend == "torch":
+        raise typer.BadParameter("Escolha um backend diferente de torch para comparar.")
+    documents, questions = _parity_sample(source_dir, sample=sample, queries=queries)
+    if not documents:
+        typer.echo(f"Nenhum chunk encontrado em {source_dir}.")
+        raise typer.Exit(code=1)
+
+    from .embedding import EmbeddingEngine, parity_report
+
+    model_path = str(settings.embedding_model_path)
+    common = {"batch_size": settings.embedding_batch_size, "threads": threads}
+    report = parity_report(
+        EmbeddingEngine(model_path, backend="torch", **common),
+        EmbeddingEngine(model_path, backend=backend, quantization=quantization, **common),
+        documents,
+        questions,
+        k=k,
+    )
+    typer.echo(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+def _parity_sample(
+    folder: Path, *, sample: int, queries: int
+) -> tuple[list[str], list[str]]:
+    """Amostra determinística de chunks da pasta e consultas derivadas deles."""
+    from .chunker import build_chunks, is_supported_file
+
+    texts: list[str] = []
+    files = sorted(p for p in folder.rglob("*") if p.is_file() and is_supported_file(p))
+    for path in files:
+        chunks = build_chunks(
+            path, chunk_size=settings.chunk_size, overlap=settings.chunk_overlap
+        )
+        texts.extend(c.text for c in chunks)
+    rng = random.Random(0)
+    documents = rng.sample(texts, min(sample, len(texts)))
+    questions = [
+        doc.split(". ")[0][:200]
+        for doc in rng.sample(documents, min(queries, len(documents)))
+    ]
+    return documents, questions
+
+
+@app.command("export")
+def export_cli(
+    out: Path = typer.Argument(..., help="Pasta do snapshot (não pode existir)."),
+    dtype: str = typer.Option("float16", help="float16 (metade do tamanho) ou float32."),
+    batch: int = typer.Option(5000, help="Linhas lidas da coleção por vez."),
+) -> None:
+    """Exporta a coleção (ids, textos, metadados e embeddings) para um snapshot."""
+    from .snapshot import export_snapshot
+
+    result = export_snapshot(
+        out, dtype=dtype, batch_size=batch, progress=_progress("Exportando")
+    )
+    typer.echo(f"\nSnapshot gravado: {result}")
+
+
+@app.command("import")
+def import_cli(
+    snapshot: Path = typer.Argument(..., help="Pasta gerada por `export`."),
+    reset: bool = typer.Option(False, "--reset", help="Apaga a coleção antes de importar."),
+    batch: int = typer.Option(20_000, help="Linhas lidas do snapshot por vez."),
+    force: bool = typer.Option(
+        False, "--force", help="Importa mesmo se o snapshot for de outro encoder."
+    ),
+) -> None:
+    """Carrega um snapshot na coleção atual sem reembedar (vale para Chroma remoto)."""
+    from .snapshot import SnapshotError, import_snapshot
+
+    try:
+        result = import_snapshot(
+            snapshot, reset=reset, batch_size=batch, force=force, progress=_progress("Importando")
+        )
+    except SnapshotError as exc:
+        typer.echo(str(exc))
+        raise typer.Exit(code=1)
+    typer.echo(f"\nImportação concluída: {result}")
+
+
+def _progress(label: str):
+    def report(done: int, total: int) -> None:
+        typer.echo(f"\r{label}: {done}/{total}", nl=False)
+
+    return report
+
+
+@app.command("embed-serve")
+def embed_serve(
+    socket_path: Path = typer.Option(
+        settings.embedding_service_socket or Path("data/processed/embedding.sock"),
+        "--socket",
+        help="Socket Unix onde o serviço atende (use o mesmo em ADK_EMBEDDING_SERVICE_SOCKET).",
+    ),
+) -> None:
+    """Carrega o modelo uma vez e serve encodes para os workers da API."""
+    from .embedding_service import serve
+
+    try:
+        asyncio.run(serve(socket_path))
+    except KeyboardInterrupt:
+        pass
+
+
 @app.command()
 def watch(
     folder: Path = typer.Option(settings.data_dir, help="Pasta a monitorar."),
-    chunk_size: int = typer.Option(settings.chunk_size),
-    overlap: int = typer.Option(settings.chunk_overlap),
+    chunk_size: Optional[int] = typer.Option(None),
+    overlap: Optional[int] = typer.Option(None),
+    mode: str = typer.Option(settings.chunk_mode, help='"chars" ou "tokens".'),
 ) -> None:
+    from .watcher import watch_folder
+
     asyncio.run(
-        watch_folder(folder=folder, chunk_size=chunk_size, overlap=overlap)
+        watch_folder(folder=folder, chunk_size=chunk_size, overlap=overlap, mode=mode)
     )
 
 
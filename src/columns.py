@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Iterable
+
+import numpy as np
+
+
+class TextColumnWriter:
+    """Coluna de texto: bytes UTF-8 concatenados (<nome>.bin) + offsets int64 (<nome>.offsets.npy)."""
+
+    def __init__(self, folder: Path, name: str) -> None:
+        self.name = name
+        self._folder = folder
+        self._fh = (folder / f"{name}.bin").open("wb")
+        self._offsets = [0]
+
+    def append(self, value: str) -> None:
+        data = value.encode("utf-8")
+        self._fh.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def extend(self, values: Iterable[str]) -> None:
+        for value in values:
+            self.append(value)
+
+    def close(self) -> None:
+        self._fh.close()
+        np.save(self._folder / f"{self.name}.offsets.npy", np.asarray(self._offsets, dtype=np.int64))
+
+
+def write_text_column(folder: Path, name: str, values: Iterable[str]) -> None:
+    writer = TextColumnWriter(folder, name)
+    try:
+        writer.extend(values)
+    finally:
+        writer.close()
+
+
+def text_column_reader(folder: Path, name: str) -> Callable[[int, int], list[str]]:
+    """Leitor em fatias [start, stop) de uma coluna de texto (offsets e bytes via mmap)."""
+    offsets = np.load(folder / f"{name}.offsets.npy", mmap_mode="r")
+    path = folder / f"{name}.bin"
+    blob = np.memmap(path, dtype=np.uint8, mode="r") if path.stat().st_size else np.empty(0, np.uint8)
+
+    def read(start: int, stop: int) -> list[str]:
+        bounds = offsets[start : stop + 1]
+        raw = bytes(blob[bounds[0] : bounds[-1]])
+        base = int(bounds[0])
+        return [
+            raw[int(a) - base : int(b) - base].decode("utf-8")
+            for a, b in zip(bounds[:-1], bounds[1:])
+        ]
+
+    return read
+
+
+def read_text_column(folder: Path, name: str) -> list[str]:
+    rows = len(np.load(folder / f"{name}.offsets.npy", mmap_mode="r")) - 1
+    return text_column_reader(folder, name)(0, rows) if rows > 0 else []
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Sequence
+
+from .settings import settings
+
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass
+class Compaction:
+    hits: list[dict]
+    tokens_before: int = 0
+    tokens_after: int = 0
+    merged: int = 0  # hits absorvidos por um vizinho do mesmo arquivo/página
+    dropped: int = 0  # trechos que não couberam no orçamento
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_before - self.tokens_after)
+
+    def report(self) -> dict:
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_saved,
+            "merged": self.merged,
+            "dropped": self.dropped,
+        }
+
+
+@lru_cache
+def token_counter() -> Callable[[str], int]:
+    """Conta tokens com o tokenizer do modelo de embedding; sem ele, ~4 caracteres/token."""
+    try:
+        from .chunker import get_tokenizer
+
+        tokenizer = get_tokenizer()
+    except Exception:  # sem `tokenizers` ou sem tokenizer.json
+        return lambda text: (len(text) + 3) // 4
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def _overlap(left: str, right: str, probe: int = 32) -> int:
+    """Tamanho do maior sufixo de `left` que é prefixo de `right`."""
+    head = right[: min(probe, len(right))]
+    if not head:
+        return 0
+    pos = left.find(head, max(0, len(left) - len(right)))
+    while pos != -1:
+        if right.startswith(left[pos:]):
+            return len(left) - pos
+        pos = left.find(head, pos + 1)
+    return 0
+
+
+def _join(left: str, right: str) -> str:
+    size = _overlap(left, right)
+    if size:
+        return left + right[size:]
+    return f"{left} {right}"
+
+
+def merge_adjacent(hits: Sequence[dict]) -> list[dict]:
+    """Junta hits de chunks consecutivos do mesmo arquivo/página, sem repetir a sobreposição.
+
+    Cada segmento guarda `chunks` (índices cobertos), a menor distância e a
+    melhor posição (`rank`) entre os hits que o formam.
+    """
+    groups: dict[tuple, list[tuple[int, dict]]] = {}
+    segments: list[dict] = []
+    for rank, hit in enumerate(hits):
+        if hit.get("chunk") is None or hit.get("source") is None:
+            segments.append({**hit, "chunks": [hit.get("chunk")], "rank": rank})
+            continue
+        groups.setdefault((hit["source"], hit.get("page")), []).append((rank, hit))
+
+    for members in groups.values():
+        members.sort(key=lambda item: item[1]["chunk"])
+        current: dict | None = None
+        for rank, hit in members:
+            if current is not None and hit["chunk"] == current["chunks"][-1] + 1:
+                current["text"] = _join(current["text"], hit.get("text", ""))
+                current["chunks"].append(hit["chunk"])
+                current["rank"] = min(current["rank"], rank)
+                current["distance"] = _min_distance(current.get("distance"), hit.get("distance"))
+                continue
+            current = {**hit, "chunks": [hit["chunk"]], "rank": rank}
+            segments.append(current)
+
+    segments.sort(key=lambda s: s["rank"])
+    return segments
+
+
+def _min_distance(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+def _words(text: str) -> frozenset[str]:
+    return frozenset(w.lower() for w in _WORD.findall(text))
+
+
+def _similarity(a: frozenset[str], b: frozenset[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _relevance(segment: dict, total: int) -> float:
+    distance = segment.get("distance")
+    if distance is not None:
+        return 1.0 - float(distance)  # distância de cosseno
+    return 1.0 - segment["rank"] / max(total, 1)
+
+
+def compact_hits(
+    hits: Sequence[dict],
+    *,
+    format_hit: Callable[[dict], str],
+    budget: int | None = None,
+    mmr_lambda: float | None = None,
+    count_tokens: Callable[[str], int] | None = None,
+) -> Compaction:
+    """Prepara os hits para o prompt: junta vizinhos, diversifica e cabe no orçamento.
+
+    1. Chunks consecutivos do mesmo arquivo/página viram um só trecho, sem a
+       sobreposição repetida (a citação passa a cobrir o intervalo de chunks).
+    2. Os trechos são escolhidos por MMR: relevância (1 - distância) menos a
+       semelhança lexical (Jaccard de palavras) com os já escolhidos.
+    3. Só entram trechos que cabem em `budget` tokens (0/None = sem limite);
+       se nem o primeiro couber, ele é cortado.
+    """
+    budget = settings.context_token_budget if budget is None else budget
+    mmr_lambda = settings.context_mmr_lambda if mmr_lambda is None else mmr_lambda
+    count = count_tokens or token_counter()
+
+    before = sum(count(format_hit(h)) for h in hits)
+    segments = merge_adjacent(hits)
+    words = [_words(s.get("text", "")) for s in segments]
+    relevance = [_relevance(s, len(hits)) for s in segments]
+
+    chosen: list[int] = []
+    used = 0
+    dropped = 0
+    remaining = list(range(len(segments)))
+    while remaining:
+        def score(i: int) -> float:
+            redundancy = max((_similarity(words[i], words[j]) for j in chosen), default=0.0)
+            return mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy
+
+        best = max(remaining, key=score)
+        remaining.remove(best)
+        cost = count(format_hit(segments[best]))
+        if budget and used + cost > budget:
+            if chosen:
+                dropped += 1
+                continue
+            while cost > budget and segments[best].get("text"):
+                segments[best] = _truncate(segments[best], budget / cost)
+                cost = count(format_hit(segments[best]))
+        chosen.append(best)
+        used += cost
+
+    selected = [segments[i] for i in chosen]
+    return Compaction(
+        hits=selected,
+        tokens_before=before,
+        tokens_after=used,
+        merged=len(hits) - len(segments),
+        dropped=dropped,
+    )
+
+
+def _truncate(segment: dict, ratio: float) -> dict:
+    text = segment.get("text", "").removesuffix(" …")
+    keep = min(len(text) - 1, int(len(text) * ratio * 0.95))
+    if keep <= 0:
+        return {**segment, "text": ""}
+    cut = text[:keep]
+    if " " in cut[keep // 2 :]:
+        cut = cut[: cut.rindex(" ")]
+    return {**segment, "text": cut.rstrip() + " …"}
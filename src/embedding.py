@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Sequence
+
+import numpy as np
+
+from .embedding_cache import EmbeddingCache, cache_key
+from .settings import settings
+
+
+BACKENDS = ("torch", "onnx", "onnx-int8", "openvino")
+
+
+class EmbeddingEngine:
+    """Encoder explícito (SentenceTransformers) com lotes ordenados por tamanho.
+
+    Textos de tamanho parecido no mesmo lote reduzem o padding do tokenizer;
+    o modelo só é carregado no primeiro uso.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        *,
+        batch_size: int = 64,
+        threads: int = 0,
+        normalize: bool = False,
+        device: str = "cpu",
+        backend: str = "torch",
+        quantization: str = "avx2",
+        cache: EmbeddingCache | None = None,
+    ) -> None:
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend de embedding inválido: {backend} (use {'/'.join(BACKENDS)})")
+        self.model_path = model_path
+        self.batch_size = max(1, batch_size)
+        self.threads = threads
+        self.normalize = normalize
+        self.device = device
+        self.backend = backend
+        self.quantization = quantization
+        self.cache = cache
+        self._model: Any = None
+
+    @property
+    def cache_namespace(self) -> str:
+        """Identifica os vetores gerados (modelo + normalização) nas chaves do cache."""
+        namespace = f"{self.model_path}|normalize={self.normalize}"
+        if self.backend != "torch":
+            namespace += f"|backend={self.variant}"
+        return namespace
+
+    @property
+    def variant(self) -> str:
+        """Backend efetivo, com a configuração de quantização quando houver."""
+        if self.backend == "onnx-int8":
+            return f"onnx-int8-{self.quantization}"
+        return self.backend
+
+    @property
+    def model(self) -> Any:
+        if self._model is None:
+            self._model = load_model(
+                self.model_path,
+                backend=self.backend,
+                device=self.device,
+                threads=self.threads,
+                quantization=self.quantization,
+            )
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        return int(self.model.get_sentence_embedding_dimension())
+
+    def _encode_batch(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize,
+            show_progress_bar=False,
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+    def encode(self, texts: Sequence[str], *, use_cache: bool = True) -> np.ndarray:
+        """Retorna matriz (len(texts), dim) em float32, na ordem de entrada.
+
+        Consulta o cache em disco antes do modelo; só os textos ausentes são
+        encodados (e gravados no cache). Consultas de busca passam
+        `use_cache=False` e usam o cache em memória de `rag`.
+        """
+        if self.cache is None or not use_cache or not texts:
+            return self._encode_uncached(texts)
+
+        keys = [cache_key(t, self.cache_namespace) for t in texts]
+        found = self.cache.get_many(keys)
+        missing = [i for i in range(len(texts)) if i not in found]
+        if not missing:
+            return np.stack([found[i] for i in range(len(texts))])
+
+        # Textos repetidos no mesmo lote (cabeçalhos, avisos) são encodados uma vez.
+        unique: dict[bytes, int] = {}
+        for i in missing:
+            unique.setdefault(keys[i], i)
+        computed = self._encode_uncached([texts[i] for i in unique.values()])
+        self.cache.put_many(list(unique), computed)
+
+        row = {key: n for n, key in enumerate(unique)}
+        out = np.empty((len(texts), computed.shape[1]), dtype=np.float32)
+        for i in missing:
+            out[i] = computed[row[keys[i]]]
+        for i, vector in found.items():
+            out[i] = vector
+        return out
+
+    def _encode_uncached(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        out: np.ndarray | None = None
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start : start + self.batch_size]
+            vectors = self._encode_batch([texts[i] for i in idx])
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[idx] = vectors
+        assert out is not None
+        return out
+
+
+def load_model(
+    model_path: str,
+    *,
+    backend: str = "torch",
+    device: str = "cpu",
+    threads: int = 0,
+    quantization: str = "avx2",
+) -> Any:
+    """Carrega o SentenceTransformer no backend pedido.
+
+    Para "onnx"/"openvino" o modelo é exportado na primeira vez e salvo em
+    `model_path` (subpastas onnx/ e openvino/); "onnx-int8" quantiza o ONNX
+    (dinâmico, sem calibração) para a CPU indicada em `quantization` (arm64,
+    avx2, avx512, avx512_vnni). `threads` > 0 fixa as threads intra-op.
+    Backends além do torch exigem `pip install sentence-transformers[onnx]`
+    ou `[openvino]`.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        if threads > 0:
+            import torch
+
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_path, device=device)
+
+    folder = Path(model_path)
+    if backend == "openvino":
+        model_kwargs: dict[str, Any] = {}
+        if threads > 0:
+            model_kwargs["ov_config"] = {"INFERENCE_NUM_THREADS": str(threads)}
+        exported = (folder / "openvino" / "openvino_model.xml").exists()
+        model = SentenceTransformer(
+            model_path, device=device, backend="openvino", model_kwargs=model_kwargs
+        )
+        if not exported:
+            model.save_pretrained(model_path)
+        return model
+
+    import onnxruntime as ort
+
+    def onnx_kwargs(file_name: str) -> dict[str, Any]:
+        options = ort.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        return {
+            "file_name": file_name,
+            "provider": "CPUExecutionProvider",
+            "session_options": options,
+        }
+
+    if not (folder / "onnx" / "model.onnx").exists():
+        exported = SentenceTransformer(
+            model_path, device=device, backend="onnx", model_kwargs={"export": True}
+        )
+        exported.save_pretrained(model_path)
+    if backend == "onnx":
+        return SentenceTransformer(
+            model_path, device=device, backend="onnx", model_kwargs=onnx_kwargs("model.onnx")
+        )
+
+    quantized = f"model_qint8_{quantization}.onnx"
+    if not (folder / "onnx" / quantized).exists():
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        base = SentenceTransformer(
+            model_path, device=device, backend="onnx", model_kwargs={"file_name": "model.onnx"}
+        )
+        export_dynamic_quantized_onnx_model(base, quantization, model_path)
+    return SentenceTransformer(
+        model_path, device=device, backend="onnx", model_kwargs=onnx_kwargs(quantized)
+    )
+
+
+def _build_cache(model_path: str) -> EmbeddingCache | None:
+    if not settings.embedding_cache_dir or settings.embedding_cache_size <= 0:
+        return None
+    folder = hashlib.blake2b(model_path.encode("utf-8"), digest_size=6).hexdigest()
+    return EmbeddingCache(
+        settings.embedding_cache_dir / folder,
+        model=model_path,
+        capacity=settings.embedding_cache_size,
+    )
+
+
+def local_engine() -> EmbeddingEngine:
+    """Encoder deste processo, montado a partir das settings."""
+    model_path = str(settings.embedding_model_path)
+    return EmbeddingEngine(
+        model_path,
+        batch_size=settings.embedding_batch_size,
+        threads=settings.embedding_threads,
+        normalize=settings.embedding_normalize,
+        backend=settings.embedding_backend,
+        quantization=settings.embedding_quantization,
+        cache=_build_cache(model_path),
+    )
+
+
+@lru_cache
+def get_engine() -> EmbeddingEngine:
+    """Instância única do encoder, compartilhada por ingestão e busca.
+
+    Com `embedding_service_socket` configurado, o encode vai para o serviço
+    compartilhado (`cli embed-serve`) e o modelo não é carregado aqui.
+    """
+    if settings.embedding_service_socket:
+        from .embedding_service import RemoteEmbeddingEngine
+
+        return RemoteEmbeddingEngine(
+            settings.embedding_service_socket,
+            str(settings.embedding_model_path),
+            normalize=settings.embedding_normalize,
+            backend=settings.embedding_backend,
+            quantization=settings.embedding_quantization,
+        )
+    return local_engine()
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _throughput(engine: EmbeddingEngine, texts: Sequence[str]) -> tuple[np.ndarray, float]:
+    engine.encode(list(texts[:8]), use_cache=False)  # aquecimento (carga/compilação)
+    started = time.perf_counter()
+    vectors = engine.encode(texts, use_cache=False)
+    elapsed = time.perf_counter() - started
+    return _unit(vectors), len(texts) / elapsed if elapsed > 0 else 0.0
+
+
+def parity_report(
+    reference: EmbeddingEngine,
+    candidate: EmbeddingEngine,
+    documents: Sequence[str],
+    queries: Sequence[str],
+    *,
+    k: int = 10,
+) -> dict:
+    """Compara um backend com a referência (torch) numa amostra.
+
+    Mede o cosseno entre os vetores de cada documento nos dois backends e o
+    recall@k: quanto do top-k de cada consulta na referência o candidato
+    também recupera. Inclui textos/s de cada um.
+    """
+    ref_docs, ref_rate = _throughput(reference, documents)
+    cand_docs, cand_rate = _throughput(candidate, documents)
+    cosine = np.sum(ref_docs * cand_docs, axis=1)
+
+    k = max(1, min(k, len(documents)))
+    ref_queries = _unit(reference.encode(queries, use_cache=False))
+    cand_queries = _unit(candidate.encode(queries, use_cache=False))
+    ref_top = np.argsort(-(ref_queries @ ref_docs.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand_queries @ cand_docs.T), axis=1)[:, :k]
+    recall = [len(set(a) & set(b)) / k for a, b in zip(ref_top.tolist(), cand_top.tolist())]
+
+    return {
+        "reference": reference.variant,
+        "candidate": candidate.variant,
+        "documents": len(documents),
+        "queries": len(queries),
+        "k": k,
+        "cosine": {
+            "mean": round(float(cosine.mean()), 5),
+            "min": round(float(cosine.min()), 5),
+            "p5": round(float(np.percentile(cosine, 5)), 5),
+        },
+        "recall_at_k": round(float(np.mean(recall)), 4) if recall else None,
+        "reference_texts_per_sec": round(ref_rate, 2),
+        "candidate_texts_per_sec": round(cand_rate, 2),
+        "speedup": round(cand_rate / ref_rate, 2) if ref_rate else None,
+    }
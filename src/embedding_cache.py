@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+from .file_lock import file_lock
+
+
+KEY_BYTES = 16
+
+
+def cache_key(text: str, model: str) -> bytes:
+    """Hash do texto sanitizado + modelo (o mesmo texto em outro modelo é outra chave)."""
+    clean = text.replace("\x00", " ").encode("utf-8", errors="ignore")
+    digest = hashlib.blake2b(digest_size=KEY_BYTES)
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(clean)
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """Cache de embeddings em disco, endereçado por conteúdo.
+
+    Três arrays memory-mapped de capacidade fixa: chaves (16 bytes), vetores
+    float32 e um relógio de último uso (0 = slot livre). Quando enche, os
+    slots menos usados recentemente são descartados em bloco.
+    """
+
+    def __init__(self, directory: Path | str, model: str, capacity: int) -> None:
+        self.directory = Path(directory)
+        self.model = model
+        self.capacity = max(1, capacity)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index: dict[bytes, int] = {}
+        self._keys: np.ndarray | None = None
+        self._vectors: np.ndarray | None = None
+        self._ticks: np.ndarray | None = None
+        self._clock = 0
+        self._open_existing()
+
+    # -- arquivos ---------------------------------------------------------
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    def _open_existing(self) -> None:
+        try:
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if meta.get("model") != self.model or meta.get("capacity") != self.capacity:
+            return
+        try:
+            self._map(int(meta["dim"]), mode="r+")
+        except (OSError, ValueError, KeyError):
+            self._keys = self._vectors = self._ticks = None
+            return
+        assert self._keys is not None and self._ticks is not None
+        used = np.flatnonzero(self._ticks)
+        self._index = {self._keys[slot].tobytes(): int(slot) for slot in used}
+        self._clock = int(self._ticks.max()) if len(used) else 0
+
+    def _map(self, dim: int, *, mode: str) -> None:
+        open_memmap = np.lib.format.open_memmap
+        shapes = {
+            "keys": ((self.capacity, KEY_BYTES), np.uint8),
+            "vectors": ((self.capacity, dim), np.float32),
+            "ticks": ((self.capacity,), np.int64),
+        }
+        arrays = {}
+        for name, (shape, dtype) in shapes.items():
+            path = self.directory / f"{name}.npy"
+            if mode == "w+":
+                arrays[name] = open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+            else:
+                arrays[name] = open_memmap(path, mode="r+")
+                if arrays[name].shape != shape:
+                    raise ValueError(f"{path} com formato inesperado")
+        self._keys, self._vectors, self._ticks = (
+            arrays["keys"],
+            arrays["vectors"],
+            arrays["ticks"],
+        )
+
+    def _create(self, dim: int) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._map(dim, mode="w+")
+        self._meta_path.write_text(
+            json.dumps({"model": self.model, "capacity": self.capacity, "dim": dim}),
+            encoding="utf-8",
+        )
+        self._index = {}
+        self._clock = 0
+
+    # -- API --------------------------------------------------------------
+
+    def get_many(self, keys: Sequence[bytes]) -> dict[int, np.ndarray]:
+        """Retorna {posição em `keys`: vetor} para as chaves encontradas."""
+        found: dict[int, np.ndarray] = {}
+        with self._lock:
+            if self._vectors is None:
+                self.misses += len(keys)
+                return found
+            assert self._keys is not None and self._ticks is not None
+            for pos, key in enumerate(keys):
+                slot = self._index.get(key)
+                # Confere a chave no disco: outro processo pode ter reciclado o slot.
+                if slot is None or self._keys[slot].tobytes() != key:
+                    if slot is not None:
+                        del self._index[key]
+                    continue
+                vector = np.array(self._vectors[slot])
+                if self._keys[slot].tobytes() != key:
+                    continue
+                self._clock += 1
+                self._ticks[slot] = self._clock
+                found[pos] = vector
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        if not len(keys):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, file_lock(self.directory / ".lock"):
+            if self._vectors is None:
+                # Outro processo pode ter criado o cache depois que este abriu.
+                self._open_existing()
+            if self._vectors is None or self._vectors.shape[1] != vectors.shape[1]:
+                self._create(vectors.shape[1])
+            assert self._keys is not None and self._vectors is not None
+            assert self._ticks is not None
+
+            fresh = [
+                (key, vec)
+                for key, vec in dict(zip(keys, vectors)).items()
+                if key not in self._index
+            ][: self.capacity]
+            if not fresh:
+                return
+            slots = self._free_slots(len(fresh))
+            self._clock = max(self._clock, int(self._ticks.max()))
+            for slot, (key, vec) in zip(slots, fresh):
+                old_key = self._keys[slot].tobytes()
+                if self._index.get(old_key) == slot:
+                    del self._index[old_key]
+                # Vetor antes da chave: leitores conferem a chave depois de ler.
+                self._vectors[slot] = vec
+                self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self._clock += 1
+                self._ticks[slot] = self._clock
+                self._index[key] = int(slot)
+
+    def _free_slots(self, needed: int) -> np.ndarray:
+        assert self._ticks is not None
+        free = np.flatnonzero(self._ticks == 0)
+        if len(free) >= needed:
+            return free[:needed]
+        # Descarta em bloco (~5% da capacidade) para não despejar a cada lote.
+        evict = min(self.capacity, max(needed, len(free) + self.capacity // 20))
+        victims = np.argpartition(np.where(self._ticks == 0, -1, self._ticks), evict - 1)
+        victims = victims[:evict]
+        self.evictions += int(np.count_nonzero(self._ticks[victims]))
+        self._ticks[victims] = 0
+        return np.flatnonzero(self._ticks == 0)[:needed]
+
+    def flush(self) -> None:
+        with self._lock:
+            for array in (self._keys, self._vectors, self._ticks):
+                if array is not None:
+                    array.flush()  # type: ignore[union-attr]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
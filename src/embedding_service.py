@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Sequence
+
+import numpy as np
+
+from .embedding import EmbeddingEngine
+from .query_batcher import QueryBatcher
+from .settings import settings
+
+
+# Protocolo: quadros com tamanho (uint32 big-endian) + conteúdo.
+# Pedido: JSON {"op": "encode", "texts": [...], "use_cache": bool} ou {"op": "info"}.
+# Resposta: 1 byte de tipo + corpo:
+#   b"V" -> uint32 linhas, uint32 dimensão, float32 little-endian
+#   b"J" -> JSON (info)
+#   b"E" -> mensagem de erro (utf-8)
+_HEADER = struct.Struct(">I")
+_SHAPE = struct.Struct(">II")
+MAX_FRAME = 256 * 1024 * 1024
+MAX_TEXTS_PER_REQUEST = 4096
+
+
+def _pack_vectors(vectors: np.ndarray) -> bytes:
+    vectors = np.ascontiguousarray(vectors, dtype="<f4")
+    rows, dim = vectors.shape if vectors.ndim == 2 else (0, 0)
+    return b"V" + _SHAPE.pack(rows, dim) + vectors.tobytes()
+
+
+def _unpack_vectors(body: bytes) -> np.ndarray:
+    rows, dim = _SHAPE.unpack_from(body)
+    data = np.frombuffer(body, dtype="<f4", offset=_SHAPE.size, count=rows * dim)
+    return data.reshape(rows, dim).astype(np.float32)
+
+
+class EmbeddingService:
+    """Serve encodes de um único modelo residente para vários processos.
+
+    Consultas curtas sem cache (o caso dos workers da API) passam por um
+    `QueryBatcher`, que junta pedidos de processos diferentes num só lote;
+    pedidos grandes (ingestão) rodam numa thread própria, em fatias, usando
+    o cache de embeddings em disco. Um lock serializa o acesso ao modelo para
+    não disputar as threads do backend.
+    """
+
+    def __init__(
+        self,
+        engine: EmbeddingEngine,
+        *,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+    ) -> None:
+        self.engine = engine
+        self._model_lock = threading.Lock()
+        self.batcher = QueryBatcher(
+            self._encode_queries,
+            max_batch=max_batch,
+            max_wait_ms=max_wait_ms,
+            busy=self._model_lock.locked,
+        )
+        self._bulk = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-bulk")
+        self._writers: set[asyncio.StreamWriter] = set()
+        self.requests = 0
+        self.texts = 0
+
+    def _encode_queries(self, texts: Sequence[str]) -> np.ndarray:
+        with self._model_lock:
+            return self.engine.encode(texts, use_cache=False)
+
+    def _encode_bulk(self, texts: Sequence[str], use_cache: bool) -> np.ndarray:
+        # Fatias pequenas liberam o lock entre lotes para as consultas não esperarem a ingestão toda.
+        step = self.engine.batch_size * 4
+        parts = []
+        for start in range(0, len(texts), step):
+            with self._model_lock:
+                parts.append(self.engine.encode(texts[start : start + step], use_cache=use_cache))
+        return np.concatenate(parts)
+
+    def info(self) -> dict:
+        return {
+            "model_path": self.engine.model_path,
+            "variant": self.engine.variant,
+            "cache_namespace": self.engine.cache_namespace,
+            "dimension": self.engine.dimension,
+            "pid": os.getpid(),
+            "requests": self.requests,
+            "texts": self.texts,
+            "query_batcher": self.batcher.stats(),
+            "embedding_cache": self.engine.cache.stats() if self.engine.cache else None,
+        }
+
+    async def _dispatch(self, request: dict) -> bytes:
+        try:
+            op = request.get("op")
+            if op == "info":
+                return b"J" + json.dumps(self.info()).encode("utf-8")
+            if op != "encode":
+                raise ValueError(f"Operação desconhecida: {op}")
+
+            texts = list(request.get("texts") or [])
+            use_cache = bool(request.get("use_cache", True))
+            self.requests += 1
+            self.texts += len(texts)
+            if not texts:
+                return _pack_vectors(np.empty((0, 0), dtype=np.float32))
+            if not use_cache and len(texts) <= self.batcher.max_batch:
+                vectors = await asyncio.gather(
+                    *(asyncio.wrap_future(self.batcher.submit(t)) for t in texts)
+                )
+                return _pack_vectors(np.stack(vectors))
+            loop = asyncio.get_running_loop()
+            vectors = await loop.run_in_executor(self._bulk, self._encode_bulk, texts, use_cache)
+            return _pack_vectors(vectors)
+        except Exception as exc:
+            return b"E" + f"{type(exc).__name__}: {exc}".encode("utf-8")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Atende uma conexão: vários pedidos em sequência até o cliente fechar."""
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                except asyncio.IncompleteReadError:
+                    break
+                if size > MAX_FRAME:
+                    payload = b"E" + f"Pedido grande demais ({size} bytes)".encode("utf-8")
+                    writer.write(_HEADER.pack(len(payload)) + payload)
+                    break
+                request = json.loads(await reader.readexactly(size))
+                payload = await self._dispatch(request)
+                writer.write(_HEADER.pack(len(payload)) + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            pass  # serviço encerrando (Ctrl-C): fecha a conexão sem traceback
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def close(self) -> None:
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+        self._bulk.shutdown(wait=False, cancel_futures=True)
+        if self.engine.cache is not None:
+            self.engine.cache.flush()
+
+
+def _socket_in_use(path: Path) -> bool:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(str(path))
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+async def serve(
+    socket_path: Path | str,
+    engine: EmbeddingEngine | None = None,
+    *,
+    flush_interval: float = 30.0,
+) -> None:
+    """Carrega o modelo e atende encodes no socket Unix até ser interrompido."""
+    from .embedding import local_engine
+
+    path = Path(socket_path)
+    if path.exists():
+        if _socket_in_use(path):
+            raise RuntimeError(f"Já existe um serviço de embedding em {path}")
+        path.unlink()  # socket órfão de uma execução anterior
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    service = EmbeddingService(
+        engine or local_engine(),
+        max_batch=settings.query_batch_max_size,
+        max_wait_ms=settings.query_batch_max_wait_ms,
+    )
+    await asyncio.to_thread(lambda: service.engine.model)  # pronto antes de aceitar conexões
+    # Socket já nasce 0660: um chmod depois do bind deixaria uma janela aberta.
+    umask = os.umask(0o117)
+    try:
+        server = await asyncio.start_unix_server(service.handle, path=str(path))
+    finally:
+        os.umask(umask)
+    print(f"🧠 Serviço de embedding ({service.engine.variant}) em {path}")
+
+    async def flush_cache() -> None:
+        while service.engine.cache is not None:
+            await asyncio.sleep(flush_interval)
+            await asyncio.to_thread(service.engine.cache.flush)
+
+    flusher = asyncio.create_task(flush_cache())
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        print("🧠 Serviço de embedding encerrado")
+    finally:
+        flusher.cancel()
+        service.close()
+        path.unlink(missing_ok=True)
+
+
+class RemoteEmbeddingEngine(EmbeddingEngine):
+    """EmbeddingEngine que delega o encode ao serviço local (ver `serve`).
+
+    Entra no lugar do encoder local em `get_engine()`: ingestão, busca e a
+    EmbeddingFunction do Chroma passam a usar o modelo do serviço, sem
+    carregar pesos neste processo. Cada thread mantém sua própria conexão.
+    """
+
+    def __init__(self, socket_path: Path | str, model_path: str, *, timeout: float = 120.0, **kwargs: Any) -> None:
+        super().__init__(model_path, **kwargs)
+        self.socket_path = str(socket_path)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._info: dict | None = None
+
+    @property
+    def model(self) -> dict:
+        """Confere (uma vez) que o serviço usa o mesmo modelo/backend."""
+        if self._info is None:
+            info = self.info()
+            if info["cache_namespace"] != self.cache_namespace:
+                raise RuntimeError(
+                    "Serviço de embedding usa outro modelo/backend: "
+                    f"{info['cache_namespace']!r} (esperado {self.cache_namespace!r})"
+                )
+            self._info = info
+        return self._info
+
+    @property
+    def dimension(self) -> int:
+        return int(self.model["dimension"])
+
+    def info(self) -> dict:
+        _, body = self._call({"op": "info"})
+        return json.loads(body)
+
+    def encode(self, texts: Sequence[str], *, use_cache: bool = True) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        parts = []
+        for start in range(0, len(texts), MAX_TEXTS_PER_REQUEST):
+            chunk = list(texts[start : start + MAX_TEXTS_PER_REQUEST])
+            _, body = self._call({"op": "encode", "texts": chunk, "use_cache": use_cache})
+            parts.append(_unpack_vectors(body))
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _connection(self) -> socket.socket:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def _call(self, request: dict) -> tuple[bytes, bytes]:
+        data = json.dumps(request).encode("utf-8")
+        frame = _HEADER.pack(len(data)) + data
+        for attempt in (1, 2):
+            sent = False
+            try:
+                conn = self._connection()
+                conn.sendall(frame)
+                sent = True
+                (size,) = _HEADER.unpack(_recv_exactly(conn, _HEADER.size))
+                payload = _recv_exactly(conn, size)
+                break
+            except OSError as exc:
+                self._drop_connection()
+                # Serviço reiniciado (conexão velha, socket recriado): reconecta uma
+                # vez. Depois do envio não repete: o encode pode estar rodando.
+                restarted = isinstance(exc, (ConnectionError, FileNotFoundError))
+                if attempt == 2 or sent or not restarted:
+                    raise ConnectionError(
+                        f"Serviço de embedding indisponível em {self.socket_path}: {exc}"
+                    ) from exc
+        kind, body = payload[:1], payload[1:]
+        if kind == b"E":
+            raise RuntimeError(f"Serviço de embedding: {body.decode('utf-8', errors='replace')}")
+        return kind, body
+
+
+def _recv_exactly(conn: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = conn.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionResetError("conexão fechada pelo serviço")
+        received += n
+    return bytes(buf)
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import contextlib
+from pathlib import Path
+from typing import Iterator
+
+try:  # lock entre processos (servidor + CLI); ausente no Windows
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+
+@contextlib.contextmanager
+def file_lock(path: Path | str, *, blocking: bool = True) -> Iterator[bool]:
+    """`flock` exclusivo em `path` (criado se preciso); entrega se conseguiu o lock.
+
+    Com `blocking=False` não espera: entrega False se outro processo o detém.
+    Sem `fcntl` (Windows) não trava nada e entrega sempre True.
+    """
+    if fcntl is None:
+        yield True
+        return
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from .rag import IngestCancelled, ingest_directory
+from .settings import settings
+
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+@dataclass
+class IngestJob:
+    id: str
+    collection: str
+    params: dict
+    status: str = "queued"  # queued | running | done | failed | cancelled
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: dict = field(default_factory=dict)
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    def snapshot(self) -> dict:
+        """Estado serializável, com taxas de arquivos/chunks por segundo."""
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        rates = {}
+        if elapsed:
+            rates = {
+                "files_per_sec": round(self.progress.get("files_done", 0) / elapsed, 3),
+                "chunks_per_sec": round(self.progress.get("chunks", 0) / elapsed, 3),
+            }
+        return {
+            "id": self.id,
+            "collection": self.collection,
+            "status": self.status,
+            "params": self.params,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed": round(elapsed, 3) if elapsed is not None else None,
+            "progress": {**self.progress, **rates},
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class IngestScheduler:
+    """Fila de ingestões fora do event loop, uma por coleção por vez.
+
+    Pedidos iguais a um job ainda na fila ou em execução são agrupados nele
+    (mesmo id), então cliques repetidos não disparam reindexações paralelas e
+    um `reset` nunca apaga a coleção enquanto outro job escreve nela.
+
+    Fila, agrupamento e histórico valem só neste processo (cada worker da API
+    tem os seus). Entre processos — outros workers, `cli ingest`, watcher — a
+    exclusão vem do `collection_write_lock` tomado pela própria ingestão: o
+    job fica `running` esperando o lock enquanto outra ingestão da coleção roda.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_workers: int = 2,
+        history: int = 50,
+        run: Callable[..., dict] = ingest_directory,
+    ) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="ingest-job"
+        )
+        self._run = run
+        self._history = history
+        self._jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._collection_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, params: dict, *, collection: str | None = None) -> tuple[IngestJob, bool]:
+        """Agenda a ingestão; retorna (job, agrupado_em_job_existente)."""
+        collection = collection or settings.collection_name
+        with self._lock:
+            for job in self._jobs.values():
+                if (
+                    job.collection == collection
+                    and job.status in ACTIVE_STATUSES
+                    and job.params == params
+                    and not job.cancel_event.is_set()
+                ):
+                    return job, True
+
+            job = IngestJob(id=uuid.uuid4().hex[:12], collection=collection, params=params)
+            self._jobs[job.id] = job
+            self._collection_locks.setdefault(collection, threading.Lock())
+            self._prune()
+        self._executor.submit(self._execute, job)
+        return job, False
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> list[IngestJob]:
+        return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[IngestJob]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = time.time()
+            if job.status == "running":
+                job.cancel_event.set()
+        return job
+
+    def shutdown(self) -> None:
+        for job in self._jobs.values():
+            if job.status in ACTIVE_STATUSES:
+                self.cancel(job.id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _execute(self, job: IngestJob) -> None:
+        # Uma execução por coleção: os demais jobs dela esperam aqui, na fila.
+        with self._collection_locks[job.collection]:
+            with self._lock:
+                if job.status != "queued":
+                    return
+                job.status = "running"
+                job.started_at = time.time()
+            try:
+                job.result = self._run(
+                    **job.params,
+                    progress=lambda p: job.progress.update(p),
+                    cancel=job.cancel_event,
+                )
+                job.status = "done"
+            except IngestCancelled as exc:
+                job.status = "cancelled"
+                job.error = str(exc)
+            except Exception as exc:  # registra e segue para o próximo job
+                job.status = "failed"
+                job.error = f"{type(exc).__name__}: {exc}"
+            finally:
+                job.finished_at = time.time()
+
+    def _prune(self) -> None:
+        finished = [j for j in self._jobs.values() if j.status not in ACTIVE_STATUSES]
+        for job in finished[: max(0, len(finished) - self._history)]:
+            del self._jobs[job.id]
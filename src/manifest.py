@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+from .settings import settings
+
+
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class FileRecord:
+    path: str
+    size: int
+    mtime: float
+    sha256: str
+    chunk_ids: list[str] = field(default_factory=list)
+    params: dict = field(default_factory=dict)
+
+
+def chunk_params(chunk_size: int, overlap: int, mode: str = "chars") -> dict:
+    """Parâmetros que, se mudarem, exigem reindexar o arquivo."""
+    params = {
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "embedding_model": str(settings.embedding_model_path),
+    }
+    # Só fora do padrão, para não invalidar manifestos antigos.
+    if mode != "chars":
+        params["mode"] = mode
+    if settings.embedding_backend != "torch":
+        params["embedding_backend"] = settings.embedding_backend
+        if settings.embedding_backend == "onnx-int8":
+            params["embedding_quantization"] = settings.embedding_quantization
+    return params
+
+
+def canonical_path(path: Path | str) -> Path:
+    """Forma única de um caminho (absoluto, sem `..` nem links simbólicos).
+
+    Chave do manifesto e base dos ids dos chunks: `docs/a.pdf` e
+    `/srv/app/docs/a.pdf` precisam cair no mesmo registro.
+    """
+    return Path(path).resolve()
+
+
+def manifest_file(collection: str | None = None) -> Path:
+    """Manifesto da coleção: `ingest_manifest.<coleção>.json` ao lado de `manifest_path`."""
+    base = settings.manifest_path
+    name = collection or settings.collection_name
+    return base.with_name(f"{base.stem}.{name}{base.suffix}")
+
+
+def file_digest(path: Path, block_size: int = 1 << 20) -> str:
+    """SHA-256 do conteúdo, lido em blocos para não carregar PDFs inteiros."""
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        while block := fh.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """Registro persistente do que já foi indexado (um JSON por coleção)."""
+
+    def __init__(self, path: Path | str, collection: str) -> None:
+        self.path = Path(path)
+        self.collection = collection
+        self._records: dict[str, FileRecord] = {}
+        self._dirty = False
+
+    @classmethod
+    def load(
+        cls, path: Path | str | None = None, collection: str | None = None
+    ) -> "IngestManifest":
+        collection = collection or settings.collection_name
+        manifest = cls(path or manifest_file(collection), collection)
+        source = manifest.path
+        if not source.exists() and path is None:
+            # Manifesto único das versões anteriores (uma coleção só).
+            source = settings.manifest_path
+        if not source.exists():
+            return manifest
+
+        try:
+            data = json.loads(source.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            # Manifesto corrompido: trata como vazio e reindexa tudo.
+            return manifest
+
+        if (
+            data.get("version") != MANIFEST_VERSION
+            or data.get("collection") != manifest.collection
+        ):
+            return manifest
+
+        for raw in data.get("files", []):
+            manifest._add(FileRecord(**raw))
+        manifest._dirty |= source != manifest.path
+        return manifest
+
+    def save(self) -> None:
+        """Grava de forma atômica (arquivo temporário + rename)."""
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "version": MANIFEST_VERSION,
+            "collection": self.collection,
+            "files": [asdict(r) for r in self._records.values()],
+        }
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def _add(self, record: FileRecord) -> None:
+        # Registros antigos podem ter caminho relativo (ao diretório corrente).
+        key = str(canonical_path(record.path))
+        if key != record.path:
+            record.path = key
+            self._dirty = True
+        self._records[key] = record
+
+    def get(self, path: Path) -> FileRecord | None:
+        return self._records.get(str(canonical_path(path)))
+
+    def __contains__(self, path: Path) -> bool:
+        return str(canonical_path(path)) in self._records
+
+    def __iter__(self) -> Iterator[FileRecord]:
+        return iter(list(self._records.values()))
+
+    def is_unchanged(self, path: Path, params: dict) -> bool:
+        """True se o arquivo já está indexado com o mesmo conteúdo e parâmetros.
+
+        Compara tamanho/mtime primeiro; só calcula o hash quando eles mudaram
+        (ex.: arquivo copiado de novo com o mesmo conteúdo).
+        """
+        record = self.get(path)
+        if record is None or record.params != params:
+            return False
+
+        stat = path.stat()
+        if record.size == stat.st_size and record.mtime == stat.st_mtime:
+            return True
+
+        if record.size == stat.st_size and record.sha256 == file_digest(path):
+            record.mtime = stat.st_mtime
+            self._dirty = True
+            return True
+        return False
+
+    def record(self, path: Path, chunk_ids: list[str], params: dict) -> FileRecord:
+        stat = path.stat()
+        record = FileRecord(
+            path=str(canonical_path(path)),
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            sha256=file_digest(path),
+            chunk_ids=list(chunk_ids),
+            params=dict(params),
+        )
+        self._records[record.path] = record
+        self._dirty = True
+        return record
+
+    def restore(self, record: FileRecord) -> None:
+        """Adiciona um registro pronto (ex.: vindo de um snapshot de outro nó)."""
+        self._add(record)
+        self._dirty = True
+
+    def remove(self, path: Path | str) -> FileRecord | None:
+        record = self._records.pop(str(canonical_path(path)), None)
+        if record is not None:
+            self._dirty = True
+        return record
+
+    def clear(self) -> None:
+        self._records.clear()
+        self._dirty = True
+
+    def records_under(self, folder: Path) -> list[FileRecord]:
+        """Registros cujo caminho está dentro de `folder`."""
+        base = canonical_path(folder)
+        return [r for r in self._records.values() if Path(r.path).is_relative_to(base)]
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator, Sequence, Union
+
+
+# Segundos: de 1 ms (cache/HNSW local) até 1 min (LLM, lotes de ingestão).
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+LabelValues = tuple[str, ...]
+Sample = Union[float, dict[LabelValues, float]]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+        self._function: Callable[[], Sample] | None = None
+        REGISTRY.register(self)
+
+    def labels(self, *values: str, **kwargs: str):
+        """Série filha para os valores de label (criada no primeiro uso)."""
+        key = values or tuple(str(kwargs[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def set_function(self, fn: Callable[[], Sample]) -> None:
+        """Valor lido na hora da coleta (número ou {valores_de_label: número})."""
+        self._function = fn
+
+    @abstractmethod
+    def _new_child(self):
+        """Série de um conjunto de labels (`_Value` ou `_HistogramChild`)."""
+
+    def _samples(self) -> Iterator[tuple[str, str, float]]:
+        if self._function is not None:
+            value = self._function()
+            items = value.items() if isinstance(value, dict) else [((), value)]
+            for key, number in items:
+                yield self.name, _format_labels(self.labelnames, key), float(number)
+            return
+        for key, child in list(self._children.items()):
+            yield self.name, _format_labels(self.labelnames, key), child.value  # type: ignore[attr-defined]
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+
+class Counter(_Metric):
+    """Contador monotônico."""
+
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Valor instantâneo (setado ou lido por `set_function` na coleta)."""
+
+    kind = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    """Distribuição em baldes cumulativos (padrão: segundos)."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self) -> Iterator[tuple[str, str, float]]:
+        for key, child in list(self._children.items()):
+            with child._lock:  # type: ignore[attr-defined]
+                counts = list(child.counts)  # type: ignore[attr-defined]
+                total = child.sum  # type: ignore[attr-defined]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, le), cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+logger = logging.getLogger(__name__)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._failing: set[str] = set()  # já logadas; de novo só depois de voltarem
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica já registrada: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Exposição no formato texto do Prometheus (0.0.4)."""
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:  # uma fonte com erro não derruba o /metrics inteiro
+                if metric.name not in self._failing:
+                    self._failing.add(metric.name)
+                    logger.exception("Falha ao coletar a métrica %s", metric.name)
+                continue
+            self._failing.discard(metric.name)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# -- métricas do serviço ------------------------------------------------------
+
+HTTP_REQUESTS = Counter(
+    "rag_http_requests_total", "Requisições HTTP por rota e status.", ("method", "path", "status")
+)
+HTTP_SECONDS = Histogram(
+    "rag_http_request_seconds",
+    "Tempo até o início da resposta, por rota.",
+    ("method", "path"),
+)
+QUERY_STAGE_SECONDS = Histogram(
+    "rag_query_stage_seconds",
+    "Tempo por etapa de uma pergunta "
+    "(answer_cache, query_embed, chroma_query, session, retrieval, llm, total).",
+    ("stage",),
+)
+QUERIES = Counter("rag_queries_total", "Perguntas respondidas, por modo.", ("mode",))
+SEARCH_HITS = Counter("rag_search_hits_total", "Trechos retornados pelas buscas.")
+CONTEXT_TOKENS = Counter(
+    "rag_context_tokens_total",
+    "Tokens de trechos antes e depois da compactação do contexto.",
+    ("stage",),
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "rag_ingest_stage_seconds",
+    "Tempo por etapa da ingestão (extract, chunk, embed, upsert, delete).",
+    ("stage",),
+)
+CHUNKS_INGESTED = Counter("rag_chunks_ingested_total", "Chunks gravados na coleção.")
+UPSERT_ROWS = Counter("rag_upsert_rows_total", "Linhas enviadas em upserts ao Chroma.")
+UPSERT_BYTES = Counter(
+    "rag_upsert_bytes_total", "Bytes (aprox.: textos, vetores float32, metadados) enviados em upserts."
+)
+UPSERT_RETRIES = Counter("rag_upsert_retries_total", "Escritas no Chroma repetidas após falha transitória.")
+FILES_INGESTED = Counter("rag_files_ingested_total", "Arquivos (re)indexados.")
+CACHE_EVENTS = Counter(
+    "rag_cache_events_total", "Acertos e faltas dos caches.", ("cache", "result")
+)
+ANSWER_CACHE_SAVED_SECONDS = Counter(
+    "rag_answer_cache_saved_seconds_total",
+    "Tempo de geração evitado por respostas servidas do cache semântico.",
+)
+ACTIVE_SESSIONS = Gauge("rag_active_sessions", "Sessões vivas em memória.")
+SESSION_BYTES = Gauge("rag_session_bytes", "Bytes de eventos mantidos em memória pelas sessões.")
+SESSION_EVICTIONS = Counter(
+    "rag_session_evictions_total", "Sessões despejadas da RAM (idle, memory).", ("reason",)
+)
+SESSION_TRIMMED_EVENTS = Counter(
+    "rag_session_trimmed_events_total", "Eventos cortados do início de históricos longos."
+)
+SESSION_SPILLED = Counter("rag_session_spilled_total", "Sessões gravadas no SQLite ao sair da RAM.")
+SESSION_RESTORED = Counter("rag_session_restored_total", "Sessões recarregadas do SQLite.")
+SESSION_RECREATED = Counter(
+    "rag_session_recreated_total", "Sessões despejadas durante um turno e recriadas pelo evento."
+)
+ADMISSION_ACTIVE = Gauge("rag_admission_active", "Perguntas em execução (limitadas por query_concurrency).")
+ADMISSION_QUEUE_DEPTH = Gauge("rag_admission_queue_depth", "Perguntas aguardando vaga.")
+ADMISSION_WAIT_SECONDS = Histogram(
+    "rag_admission_wait_seconds", "Espera na fila de admissão das perguntas aceitas."
+)
+ADMISSION_REJECTED = Counter(
+    "rag_admission_rejected_total",
+    "Perguntas recusadas na entrada (queue_full, user_quota, timeout).",
+    ("reason",),
+)
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Iterator, List, Sequence, Tuple
+
+from .chunker import (
+    Chunk,
+    Piece,
+    load_sections,
+    make_chunks,
+    pdf_page_count,
+    split_sections,
+)
+from .metrics import INGEST_STAGE_SECONDS
+from .settings import settings
+
+
+_DONE = object()
+
+
+# Pool de extração do processo, reaproveitado entre ingestões (ver `extract_pool`).
+_pool: ProcessPoolExecutor | None = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def resolve_workers(workers: int | None = None) -> int:
+    """0/None usa todos os núcleos menos um (o estágio de embedding)."""
+    workers = settings.ingest_workers if workers is None else workers
+    if workers <= 0:
+        workers = max(1, (os.cpu_count() or 1) - 1)
+    return workers
+
+
+def extract_pool(workers: int) -> ProcessPoolExecutor:
+    """Pool spawn com `workers` processos, criado uma vez e reaproveitado.
+
+    Cada processo novo reimporta o `__main__` do pai (sob o servidor, a API
+    inteira); com o pool vivo entre as ingestões esse custo é pago uma vez
+    por worker, e não a cada sincronização do watcher. Com
+    `ingest_pool_on_startup` o servidor já o sobe no aquecimento
+    (`start_pool`). Um pedido com outro número de workers troca o pool.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Descarta um pool quebrado (worker morto); o próximo uso cria outro."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ready() -> None:
+    """Tarefa vazia: força o pool a subir os processos."""
+
+
+def start_pool(workers: int | None = None) -> int:
+    """Sobe os processos do pool agora (aquecimento); retorna quantos."""
+    workers = resolve_workers(workers)
+    if workers <= 1:
+        return 0
+    pool = extract_pool(workers)
+    for fut in [pool.submit(_ready) for _ in range(workers)]:
+        fut.result()
+    return workers
+
+
+def shutdown_pool() -> None:
+    """Encerra os processos do pool (fim do servidor)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _extract_task(
+    path: str,
+    pages: Tuple[int, int] | None,
+    chunk_size: int,
+    overlap: int,
+    mode: str,
+) -> Tuple[List[Piece], float, float]:
+    """Executado no pool: extrai texto e quebra em trechos (sem ids).
+
+    Retorna também os segundos gastos em extração e em chunking, observados
+    no processo principal. O tokenizer (modo "tokens") é carregado uma vez
+    por processo do pool.
+    """
+    started = time.perf_counter()
+    sections = load_sections(Path(path), pages)
+    extracted = time.perf_counter()
+    pieces = split_sections(sections, chunk_size=chunk_size, overlap=overlap, mode=mode)
+    return pieces, extracted - started, time.perf_counter() - extracted
+
+
+def _collect(results: List[Tuple[List[Piece], float, float]]) -> List[Piece]:
+    pieces: List[Piece] = []
+    for part, extract_s, chunk_s in results:
+        INGEST_STAGE_SECONDS.labels("extract").observe(extract_s)
+        INGEST_STAGE_SECONDS.labels("chunk").observe(chunk_s)
+        pieces.extend(part)
+    return pieces
+
+
+def _plan(path: Path) -> List[Tuple[int, int] | None]:
+    """Divide PDFs grandes em intervalos de páginas independentes."""
+    step = settings.pdf_pages_per_task
+    if path.suffix.lower() != ".pdf" or step <= 0:
+        return [None]
+    total = pdf_page_count(path)
+    if total <= step:
+        return [None]
+    return [(start, min(start + step, total)) for start in range(0, total, step)]
+
+
+def _produce(
+    paths: Sequence[Path],
+    out: "queue.Queue[object]",
+    stop: threading.Event,
+    *,
+    chunk_size: int,
+    overlap: int,
+    mode: str,
+    workers: int,
+) -> None:
+    """Submete arquivos ao pool e entrega os resultados, em ordem, na fila."""
+
+    def put(item: object) -> bool:
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # Janela de arquivos em voo: limita memória mesmo se o consumidor atrasar.
+    max_inflight = max(workers * 2, 1)
+    window: deque[tuple[Path, list[Future]]] = deque()
+    pool = extract_pool(workers)
+
+    def drain_oldest() -> bool:
+        path, futures = window.popleft()
+        pieces = _collect([fut.result() for fut in futures])
+        return put((path, make_chunks(path, pieces)))
+
+    try:
+        for path in paths:
+            if stop.is_set():
+                break
+            futures = [
+                pool.submit(_extract_task, str(path), pages, chunk_size, overlap, mode)
+                for pages in _plan(path)
+            ]
+            window.append((path, futures))
+            while len(window) >= max_inflight:
+                if not drain_oldest():
+                    return
+        while window:
+            if not drain_oldest():
+                return
+    except BaseException as exc:  # repassa o erro para o consumidor
+        if isinstance(exc, BrokenProcessPool):
+            _discard_pool(pool)
+        put(exc)
+        return
+    finally:
+        # Cancelado ou com erro: o pool continua; só as tarefas pendentes saem.
+        for _, futures in window:
+            for fut in futures:
+                fut.cancel()
+    put(_DONE)
+
+
+def iter_file_chunks(
+    paths: Sequence[Path],
+    *,
+    chunk_size: int = settings.chunk_size,
+    overlap: int = settings.chunk_overlap,
+    mode: str = "chars",
+    workers: int | None = None,
+    queue_size: int | None = None,
+) -> Iterator[Tuple[Path, List[Chunk]]]:
+    """Gera (arquivo, chunks) na ordem de `paths`.
+
+    Extração e chunking rodam num pool de processos enquanto o consumidor
+    (embedding/upsert) trabalha; a fila limitada aplica backpressure.
+    """
+    workers = resolve_workers(workers)
+    single_txt = len(paths) == 1 and paths[0].suffix.lower() != ".pdf"
+    if workers <= 1 or not paths or single_txt:
+        # Subir um pool não compensa: processa no próprio processo.
+        for path in paths:
+            pieces = _collect([_extract_task(str(path), None, chunk_size, overlap, mode)])
+            yield path, make_chunks(path, pieces)
+        return
+
+    out: "queue.Queue[object]" = queue.Queue(
+        maxsize=queue_size or settings.ingest_queue_size
+    )
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_produce,
+        args=(paths, out, stop),
+        kwargs={
+            "chunk_size": chunk_size,
+            "overlap": overlap,
+            "mode": mode,
+            "workers": workers,
+        },
+        name="ingest-extract",
+        daemon=True,
+    )
+    producer.start()
+    try:
+        while True:
+            item = out.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item  # type: ignore[misc]
+    finally:
+        stop.set()
+        producer.join()
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Sequence
+
+import numpy as np
+
+
+# Limites superiores dos baldes do histograma de tamanho de lote.
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class QueryBatcher:
+    """Agrupa encodes de consultas concorrentes numa única chamada ao modelo.
+
+    Uma thread dedicada pega a primeira consulta da fila junto com as que já
+    estão esperando (até `max_batch`) e despacha na hora: consultas que chegam
+    durante um encode formam o próximo lote sozinhas. Só quando `busy()` diz
+    que o modelo está ocupado por outro encode (ex.: ingestão) ela espera até
+    `max_wait_ms` por mais consultas, já que o lote não rodaria antes disso.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[Sequence[str]], np.ndarray],
+        *,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        busy: Callable[[], bool] | None = None,
+    ) -> None:
+        self._encode = encode
+        self._busy = busy
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[tuple[str, Future]]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self._histogram = dict.fromkeys(BATCH_BUCKETS + (float("inf"),), 0)
+
+    def submit(self, text: str) -> Future:
+        """Enfileira uma consulta; o Future recebe o vetor (np.ndarray)."""
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((text, fut))
+        return fut
+
+    def encode(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="query-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self) -> list[tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            # Fila vazia: despacha, a menos que o modelo esteja ocupado mesmo assim.
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._busy is None or not self._busy():
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.001)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = [
+                (text, fut)
+                for text, fut in self._collect()
+                if fut.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            self._record(len(batch))
+            try:
+                vectors = self._encode([text for text, _ in batch])
+            except Exception as exc:
+                for _, fut in batch:
+                    fut.set_exception(exc)
+                continue
+            for (_, fut), vector in zip(batch, vectors):
+                fut.set_result(vector)
+
+    def _record(self, size: int) -> None:
+        self.batches += 1
+        self.requests += size
+        for bound in self._histogram:
+            if size <= bound:
+                self._histogram[bound] += 1
+                break
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_size_histogram": {
+                ("+Inf" if bound == float("inf") else str(bound)): count
+                for bound, count in self._histogram.items()
+            },
+        }
@@ -1,93 +1,358 @@
 from __future__ import annotations
 
+import asyncio
+import threading
+import time
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List, Sequence
+from typing import Callable, Iterable, Sequence
 
-from .chroma_setup import get_collection, reset_collection
-from .chunker import Chunk, build_chunks, is_supported_file
+import numpy as np
+from chromadb.errors import NotFoundError
+
+from .chroma_setup import (
+    bump_generation,
+    collection_write_lock,
+    flush_collection,
+    get_collection,
+    get_collection_async,
+    index_generation,
+    is_remote,
+    reset_collection,
+)
+from .answer_cache import answer_cache
+from .chroma_writer import WriteStats, chroma_writer
+from .chunker import Chunk, chunk_id, is_supported_file, max_tokens, resolve_chunking
+from .embedding import get_engine
+from .manifest import (
+    FileRecord,
+    IngestManifest,
+    canonical_path,
+    chunk_params,
+    file_digest,
+)
+from .pipeline import iter_file_chunks
+from .metrics import (
+    ANSWER_CACHE_SAVED_SECONDS,
+    CACHE_EVENTS,
+    CHUNKS_INGESTED,
+    FILES_INGESTED,
+    INGEST_STAGE_SECONDS,
+    QUERY_STAGE_SECONDS,
+    SEARCH_HITS,
+)
+from .query_batcher import QueryBatcher
+from .query_cache import TTLCache
 from .settings import settings
 
 
-def _upsert_chunks(chunks: Sequence[Chunk]) -> None:
+# Vetores de consulta não dependem da coleção; resultados são chaveados pela
+# geração do índice, então qualquer upsert/delete/reset neste processo os invalida.
+_query_vectors = TTLCache(settings.query_cache_size, settings.query_cache_ttl)
+_search_results = TTLCache(settings.query_cache_size, settings.query_cache_ttl)
+
+# Séries pré-resolvidas: no caminho quente só sobra o observe().
+_embed_timer = QUERY_STAGE_SECONDS.labels("query_embed")
+_chroma_timer = QUERY_STAGE_SECONDS.labels("chroma_query")
+_ingest_embed_timer = INGEST_STAGE_SECONDS.labels("embed")
+_ingest_upsert_timer = INGEST_STAGE_SECONDS.labels("upsert")
+_ingest_delete_timer = INGEST_STAGE_SECONDS.labels("delete")
+
+
+class IngestCancelled(Exception):
+    """Ingestão interrompida por `cancel`; arquivos já gravados ficam no manifesto."""
+
+
+@lru_cache
+def query_batcher() -> QueryBatcher:
+    """Batcher único na frente do encoder para consultas concorrentes.
+
+    Sua thread é o executor dedicado ao encode: o event loop só aguarda o Future.
+    """
+    engine = get_engine()
+    return QueryBatcher(
+        lambda texts: engine.encode(texts, use_cache=False),
+        max_batch=settings.query_batch_max_size,
+        max_wait_ms=settings.query_batch_max_wait_ms,
+    )
+
+
+def _upsert_chunks(
+    chunks: Sequence[Chunk], embeddings: np.ndarray | None = None
+) -> WriteStats:
     if not chunks:
+        return WriteStats()
+
+    if embeddings is None:
+        embeddings = get_engine().encode([c.text for c in chunks])
+
+    with _ingest_upsert_timer.time():
+        stats = chroma_writer().upsert(
+            [c.id for c in chunks],
+            documents=[c.text for c in chunks],
+            embeddings=embeddings,
+            metadatas=[
+                {"source": c.source, "page": c.page, "chunk": c.chunk_index}
+                for c in chunks
+            ],
+        )
+    bump_generation()
+    CHUNKS_INGESTED.inc(len(chunks))
+    return stats
+
+
+def _delete_ids(ids: Sequence[str]) -> None:
+    if not ids:
         return
+    with _ingest_delete_timer.time():
+        chroma_writer().delete(list(ids))
+    bump_generation()
 
-    collection = get_collection()
-    collection.upsert(
-        ids=[c.id for c in chunks],
-        documents=[c.text for c in chunks],
-        metadatas=[
-            {"source": c.source, "page": c.page, "chunk": c.chunk_index}
-            for c in chunks
-        ],
-    )
+
+class _IngestWriter:
+    """Acumula chunks de vários arquivos e grava em lotes de tamanho fixo.
+
+    Os chunks pendentes são ordenados por tamanho e embedados em lotes de
+    `embedding_batch_size`; o resto que não fecha um lote fica para o próximo
+    flush. Um arquivo só entra no manifesto quando todos os seus chunks foram
+    gravados. Também conta os chunks maiores que o `max_seq_length` do modelo
+    (o excedente não é embedado).
+    """
+
+    def __init__(self, manifest: IngestManifest, params: dict) -> None:
+        self.manifest = manifest
+        self.params = params
+        self.batch_size = get_engine().batch_size
+        self.flush_size = max(settings.embedding_flush_size, self.batch_size)
+        self._pending: list[Chunk] = []
+        self._remaining: dict[str, int] = {}
+        self._files: dict[str, tuple[Path, list[str]]] = {}
+        self.measured = 0
+        self.truncated = 0
+        self.upserts = WriteStats()
+
+    def add(self, file_path: Path, chunks: Sequence[Chunk]) -> int:
+        new_ids = [c.id for c in chunks]
+        previous = self.manifest.get(file_path)
+        if previous is not None:
+            keep = set(new_ids)
+            _delete_ids([i for i in previous.chunk_ids if i not in keep])
+
+        key = str(file_path)
+        self._files[key] = (file_path, new_ids)
+        self._remaining[key] = self._remaining.get(key, 0) + len(chunks)
+        self._pending.extend(chunks)
+        self._count_truncated(chunks)
+        if not chunks:
+            self._complete(key)
+        if len(self._pending) >= self.flush_size:
+            self.flush(final=False)
+        return len(chunks)
+
+    def flush(self, *, final: bool = True) -> None:
+        if not self._pending:
+            return
+        pending = sorted(self._pending, key=lambda c: len(c.text), reverse=True)
+        cut = len(pending) if final else len(pending) // self.batch_size * self.batch_size
+        ready, self._pending = pending[:cut], pending[cut:]
+        if not ready:
+            return
+
+        engine = get_engine()
+        with _ingest_embed_timer.time():
+            embeddings = np.concatenate(
+                [
+                    engine.encode([c.text for c in ready[i : i + self.batch_size]])
+                    for i in range(0, len(ready), self.batch_size)
+                ]
+            )
+        self.upserts.add(_upsert_chunks(ready, embeddings))
+
+        for chunk in ready:
+            self._remaining[chunk.source] -= 1
+            if self._remaining[chunk.source] == 0:
+                self._complete(chunk.source)
+
+        if final and engine.cache is not None:
+            engine.cache.flush()
+
+    def summary(self) -> dict:
+        """Truncamento (modo tokens) e vazão das escritas no Chroma."""
+        out = {"upsert": self.upserts.as_dict()} if self.upserts.rows else {}
+        if self.measured:
+            out["truncated"] = self.truncated
+            out["truncation_rate"] = round(self.truncated / self.measured, 4)
+        return out
+
+    def _count_truncated(self, chunks: Sequence[Chunk]) -> None:
+        counts = [c.tokens for c in chunks if c.tokens is not None]
+        if not counts:
+            return
+        limit = max_tokens()
+        self.measured += len(counts)
+        self.truncated += sum(1 for n in counts if n > limit)
+
+    def _complete(self, key: str) -> None:
+        file_path, ids = self._files.pop(key)
+        self._remaining.pop(key, None)
+        self.manifest.record(file_path, ids, self.params)
+        FILES_INGESTED.inc()
+
+
+def _purge_missing(manifest: IngestManifest, folder: Path) -> int:
+    """Remove da coleção os arquivos que sumiram do disco."""
+    removed = 0
+    for record in manifest.records_under(folder):
+        if Path(record.path).exists():
+            continue
+        _delete_ids(record.chunk_ids)
+        manifest.remove(record.path)
+        removed += 1
+    return removed
 
 
+@collection_write_lock()
 def ingest_directory(
     source_dir: Path | str = settings.data_dir,
     *,
-    chunk_size: int = settings.chunk_size,
-    overlap: int = settings.chunk_overlap,
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    mode: str | None = None,
     reset: bool = False,
+    workers: int | None = None,
+    progress: Callable[[dict], None] | None = None,
+    cancel: threading.Event | None = None,
 ) -> dict:
-    """Indexa todos os PDFs/TXTs do diretório."""
+    """Indexa os PDFs/TXTs do diretório que mudaram desde a última execução.
+
+    Arquivos sem alteração (mesmo conteúdo e parâmetros) são pulados e
+    arquivos removidos do disco têm seus chunks apagados da coleção.
+    Tamanho/overlap seguem o `mode` ("chars" ou "tokens"); sem valor, usam os
+    padrões do settings para o modo. `progress` recebe contadores após cada arquivo; se `cancel` for setado a
+    ingestão para no próximo arquivo com `IngestCancelled`.
+    """
+    mode, chunk_size, overlap = resolve_chunking(mode, chunk_size, overlap)
+    manifest = IngestManifest.load()
     if reset:
         reset_collection()
+        chroma_writer().reset()
+        manifest.clear()
 
-    dir_path = Path(source_dir)
-    files = [
-        p for p in dir_path.rglob("*") if p.is_file() and is_supported_file(p)
-    ]
+    dir_path = canonical_path(source_dir)
+    files = sorted(
+        canonical_path(p)
+        for p in dir_path.rglob("*")
+        if p.is_file() and is_supported_file(p)
+    )
+    params = chunk_params(chunk_size, overlap, mode)
+    pending = [p for p in files if not manifest.is_unchanged(p, params)]
 
     processed = 0
     total_chunks = 0
-    for file_path in files:
-        chunks = list(build_chunks(file_path, chunk_size=chunk_size, overlap=overlap))
-        _upsert_chunks(chunks)
-        processed += 1
-        total_chunks += len(chunks)
 
-    return {"files": processed, "chunks": total_chunks}
+    def report() -> None:
+        if progress is not None:
+            progress(
+                {
+                    "files_total": len(pending),
+                    "files_done": processed,
+                    "chunks": total_chunks,
+                    "skipped": len(files) - len(pending),
+                }
+            )
+
+    report()
+    writer = _IngestWriter(manifest, params)
+    try:
+        for file_path, chunks in iter_file_chunks(
+            pending, chunk_size=chunk_size, overlap=overlap, mode=mode, workers=workers
+        ):
+            if cancel is not None and cancel.is_set():
+                raise IngestCancelled(f"cancelado após {processed} arquivo(s)")
+            total_chunks += writer.add(file_path, chunks)
+            processed += 1
+            report()
+        writer.flush()
+        removed = _purge_missing(manifest, dir_path)
+    finally:
+        # Salva mesmo em caso de erro para não reprocessar o que já foi feito.
+        flush_collection()
+        manifest.save()
+
+    result = {
+        "files": processed,
+        "chunks": total_chunks,
+        "skipped": len(files) - len(pending),
+        "removed": removed,
+        **writer.summary(),
+    }
+    if (cache := get_engine().cache) is not None:
+        result["embedding_cache"] = cache.stats()
+    return result
 
 
+@collection_write_lock()
 def ingest_paths(
     paths: Iterable[Path],
     *,
-    chunk_size: int = settings.chunk_size,
-    overlap: int = settings.chunk_overlap,
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    mode: str | None = None,
+    workers: int | None = None,
 ) -> dict:
-    """Indexa apenas os caminhos informados."""
-    path_list = list(paths)
-    chunks_to_upsert: list[Chunk] = []
-    for path in path_list:
-        if not path.exists() or not is_supported_file(path):
-            continue
-        chunks_to_upsert.extend(
-            build_chunks(path, chunk_size=chunk_size, overlap=overlap)
-        )
-    _upsert_chunks(chunks_to_upsert)
+    """Indexa apenas os caminhos informados (pulando os que não mudaram)."""
+    mode, chunk_size, overlap = resolve_chunking(mode, chunk_size, overlap)
+    manifest = IngestManifest.load()
+    params = chunk_params(chunk_size, overlap, mode)
+    pending = [
+        p
+        for p in dict.fromkeys(map(canonical_path, paths))
+        if p.exists()
+        and is_supported_file(p)
+        and not manifest.is_unchanged(p, params)
+    ]
+
+    processed = 0
+    total_chunks = 0
+    writer = _IngestWriter(manifest, params)
+    try:
+        for path, chunks in iter_file_chunks(
+            pending, chunk_size=chunk_size, overlap=overlap, mode=mode, workers=workers
+        ):
+            total_chunks += writer.add(path, chunks)
+            processed += 1
+        writer.flush()
+    finally:
+        flush_collection()
+        manifest.save()
+
     return {
-        "files": len(path_list),
-        "chunks": len(chunks_to_upsert),
+        "files": processed,
+        "chunks": total_chunks,
+        **writer.summary(),
     }
 
 
-def search(
-    query: str,
-    *,
-    top_k: int = settings.top_k,
-) -> list[dict]:
-    """Consulta o ChromaDB e retorna trechos e metadados."""
-    collection = get_collection()
-    results = collection.query(
-        query_texts=[query],
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"],
-    )
-    docs = results.get("documents", [[]])[0]
-    metas = results.get("metadatas", [[]])[0]
-    dists = results.get("distances", [[]])[0]
+def embed_query(query: str) -> list[float]:
+    """Embedding da consulta, com cache LRU/TTL em memória."""
+    with _embed_timer.time():
+        vector = _query_vectors.get(query)
+        if vector is None:
+            vector = query_batcher().encode(query).tolist()
+            _query_vectors.set(query, vector)
+    return vector
+
+
+async def embed_query_async(query: str) -> list[float]:
+    with _embed_timer.time():
+        vector = _query_vectors.get(query)
+        if vector is None:
+            vector = (await asyncio.wrap_future(query_batcher().submit(query))).tolist()
+            _query_vectors.set(query, vector)
+    return vector
+
 
+def _to_matches(docs, metas, dists) -> list[dict]:
     matches: list[dict] = []
     for doc, meta, dist in zip(docs, metas, dists):
         matches.append(
@@ -100,3 +365,293 @@ def search(
             }
         )
     return matches
+
+
+def _migrate_record(
+    record: FileRecord, new_path: Path, manifest: IngestManifest
+) -> bool:
+    """Move os chunks de um arquivo renomeado para os ids do novo caminho.
+
+    Reaproveita documentos e embeddings já gravados (sem extrair nem embedar
+    de novo). Retorna False se a coleção não tiver todos os chunks.
+    """
+    if not record.chunk_ids:
+        return False
+    collection = get_collection()
+    got = collection.get(
+        ids=record.chunk_ids, include=["embeddings", "documents", "metadatas"]
+    )
+    rows = {
+        id_: (emb, doc, meta)
+        for id_, emb, doc, meta in zip(
+            got["ids"], got["embeddings"], got["documents"], got["metadatas"]
+        )
+    }
+    if len(rows) != len(record.chunk_ids):
+        return False
+
+    new_ids = [chunk_id(new_path, i) for i in range(len(record.chunk_ids))]
+    ordered = [rows[i] for i in record.chunk_ids]
+    chroma_writer().upsert(
+        new_ids,
+        embeddings=np.asarray([emb for emb, _, _ in ordered], dtype=np.float32),
+        documents=[doc for _, doc, _ in ordered],
+        metadatas=[{**(meta or {}), "source": str(new_path)} for _, _, meta in ordered],
+    )
+    bump_generation()
+    _delete_ids([i for i in record.chunk_ids if i not in set(new_ids)])
+    manifest.remove(record.path)
+    manifest.record(new_path, new_ids, record.params)
+    return True
+
+
+@collection_write_lock()
+def sync_paths(
+    changed: Iterable[Path],
+    deleted: Iterable[Path],
+    *,
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    mode: str | None = None,
+    workers: int | None = None,
+) -> dict:
+    """Aplica um lote de mudanças do watcher.
+
+    Arquivos apagados têm os chunks removidos; um arquivo novo com o mesmo
+    hash de um apagado no mesmo lote é tratado como renomeação (ids migrados
+    sem reembedar); o resto passa por `ingest_paths`, que pula o que não mudou.
+    """
+    mode, chunk_size, overlap = resolve_chunking(mode, chunk_size, overlap)
+    manifest = IngestManifest.load()
+    params = chunk_params(chunk_size, overlap, mode)
+    changed = [
+        p for p in map(canonical_path, changed) if p.exists() and is_supported_file(p)
+    ]
+    gone = [
+        record
+        for p in map(canonical_path, deleted)
+        if not p.exists() and (record := manifest.get(p)) is not None
+    ]
+
+    renamed = 0
+    by_digest = {r.sha256: r for r in gone if r.params == params}
+    try:
+        for path in list(changed):
+            if not by_digest or path in manifest:
+                continue
+            record = by_digest.pop(file_digest(path), None)
+            if record is not None and _migrate_record(record, path, manifest):
+                changed.remove(path)
+                gone.remove(record)
+                renamed += 1
+
+        for record in gone:
+            _delete_ids(record.chunk_ids)
+            manifest.remove(record.path)
+    finally:
+        flush_collection()
+        manifest.save()
+
+    result = ingest_paths(
+        changed, chunk_size=chunk_size, overlap=overlap, mode=mode, workers=workers
+    )
+    return {**result, "renamed": renamed, "removed": len(gone)}
+
+
+def search(
+    query: str,
+    *,
+    top_k: int = settings.top_k,
+) -> list[dict]:
+    """Consulta o ChromaDB e retorna trechos e metadados."""
+    key = (query, top_k, index_generation())
+    cached = _search_results.get(key)
+    if cached is not None:
+        SEARCH_HITS.inc(len(cached))
+        return [dict(m) for m in cached]
+
+    vector = embed_query(query)
+    collection = get_collection()
+    with _chroma_timer.time():
+        results = collection.query(
+            query_embeddings=[vector],
+            n_results=top_k,
+            include=["documents", "metadatas", "distances"],
+        )
+    matches = _to_matches(
+        results.get("documents", [[]])[0],
+        results.get("metadatas", [[]])[0],
+        results.get("distances", [[]])[0],
+    )
+    _search_results.set(key, [dict(m) for m in matches])
+    SEARCH_HITS.inc(len(matches))
+    return matches
+
+
+def search_many(
+    queries: Sequence[str],
+    *,
+    top_k: int = settings.top_k,
+) -> list[list[dict]]:
+    """Busca várias consultas de uma vez (mesma ordem de `queries`).
+
+    Embeda as consultas sem cache num único lote e manda até
+    `search_batch_size` vetores por `collection.query`.
+    """
+    generation = index_generation()
+    results: list[list[dict] | None] = [None] * len(queries)
+    pending: list[int] = []
+    for i, query in enumerate(queries):
+        cached = _search_results.get((query, top_k, generation))
+        if cached is not None:
+            results[i] = [dict(m) for m in cached]
+        else:
+            pending.append(i)
+
+    vectors: dict[str, list[float]] = {}
+    to_encode: list[str] = []
+    for i in pending:
+        query = queries[i]
+        if query in vectors or query in to_encode:
+            continue
+        vector = _query_vectors.get(query)
+        if vector is None:
+            to_encode.append(query)
+        else:
+            vectors[query] = vector
+    if to_encode:
+        encoded = get_engine().encode(to_encode, use_cache=False)
+        for query, vector in zip(to_encode, encoded):
+            vectors[query] = vector.tolist()
+            _query_vectors.set(query, vectors[query])
+
+    collection = get_collection() if pending else None
+    step = max(1, settings.search_batch_size)
+    for start in range(0, len(pending), step):
+        batch = pending[start : start + step]
+        with _chroma_timer.time():
+            response = collection.query(
+                query_embeddings=[vectors[queries[i]] for i in batch],
+                n_results=top_k,
+                include=["documents", "metadatas", "distances"],
+            )
+        for row, i in enumerate(batch):
+            matches = _to_matches(
+                response["documents"][row],
+                response["metadatas"][row],
+                response["distances"][row],
+            )
+            _search_results.set((queries[i], top_k, generation), [dict(m) for m in matches])
+            results[i] = matches
+
+    SEARCH_HITS.inc(sum(len(r) for r in results if r))
+    return [r or [] for r in results]
+
+
+async def search_async(
+    query: str,
+    *,
+    top_k: int = settings.top_k,
+) -> list[dict]:
+    """Versão assíncrona de `search` para o servidor e a tool do agente.
+
+    O encode roda na thread do batcher (agrupado com outras consultas); com
+    `chroma_host` a consulta usa o AsyncHttpClient, senão a coleção local
+    (PersistentClient ou NumPy) roda numa thread.
+    """
+    key = (query, top_k, index_generation())
+    cached = _search_results.get(key)
+    if cached is not None:
+        SEARCH_HITS.inc(len(cached))
+        return [dict(m) for m in cached]
+
+    vector = await embed_query_async(query)
+    query_kwargs = {
+        "query_embeddings": [vector],
+        "n_results": top_k,
+        "include": ["documents", "metadatas", "distances"],
+    }
+
+    with _chroma_timer.time():
+        if is_remote():
+            collection = await get_collection_async()
+            try:
+                results = await collection.query(**query_kwargs)
+            except NotFoundError:
+                # Coleção recriada por outro processo: busca o id novo e tenta de novo.
+                collection = await get_collection_async(refresh=True)
+                results = await collection.query(**query_kwargs)
+        else:
+            results = await asyncio.to_thread(
+                lambda: get_collection().query(**query_kwargs)
+            )
+
+    matches = _to_matches(
+        results.get("documents", [[]])[0],
+        results.get("metadatas", [[]])[0],
+        results.get("distances", [[]])[0],
+    )
+    _search_results.set(key, [dict(m) for m in matches])
+    SEARCH_HITS.inc(len(matches))
+    return matches
+
+
+def warmup() -> dict:
+    """Carrega o encoder, roda um encode de teste e abre a coleção.
+
+    A consulta de teste obriga o Chroma a carregar o índice HNSW; assim a
+    primeira pergunta real não paga nenhuma dessas cargas. Retorna os tempos
+    de cada etapa (ms) e o número de documentos.
+    """
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+    engine = get_engine()
+    engine.model  # noqa: B018 - carrega os pesos
+    timings["encoder_load"] = round((time.perf_counter() - started) * 1000, 2)
+
+    step = time.perf_counter()
+    vector = query_batcher().encode("warmup")
+    timings["dummy_encode"] = round((time.perf_counter() - step) * 1000, 2)
+
+    step = time.perf_counter()
+    collection = get_collection()
+    count = collection.count()
+    if count:
+        collection.query(query_embeddings=[vector.tolist()], n_results=1)
+    timings["collection_open"] = round((time.perf_counter() - step) * 1000, 2)
+    return {"timings": timings, "documents": count}
+
+
+def cache_stats() -> dict:
+    """Contadores de acerto dos caches de busca."""
+    stats = {
+        "query_vectors": _query_vectors.stats(),
+        "search_results": _search_results.stats(),
+        "index_generation": index_generation(),
+        "query_batcher": query_batcher().stats(),
+        "answers": answer_cache().stats(),
+    }
+    if (cache := get_engine().cache) is not None:
+        stats["embedding_cache"] = cache.stats()
+    return stats
+
+
+def _cache_events() -> dict[tuple[str, str], float]:
+    """Contadores de acerto lidos dos próprios caches na hora da coleta."""
+    sources = {
+        "query_vectors": _query_vectors,
+        "search_results": _search_results,
+        "answers": answer_cache(),
+    }
+    if (cache := get_engine().cache) is not None:
+        sources["embedding"] = cache
+    events: dict[tuple[str, str], float] = {}
+    for name, source in sources.items():
+        events[(name, "hit")] = source.hits
+        events[(name, "miss")] = source.misses
+    events[("answers", "bypass")] = answer_cache().bypasses
+    return events
+
+
+CACHE_EVENTS.set_function(_cache_events)
+ANSWER_CACHE_SAVED_SECONDS.set_function(lambda: answer_cache().saved_ms / 1000)
@@ -1,18 +1,44 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import json
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 
 import os
 
-from fastapi import BackgroundTasks, FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from pydantic import BaseModel
 import uvicorn
 
-from .adk_app import build_runner, generate_answer
-from .rag import ingest_directory, search
+from .adk_app import build_runner, run_query, stream_query
+from .admission import AdmissionController, Rejected, Ticket
+from .chunker import resolve_chunking
+from .jobs import IngestScheduler
+from .metrics import (
+    ACTIVE_SESSIONS,
+    ADMISSION_ACTIVE,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_REJECTED,
+    ADMISSION_WAIT_SECONDS,
+    CONTENT_TYPE,
+    HTTP_REQUESTS,
+    HTTP_SECONDS,
+    REGISTRY,
+    SESSION_BYTES,
+    SESSION_EVICTIONS,
+    SESSION_RECREATED,
+    SESSION_RESTORED,
+    SESSION_SPILLED,
+    SESSION_TRIMMED_EVENTS,
+)
+from .chroma_setup import get_collection_async, is_remote
+from .pipeline import shutdown_pool, start_pool
+from .rag import cache_stats, search_async, search_many, warmup
 from .settings import settings
 
 
@@ -21,12 +47,21 @@ class QueryRequest(BaseModel):
     top_k: Optional[int] = None
     user_id: str = "user"
     session_id: Optional[str] = None
+    direct: Optional[bool] = None  # modo RAG direto; padrão em settings.direct_rag
+    use_cache: bool = True  # false ignora o cache semântico de respostas
+
+
+class BatchSearchRequest(BaseModel):
+    questions: list[str]
+    top_k: Optional[int] = None
+    user_id: str = "user"
 
 
 class IngestRequest(BaseModel):
     reset: bool = False
-    chunk_size: int = settings.chunk_size
-    overlap: int = settings.chunk_overlap
+    chunk_size: Optional[int] = None  # caracteres ou tokens, conforme `mode`
+    overlap: Optional[int] = None
+    mode: Optional[Literal["chars", "tokens"]] = None
     source_dir: Path = settings.data_dir
 
 
@@ -39,7 +74,138 @@ if key:
     print(f"[server] OPENAI_API_KEY prefix: {key[:8]}...")
 
 runner = build_runner()
-app = FastAPI(title="Local RAG + ADK", version="0.1.0")
+# Mesmo session_service: o usuário mantém o histórico ao alternar de modo.
+direct_runner = build_runner(direct=True, session_service=runner.session_service)
+ingest_jobs = IngestScheduler(
+    max_workers=settings.ingest_job_workers, history=settings.ingest_job_history
+)
+# Por processo: com api_workers > 1 o limite efetivo é query_concurrency x workers.
+admission = AdmissionController(
+    settings.query_concurrency,
+    queue_size=settings.query_queue_size,
+    per_user=settings.query_queue_per_user,
+    timeout=settings.query_queue_timeout,
+)
+
+# Estado do aquecimento exposto em /ready.
+_readiness: dict = {"status": "starting", "timings": {}, "error": None}
+
+
+async def _warmup() -> None:
+    """Carrega encoder, índice e o cliente do LLM antes da primeira pergunta."""
+    started = time.perf_counter()
+    try:
+        report = await asyncio.to_thread(warmup)
+        timings = report["timings"]
+        if is_remote():
+            step = time.perf_counter()
+            await get_collection_async()
+            timings["async_client"] = round((time.perf_counter() - step) * 1000, 2)
+        step = time.perf_counter()
+        # Resolve o modelo do agente agora: importa o litellm fora da 1ª requisição.
+        await asyncio.to_thread(lambda: runner.agent.canonical_model)
+        timings["llm_client"] = round((time.perf_counter() - step) * 1000, 2)
+        if settings.ingest_pool_on_startup:
+            step = time.perf_counter()
+            await asyncio.to_thread(start_pool)
+            timings["ingest_pool"] = round((time.perf_counter() - step) * 1000, 2)
+        timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+        _readiness.update(status="ready", timings=timings, documents=report["documents"])
+        print(f"[server] pronto em {timings['total']:.0f} ms: {timings}")
+    except Exception as exc:
+        _readiness.update(status="failed", error=f"{type(exc).__name__}: {exc}")
+        print(f"[server] falha no aquecimento: {_readiness['error']}")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_: FastAPI):
+    if settings.warmup_on_startup:
+        _readiness["status"] = "warming_up"
+        task = asyncio.create_task(_warmup())
+    else:
+        _readiness["status"] = "ready"
+        task = None
+    try:
+        yield
+    finally:
+        if task is not None:
+            task.cancel()
+        ingest_jobs.shutdown()
+        shutdown_pool()
+        runner.session_service.close()
+
+
+app = FastAPI(title="Local RAG + ADK", version="0.1.0", lifespan=lifespan)
+
+
+def _session_stat(name: str):
+    """Leitura de `BoundedSessionService.stats()` para os gauges/counters."""
+    return lambda: runner.session_service.stats()[name]
+
+
+ACTIVE_SESSIONS.set_function(_session_stat("live_sessions"))
+SESSION_BYTES.set_function(_session_stat("bytes_held"))
+SESSION_EVICTIONS.set_function(
+    lambda: {(reason,): n for reason, n in runner.session_service.stats()["evictions"].items()}
+)
+SESSION_TRIMMED_EVENTS.set_function(_session_stat("trimmed_events"))
+SESSION_SPILLED.set_function(_session_stat("spilled"))
+SESSION_RESTORED.set_function(_session_stat("restored"))
+SESSION_RECREATED.set_function(_session_stat("recreated"))
+
+ADMISSION_ACTIVE.set_function(lambda: admission.active)
+ADMISSION_QUEUE_DEPTH.set_function(lambda: admission.waiting)
+ADMISSION_REJECTED.set_function(
+    lambda: {(reason,): n for reason, n in admission.rejected.items()}
+)
+
+
+async def _admit(user_id: str) -> Ticket:
+    """Vaga para rodar uma pergunta; recusa com 503/429 e Retry-After sob carga."""
+    try:
+        ticket = await admission.acquire(user_id)
+    except Rejected as exc:
+        raise HTTPException(
+            status_code=exc.status,
+            detail=f"servidor ocupado ({exc.reason}); tente de novo em {exc.retry_after}s",
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from None
+    ADMISSION_WAIT_SECONDS.observe(ticket.waited)
+    return ticket
+
+
+class _AdmittedStream(StreamingResponse):
+    """StreamingResponse dona da vaga: libera ao terminar o envio, como for.
+
+    O `finally` cobre fim normal, erro, desconexão do cliente e cancelamento
+    antes do primeiro byte (o gerador pode nem chegar a iniciar).
+    """
+
+    def __init__(self, content, ticket: Ticket, **kwargs) -> None:
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
+
+
+@app.middleware("http")
+async def _http_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Template da rota (ex.: /ingest/{job_id}) para não explodir a cardinalidade.
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.labels(request.method, path, str(status)).inc()
+        HTTP_SECONDS.labels(request.method, path).observe(time.perf_counter() - started)
 
 
 @app.get("/health")
@@ -47,47 +213,179 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready():
+    """200 só depois do aquecimento (encoder + índice carregados); senão 503."""
+    code = 200 if _readiness["status"] == "ready" else 503
+    return JSONResponse(_readiness, status_code=code)
+
+
 @app.post("/query")
 async def query(body: QueryRequest):
     top_k = body.top_k or settings.top_k
     session_id = body.session_id or body.user_id  # garante contexto por usuário
-    # Ajusta top_k dinamicamente no system prompt via tool arg
-    async def answer():
-        return await generate_answer(
+    direct = settings.direct_rag if body.direct is None else body.direct
+    ticket = await _admit(body.user_id)
+    try:
+        # Nota: no modo agente top_k é consumido no tool local_rag (default via settings)
+        answer = await run_query(
             body.question,
             user_id=body.user_id,
             session_id=session_id,
-            runner=runner,
+            runner=direct_runner if direct else runner,
+            direct=direct,
+            top_k=top_k,
+            use_cache=body.use_cache,
         )
+    finally:
+        ticket.release()
+    return {
+        "answer": answer.text,
+        "mode": answer.mode,
+        "cached": answer.cached,
+        "citations": answer.citations,
+        "timings": answer.timings,
+        "context": answer.context,
+    }
 
-    # Nota: top_k é consumido no tool local_rag (default via settings)
-    return {"answer": await answer()}
 
+@app.post("/query/stream")
+async def query_stream(body: QueryRequest, request: Request):
+    """Mesma execução do /query, emitida como Server-Sent Events."""
+    session_id = body.session_id or body.user_id
+    direct = settings.direct_rag if body.direct is None else body.direct
+    # Admite antes de abrir o stream, para a recusa sair como 429/503 comum.
+    ticket = await _admit(body.user_id)
 
-@app.post("/ingest")
-async def ingest(body: IngestRequest, background_tasks: BackgroundTasks):
-    def _job():
-        ingest_directory(
-            source_dir=body.source_dir,
-            chunk_size=body.chunk_size,
-            overlap=body.overlap,
-            reset=body.reset,
+    async def sse():
+        agen = stream_query(
+            body.question,
+            user_id=body.user_id,
+            session_id=session_id,
+            runner=direct_runner if direct else runner,
+            direct=direct,
+            top_k=body.top_k or settings.top_k,
+            use_cache=body.use_cache,
         )
+        # aclosing: desconexão do cliente fecha o run_async e cancela o LLM.
+        async with contextlib.aclosing(agen):
+            async for item in agen:
+                if await request.is_disconnected():
+                    break
+                payload = json.dumps(item, ensure_ascii=False, default=str)
+                yield f"event: {item['type']}\ndata: {payload}\n\n"
+
+    try:
+        return _AdmittedStream(
+            sse(),
+            ticket,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    except BaseException:
+        ticket.release()
+        raise
+
+
+@app.post("/ingest")
+async def ingest(body: IngestRequest):
+    # Resolve os padrões antes, para pedidos equivalentes serem agrupados.
+    try:
+        mode, chunk_size, overlap = resolve_chunking(body.mode, body.chunk_size, body.overlap)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from None
+    job, coalesced = ingest_jobs.submit(
+        {
+            "source_dir": str(body.source_dir),
+            "chunk_size": chunk_size,
+            "overlap": overlap,
+            "mode": mode,
+            "reset": body.reset,
+        }
+    )
+    return {"job_id": job.id, "status": job.status, "coalesced": coalesced}
+
+
+@app.get("/ingest")
+async def ingest_list():
+    return {"jobs": [job.snapshot() for job in ingest_jobs.list()]}
+
+
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job não encontrado")
+    return job.snapshot()
 
-    background_tasks.add_task(_job)
-    return {"status": "ingest scheduled"}
+
+@app.post("/ingest/{job_id}/cancel")
+async def ingest_cancel(job_id: str):
+    job = ingest_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job não encontrado")
+    return job.snapshot()
 
 
 @app.post("/debug/search")
 async def debug_search(body: QueryRequest):
-    matches = search(body.question, top_k=body.top_k or settings.top_k)
+    ticket = await _admit(body.user_id)
+    try:
+        matches = await search_async(body.question, top_k=body.top_k or settings.top_k)
+    finally:
+        ticket.release()
     return {"matches": matches}
 
 
+@app.post("/search/batch")
+async def search_batch(body: BatchSearchRequest):
+    top_k = body.top_k or settings.top_k
+    ticket = await _admit(body.user_id)
+    try:
+        results = await asyncio.to_thread(search_many, body.questions, top_k=top_k)
+    finally:
+        ticket.release()
+    return {
+        "results": [
+            {"question": question, "matches": matches}
+            for question, matches in zip(body.questions, results)
+        ]
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/debug/cache")
+async def debug_cache():
+    return cache_stats()
+
+
+@app.get("/debug/admission")
+async def debug_admission():
+    return admission.stats()
+
+
+@app.get("/debug/sessions")
+async def debug_sessions():
+    return runner.session_service.stats()
+
+
 def main():
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "3000"))
-    uvicorn.run(app, host=host, port=port)
+    workers = max(1, settings.api_workers)
+    if workers == 1:
+        uvicorn.run(app, host=host, port=port)
+        return
+    if not settings.embedding_service_socket:
+        print(
+            "⚠️  api_workers > 1 sem embedding_service_socket: cada worker "
+            "carrega sua própria cópia do modelo (rode `cli embed-serve`)."
+        )
+    uvicorn.run("src.server:app", host=host, port=port, workers=workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,367 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events import Event
+from google.adk.sessions.base_session_service import (
+    BaseSessionService,
+    GetSessionConfig,
+    ListSessionsResponse,
+)
+from google.adk.sessions.session import Session
+from google.adk.sessions.state import State
+
+from .settings import settings
+
+
+SessionKey = tuple[str, str, str]  # (app_name, user_id, session_id)
+
+# Chaves de estado que não pertencem à sessão (guardadas à parte ou descartadas).
+_SHARED_PREFIXES = (State.APP_PREFIX, State.USER_PREFIX, State.TEMP_PREFIX)
+
+
+def _event_size(event: Event) -> int:
+    return len(event.model_dump_json(exclude_none=True))
+
+
+@dataclass
+class _Entry:
+    session: Session
+    sizes: list[int] = field(default_factory=list)  # bytes por evento
+    last_access: float = field(default_factory=time.monotonic)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.sizes)
+
+
+class _SqliteTier:
+    """Camada persistente opcional: sessões despejadas da RAM vão para cá."""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " app_name TEXT, user_id TEXT, session_id TEXT, data TEXT,"
+                " updated REAL, PRIMARY KEY (app_name, user_id, session_id))"
+            )
+
+    def save(self, session: Session) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                (
+                    session.app_name,
+                    session.user_id,
+                    session.id,
+                    session.model_dump_json(),
+                    session.last_update_time,
+                ),
+            )
+
+    def load(self, key: SessionKey) -> Optional[Session]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE app_name=? AND user_id=? AND session_id=?",
+                key,
+            ).fetchone()
+        return Session.model_validate_json(row[0]) if row else None
+
+    def delete(self, key: SessionKey) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE app_name=? AND user_id=? AND session_id=?",
+                key,
+            )
+
+    def keys(self, app_name: str, user_id: Optional[str]) -> list[SessionKey]:
+        query = "SELECT app_name, user_id, session_id FROM sessions WHERE app_name=?"
+        params: tuple = (app_name,)
+        if user_id is not None:
+            query += " AND user_id=?"
+            params += (user_id,)
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(query, params)]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class BoundedSessionService(BaseSessionService):
+    """Sessões em RAM com limites, no lugar do InMemorySessionService.
+
+    - histórico por sessão limitado a `max_events` e a `max_tokens` estimados,
+      cortando sempre no início de um turno do usuário (não sobra resposta de
+      tool sem a chamada correspondente);
+    - sessões ociosas há mais de `idle_ttl` segundos saem da RAM;
+    - teto global `max_total_bytes`, despejando as menos usadas (LRU);
+    - com `db_path`, sessões despejadas são gravadas em SQLite e recarregadas
+      quando o usuário volta.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_events: int = 50,
+        max_tokens: int = 8000,
+        idle_ttl: float = 3600.0,
+        max_total_bytes: int = 256 * 1024 * 1024,
+        db_path: Path | str | None = None,
+    ) -> None:
+        self.max_events = max_events
+        self.max_tokens = max_tokens
+        self.idle_ttl = idle_ttl
+        self.max_total_bytes = max_total_bytes
+        self._entries: OrderedDict[SessionKey, _Entry] = OrderedDict()
+        self._total_bytes = 0
+        self._app_state: dict[str, dict[str, Any]] = {}
+        self._user_state: dict[tuple[str, str], dict[str, Any]] = {}
+        self._tier = _SqliteTier(Path(db_path)) if db_path else None
+        self.evictions = {"idle": 0, "memory": 0}
+        self.trimmed_events = 0
+        self.spilled = 0
+        self.restored = 0
+        self.recreated = 0
+
+    # -- armazenamento ----------------------------------------------------
+
+    def _touch(self, key: SessionKey) -> Optional[_Entry]:
+        self._sweep()
+        entry = self._entries.get(key)
+        if entry is None and self._tier is not None:
+            session = self._tier.load(key)
+            if session is not None:
+                entry = self._insert(key, session)
+                self.restored += 1
+        if entry is not None:
+            entry.last_access = time.monotonic()
+            self._entries.move_to_end(key)
+        return entry
+
+    def _insert(self, key: SessionKey, session: Session) -> _Entry:
+        entry = _Entry(session=session, sizes=[_event_size(e) for e in session.events])
+        self._entries[key] = entry
+        self._total_bytes += entry.nbytes
+        self._trim(entry)
+        return entry
+
+    def _drop(self, key: SessionKey, *, spill: bool) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._total_bytes -= entry.nbytes
+        if spill and self._tier is not None:
+            self._tier.save(entry.session)
+            self.spilled += 1
+
+    def _sweep(self) -> None:
+        """Despeja ociosas (a ordem do OrderedDict é a de último acesso) e aplica o teto."""
+        now = time.monotonic()
+        while self._entries and self.idle_ttl > 0:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.last_access < self.idle_ttl:
+                break
+            self._drop(key, spill=True)
+            self.evictions["idle"] += 1
+        while len(self._entries) > 1 and self._total_bytes > self.max_total_bytes:
+            key = next(iter(self._entries))
+            self._drop(key, spill=True)
+            self.evictions["memory"] += 1
+
+    def _trim(self, entry: _Entry) -> None:
+        events = entry.session.events
+        budget_bytes = self.max_tokens * 4 if self.max_tokens > 0 else None  # ~4 bytes/token
+        cut = 0
+        while cut < len(events):
+            too_many = self.max_events > 0 and len(events) - cut > self.max_events
+            too_big = budget_bytes is not None and sum(entry.sizes[cut:]) > budget_bytes
+            if not (too_many or too_big):
+                break
+            # Avança até o próximo turno do usuário (mantém ao menos o último).
+            nxt = cut + 1
+            while nxt < len(events) and events[nxt].author != "user":
+                nxt += 1
+            if nxt >= len(events):
+                break
+            cut = nxt
+        if cut:
+            removed = sum(entry.sizes[:cut])
+            del events[:cut]
+            del entry.sizes[:cut]
+            self._total_bytes -= removed
+            self.trimmed_events += cut
+
+    # -- estado app:/user: ------------------------------------------------
+
+    def _split_state(
+        self, app_name: str, user_id: str, delta: dict[str, Any]
+    ) -> dict[str, Any]:
+        session_state: dict[str, Any] = {}
+        for k, v in delta.items():
+            if k.startswith(State.APP_PREFIX):
+                self._app_state.setdefault(app_name, {})[k.removeprefix(State.APP_PREFIX)] = v
+            elif k.startswith(State.USER_PREFIX):
+                self._user_state.setdefault((app_name, user_id), {})[
+                    k.removeprefix(State.USER_PREFIX)
+                ] = v
+            elif not k.startswith(State.TEMP_PREFIX):
+                session_state[k] = v
+        return session_state
+
+    def _copy(self, session: Session) -> Session:
+        copied = session.model_copy(deep=True)
+        for k, v in self._app_state.get(session.app_name, {}).items():
+            copied.state[State.APP_PREFIX + k] = v
+        for k, v in self._user_state.get((session.app_name, session.user_id), {}).items():
+            copied.state[State.USER_PREFIX + k] = v
+        return copied
+
+    # -- BaseSessionService -----------------------------------------------
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = (session_id or "").strip() or str(uuid.uuid4())
+        key = (app_name, user_id, session_id)
+        if self._touch(key) is not None:
+            raise AlreadyExistsError(f"Session with id {session_id} already exists.")
+        session = Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=self._split_state(app_name, user_id, state or {}),
+            last_update_time=time.time(),
+        )
+        self._insert(key, session)
+        self._sweep()
+        return self._copy(session)
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        entry = self._touch((app_name, user_id, session_id))
+        if entry is None:
+            return None
+        copied = self._copy(entry.session)
+        if config:
+            if config.num_recent_events:
+                copied.events = copied.events[-config.num_recent_events :]
+            if config.after_timestamp:
+                copied.events = [
+                    e for e in copied.events if e.timestamp >= config.after_timestamp
+                ]
+        return copied
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: Optional[str] = None
+    ) -> ListSessionsResponse:
+        keys = [
+            k for k in self._entries if k[0] == app_name and (user_id is None or k[1] == user_id)
+        ]
+        if self._tier is not None:
+            keys += [k for k in self._tier.keys(app_name, user_id) if k not in self._entries]
+        sessions = []
+        for key in keys:
+            entry = self._entries.get(key)
+            session = entry.session if entry else self._tier.load(key)  # type: ignore[union-attr]
+            if session is None:
+                continue
+            copied = self._copy(session)
+            copied.events = []
+            sessions.append(copied)
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> None:
+        key = (app_name, user_id, session_id)
+        self._drop(key, spill=False)
+        if self._tier is not None:
+            self._tier.delete(key)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+
+        delta = event.actions.state_delta if event.actions else None
+        session_delta = (
+            self._split_state(session.app_name, session.user_id, delta) if delta else {}
+        )
+        key = (session.app_name, session.user_id, session.id)
+        entry = self._touch(key)
+        if entry is None:
+            # Despejada no meio do turno (ex.: teto de memória sem SQLite): recria
+            # a partir da sessão do runner, que já traz este evento.
+            stored = session.model_copy(deep=True)
+            stored.state = {
+                k: v for k, v in stored.state.items() if not k.startswith(_SHARED_PREFIXES)
+            }
+            self._insert(key, stored)
+            self.recreated += 1
+            self._sweep()
+            return event
+        stored = entry.session
+        stored.events.append(event)
+        stored.last_update_time = event.timestamp
+        size = _event_size(event)
+        entry.sizes.append(size)
+        self._total_bytes += size
+        stored.state.update(session_delta)
+        self._trim(entry)
+        self._sweep()
+        return event
+
+    # -- operação ---------------------------------------------------------
+
+    def stats(self) -> dict:
+        return {
+            "live_sessions": len(self._entries),
+            "bytes_held": self._total_bytes,
+            "evictions": dict(self.evictions),
+            "trimmed_events": self.trimmed_events,
+            "spilled": self.spilled,
+            "restored": self.restored,
+            "recreated": self.recreated,
+        }
+
+    def close(self) -> None:
+        """Grava as sessões vivas no SQLite (se houver) antes de encerrar."""
+        if self._tier is None:
+            return
+        for entry in self._entries.values():
+            self._tier.save(entry.session)
+        self._tier.close()
+
+
+def build_session_service() -> BoundedSessionService:
+    return BoundedSessionService(
+        max_events=settings.session_max_events,
+        max_tokens=settings.session_max_tokens,
+        idle_ttl=settings.session_idle_ttl,
+        max_total_bytes=settings.session_max_total_mb * 1024 * 1024,
+        db_path=settings.session_db_path,
+    )
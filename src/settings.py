@@ -9,14 +9,61 @@ class Settings(BaseSettings):
 
     chroma_path: Path = Path("chroma")
     chroma_host: Optional[str] = None  # se definido, usa Chroma remoto via HTTP
+    vector_backend: str = "chroma"  # chroma | numpy (busca exata em memória, sem servidor)
+    vector_store_path: Path = Path("data/processed/vector_store")  # backend numpy
+    vector_store_dtype: str = "float32"  # float32 | float16 (metade da memória)
+    vector_store_persist_delay: float = 2.0  # segundos sem escrita até gravar; 0 = a cada escrita
+    upsert_batch_size: int = 256  # linhas por requisição (limitado ao max_batch_size do servidor)
+    upsert_concurrency: int = 4  # lotes em paralelo no Chroma remoto
+    upsert_retries: int = 3  # tentativas extras em falhas transitórias (5xx, timeout, conexão)
+    upsert_backoff: float = 0.5  # segundos; dobra a cada tentativa
     collection_name: str = "local_docs"
     data_dir: Path = Path("data/raw")
     processed_dir: Path = Path("data/processed")
+    manifest_path: Path = Path("data/processed/ingest_manifest.json")  # base: um arquivo por coleção
     embedding_model_name: str = "all-MiniLM-L6-v2"
     embedding_model_path: Path = Path("models/all-MiniLM-L6-v2")
+    embedding_batch_size: int = 64
+    embedding_threads: int = 0  # threads intra-op do backend; 0 = padrão
+    embedding_backend: str = "torch"  # torch | onnx | onnx-int8 | openvino (CPU)
+    embedding_quantization: str = "avx2"  # onnx-int8: arm64 | avx2 | avx512 | avx512_vnni
+    embedding_normalize: bool = False
+    embedding_flush_size: int = 1024  # chunks acumulados entre arquivos antes de embedar
+    embedding_cache_dir: Optional[Path] = Path("data/processed/embedding_cache")
+    embedding_cache_size: int = 100_000  # vetores no cache em disco (0 desativa)
+    embedding_service_socket: Optional[Path] = None  # socket do `cli embed-serve` (modelo compartilhado)
     chunk_size: int = 800
     chunk_overlap: int = 200
+    chunk_mode: str = "chars"  # "tokens" corta pelo tokenizer do modelo de embedding
+    chunk_tokens: int = 0  # modo tokens: 0 = max_seq_length do modelo
+    chunk_overlap_tokens: int = 32
+    chunk_report_truncation: bool = False  # modo chars: tokeniza os chunks só para medir truncamento
+    ingest_workers: int = 0  # 0 = núcleos - 1; 1 = sequencial, sem pool
+    ingest_pool_on_startup: bool = False  # servidor sobe o pool de extração no aquecimento
+    ingest_queue_size: int = 8  # arquivos prontos aguardando embedding/upsert
+    pdf_pages_per_task: int = 50  # PDFs maiores são divididos entre processos
+    watch_settle_seconds: float = 2.0  # arquivo parado por esse tempo antes de indexar
+    watch_queue_size: int = 4  # lotes aguardando o worker do watcher
+    ingest_job_workers: int = 2  # jobs de /ingest em paralelo (sempre 1 por coleção)
+    ingest_job_history: int = 50  # jobs finalizados mantidos para consulta
     top_k: int = 5
+    answer_cache_size: int = 512  # respostas no cache semântico; 0 desativa
+    answer_cache_ttl: float = 3600.0  # segundos
+    answer_cache_threshold: float = 0.95  # cosseno mínimo entre perguntas para reaproveitar
+    context_compaction: bool = True  # junta chunks vizinhos, aplica MMR e orçamento antes do LLM
+    context_token_budget: int = 1500  # tokens de trechos no prompt; 0 = sem limite
+    context_mmr_lambda: float = 0.7  # 1 = só relevância; menor = mais diversidade
+    query_concurrency: int = 8  # perguntas (/query, /query/stream) em execução; 0 = sem limite
+    query_queue_size: int = 32  # perguntas aguardando vaga; fila cheia -> 503
+    query_queue_per_user: int = 4  # aguardando por user_id; acima disso -> 429
+    query_queue_timeout: float = 30.0  # segundos na fila antes de desistir (503)
+    query_cache_size: int = 1024  # consultas em cache (vetores e resultados); 0 desativa
+    query_cache_ttl: float = 600.0  # segundos; cobre ingestões feitas por outro processo
+    query_batch_max_size: int = 32  # consultas concorrentes agrupadas num único encode
+    query_batch_max_wait_ms: float = 5.0  # espera extra por consultas só com o modelo ocupado
+    search_batch_size: int = 256  # consultas por chamada em search_many
+    warmup_on_startup: bool = True  # servidor carrega encoder/índice antes de ficar pronto
+    api_workers: int = 1  # processos uvicorn; >1 pede embedding_service_socket
     openai_model: str = "openai/gpt-4o-mini"
     system_prompt: str = (
         "Você é um assistente RAG interno. Responda em português de forma direta. "
@@ -24,6 +71,21 @@ class Settings(BaseSettings):
         "Sempre cite a fonte no formato [fonte: <arquivo>#<chunk>]. "
         "Se não houver evidência suficiente, diga que não encontrou."
     )
+    # Sessões: histórico limitado por sessão, TTL de ociosidade e teto global de memória.
+    session_max_events: int = 50
+    session_max_tokens: int = 8000  # estimado (~4 bytes por token); 0 desativa
+    session_idle_ttl: float = 3600.0  # segundos
+    session_max_total_mb: int = 256
+    session_db_path: Optional[Path] = None  # ex.: data/processed/sessions.sqlite3
+
+    # Modo direto: busca antes e faz uma única chamada ao LLM com os trechos.
+    direct_rag: bool = False
+    direct_system_prompt: str = (
+        "Você é um assistente RAG interno. Responda em português de forma direta. "
+        "Use apenas os trechos recuperados abaixo. "
+        "Sempre cite a fonte no formato [fonte: <arquivo>#<chunk>]. "
+        "Se não houver evidência suficiente, diga que não encontrou."
+    )
 
     model_config = SettingsConfigDict(env_prefix="ADK_", extra="ignore")
 
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+
+from .chroma_setup import (
+    bump_generation,
+    collection_write_lock,
+    flush_collection,
+    get_collection,
+    reset_collection,
+)
+from .chroma_writer import WriteStats, chroma_writer
+from .columns import TextColumnWriter, text_column_reader
+from .embedding import get_engine
+from .manifest import FileRecord, IngestManifest
+from .settings import settings
+
+
+SNAPSHOT_VERSION = 1
+DTYPES = ("float16", "float32")
+
+# Metadados com coluna própria; outros campos vão para a coluna JSON "extra".
+_BASE_METADATA = ("source", "page", "chunk")
+
+
+class SnapshotError(Exception):
+    """Snapshot inválido ou incompatível com o encoder/coleção atuais."""
+
+
+def _engine_info() -> dict:
+    engine = get_engine()
+    return {
+        "model_path": engine.model_path,
+        "variant": engine.variant,
+        "normalize": engine.normalize,
+        "cache_namespace": engine.cache_namespace,
+    }
+
+
+def _iter_collection(batch_size: int) -> Iterator[dict]:
+    collection = get_collection()
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=batch_size,
+            offset=offset,
+        )
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+@collection_write_lock()
+def export_snapshot(
+    out_dir: Path | str,
+    *,
+    dtype: str = "float16",
+    batch_size: int = 5000,
+    progress: Callable[[int, int], None] | None = None,
+) -> dict:
+    """Grava a coleção inteira num snapshot colunar que pode ser aberto via mmap.
+
+    Embeddings vão para `embeddings.npy` (float16 ou float32); ids, textos e
+    fontes ficam em colunas de bytes com offsets, página/chunk em arrays
+    int32. `snapshot.json` guarda o encoder e o manifesto de ingestão, para o
+    nó importado não reindexar arquivos que não mudaram. Segura o lock de
+    escrita da coleção do início ao fim: a paginação por offset só é
+    consistente se ninguém inserir ou apagar no meio.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype inválido: {dtype} (use {'/'.join(DTYPES)})")
+    target = Path(out_dir)
+    if target.exists():
+        raise SnapshotError(f"{target} já existe")
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    started = time.perf_counter()
+    total = get_collection().count()
+    columns = {name: TextColumnWriter(tmp, name) for name in ("ids", "documents", "extra")}
+    sources: dict[str, int] = {}
+    source_codes = np.full(total, -1, dtype=np.int32)
+    pages = np.full(total, -1, dtype=np.int32)
+    chunks = np.full(total, -1, dtype=np.int32)
+    embeddings: np.ndarray | None = None
+    dimension = 0
+    rows = 0
+    has_extra = False
+    try:
+        for page in _iter_collection(batch_size):
+            take = min(len(page["ids"]), total - rows)  # escrita fora do lock (ex.: outro nó)
+            if take <= 0:
+                break
+            vectors = np.asarray(page["embeddings"][:take], dtype=np.float32)
+            if embeddings is None:
+                dimension = vectors.shape[1]
+                embeddings = np.lib.format.open_memmap(
+                    tmp / "embeddings.npy", mode="w+", dtype=dtype, shape=(total, dimension)
+                )
+            embeddings[rows : rows + take] = vectors
+            for i in range(take):
+                meta = page["metadatas"][i] or {}
+                columns["ids"].append(page["ids"][i])
+                columns["documents"].append(page["documents"][i] or "")
+                extra = {k: v for k, v in meta.items() if k not in _BASE_METADATA}
+                has_extra = has_extra or bool(extra)
+                columns["extra"].append(json.dumps(extra, ensure_ascii=False) if extra else "")
+                if (source := meta.get("source")) is not None:
+                    source_codes[rows + i] = sources.setdefault(source, len(sources))
+                if meta.get("page") is not None:
+                    pages[rows + i] = meta["page"]
+                if meta.get("chunk") is not None:
+                    chunks[rows + i] = meta["chunk"]
+            rows += take
+            if progress is not None:
+                progress(rows, total)
+    finally:
+        for column in columns.values():
+            column.close()
+
+    if embeddings is not None:
+        embeddings.flush()
+        if rows < total:
+            # A coleção encolheu: regrava só as linhas lidas, sem zeros no fim.
+            exact = np.lib.format.open_memmap(
+                tmp / "embeddings.npy.part", mode="w+", dtype=dtype, shape=(rows, dimension)
+            )
+            exact[:] = embeddings[:rows]
+            exact.flush()
+            del exact
+            del embeddings
+            os.replace(tmp / "embeddings.npy.part", tmp / "embeddings.npy")
+        else:
+            del embeddings
+    np.save(tmp / "source.npy", source_codes[:rows])
+    np.save(tmp / "page.npy", pages[:rows])
+    np.save(tmp / "chunk.npy", chunks[:rows])
+    if not has_extra:
+        for suffix in (".bin", ".offsets.npy"):
+            (tmp / f"extra{suffix}").unlink()
+
+    manifest = IngestManifest.load()
+    info = {
+        "version": SNAPSHOT_VERSION,
+        "collection": settings.collection_name,
+        "created_at": time.time(),
+        "rows": rows,
+        "dimension": dimension,
+        "dtype": dtype,
+        "embedding": _engine_info(),
+        "sources": list(sources),
+        "has_extra": has_extra,
+        "files": [asdict(r) for r in manifest],
+    }
+    (tmp / "snapshot.json").write_text(json.dumps(info, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, target)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "path": str(target),
+        "rows": rows,
+        "files": len(info["files"]),
+        "bytes": sum(p.stat().st_size for p in target.iterdir()),
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed else None,
+    }
+
+
+def load_info(folder: Path | str) -> dict:
+    path = Path(folder) / "snapshot.json"
+    if not path.exists():
+        raise SnapshotError(f"{folder} não é um snapshot (falta snapshot.json)")
+    info = json.loads(path.read_text(encoding="utf-8"))
+    if info.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Versão de snapshot não suportada: {info.get('version')}")
+    return info
+
+
+@collection_write_lock()
+def import_snapshot(
+    folder: Path | str,
+    *,
+    reset: bool = False,
+    batch_size: int = 20_000,
+    force: bool = False,
+    progress: Callable[[int, int], None] | None = None,
+) -> dict:
+    """Carrega um snapshot na coleção atual sem embedar nada.
+
+    As linhas são lidas do mmap em fatias de `batch_size` e enviadas com
+    `embeddings=` pelo `ChromaWriter` (lotes do tamanho do servidor, em
+    paralelo no Chroma remoto). Recusa snapshots de outro encoder, a menos
+    que `force`; o manifesto de ingestão do snapshot é mesclado ao local.
+    """
+    folder = Path(folder)
+    info = load_info(folder)
+    current = _engine_info()
+    if info["embedding"]["cache_namespace"] != current["cache_namespace"] and not force:
+        raise SnapshotError(
+            "Snapshot gerado com outro encoder: "
+            f"{info['embedding']['cache_namespace']!r} (atual {current['cache_namespace']!r})"
+        )
+
+    started = time.perf_counter()
+    if reset:
+        reset_collection()
+        chroma_writer().reset()
+
+    rows = info["rows"]
+    stats = WriteStats()
+    if rows:
+        embeddings = np.load(folder / "embeddings.npy", mmap_mode="r")
+        source_codes = np.load(folder / "source.npy", mmap_mode="r")
+        pages = np.load(folder / "page.npy", mmap_mode="r")
+        chunks = np.load(folder / "chunk.npy", mmap_mode="r")
+        read_ids = text_column_reader(folder, "ids")
+        read_docs = text_column_reader(folder, "documents")
+        read_extra = text_column_reader(folder, "extra") if info.get("has_extra") else None
+        sources = info["sources"]
+
+        for start in range(0, rows, batch_size):
+            stop = min(start + batch_size, rows)
+            extras = read_extra(start, stop) if read_extra else [""] * (stop - start)
+            metadatas = []
+            for i, extra in zip(range(start, stop), extras):
+                meta = json.loads(extra) if extra else {}
+                if source_codes[i] >= 0:
+                    meta["source"] = sources[source_codes[i]]
+                if pages[i] >= 0:
+                    meta["page"] = int(pages[i])
+                if chunks[i] >= 0:
+                    meta["chunk"] = int(chunks[i])
+                metadatas.append(meta)
+            stats.add(
+                chroma_writer().upsert(
+                    read_ids(start, stop),
+                    documents=read_docs(start, stop),
+                    embeddings=np.asarray(embeddings[start:stop], dtype=np.float32),
+                    metadatas=metadatas,
+                )
+            )
+            if progress is not None:
+                progress(stop, rows)
+        bump_generation()
+
+    flush_collection()
+    manifest = IngestManifest.load()
+    if reset:
+        manifest.clear()
+    for raw in info.get("files", []):
+        manifest.restore(FileRecord(**raw))
+    manifest.save()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "files": len(info.get("files", [])),
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed else None,
+        "upsert": stats.as_dict(),
+    }
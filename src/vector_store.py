@@ -0,0 +1,576 @@
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Callable, Protocol, Sequence
+
+import numpy as np
+
+from .columns import read_text_column, write_text_column
+from .file_lock import file_lock
+
+
+BACKENDS = ("chroma", "numpy")
+STORE_VERSION = 1
+
+# Metadados com coluna numérica própria; o resto vai para a coluna JSON "extra".
+_INT_FIELDS = ("page", "chunk")
+_MISSING = -1
+
+
+class VectorStore(Protocol):
+    """Parte da API de `chromadb.Collection` usada por `rag`/`snapshot`.
+
+    Qualquer backend de `get_collection()` precisa responder a estes métodos
+    com os mesmos formatos de retorno do Chroma (listas de listas no `query`,
+    listas planas no `get`; distância de cosseno).
+    """
+
+    def count(self) -> int: ...
+
+    def get(
+        self,
+        ids: Sequence[str] | None = None,
+        where: dict | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        include: Sequence[str] = ("documents", "metadatas"),
+    ) -> dict: ...
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: dict | None = None,
+        include: Sequence[str] = ("documents", "metadatas", "distances"),
+    ) -> dict: ...
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Any = None,
+        metadatas: Sequence[dict] | None = None,
+        documents: Sequence[str] | None = None,
+    ) -> None: ...
+
+    def delete(self, ids: Sequence[str] | None = None, where: dict | None = None) -> None: ...
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+_OPS: dict[str, Callable[[Any, Any], Any]] = {
+    "$eq": lambda col, v: col == v,
+    "$ne": lambda col, v: col != v,
+    "$gt": lambda col, v: col > v,
+    "$gte": lambda col, v: col >= v,
+    "$lt": lambda col, v: col < v,
+    "$lte": lambda col, v: col <= v,
+}
+
+
+class NumpyVectorStore:
+    """Busca exata por cosseno em memória, para coleções pequenas/médias.
+
+    Os embeddings ficam normalizados numa matriz (float32 ou float16) aberta
+    via mmap; ids, textos, fonte (codificada), página e chunk em colunas. A
+    busca é um único produto matriz-vetor(es) + `argpartition`, com filtros
+    `where` no formato do Chroma ($eq, $ne, $gt, $gte, $lt, $lte, $in, $nin,
+    $and, $or). Alterações ficam em memória e são gravadas de forma atômica
+    (pasta nova + troca do ponteiro `CURRENT`) após `persist_delay` segundos
+    sem escrita, ou na saída do processo. A gravação é serializada entre
+    processos por um `flock`; se outro processo gravou uma versão depois da
+    que foi carregada, ela é relida e as alterações locais são reaplicadas
+    por cima (última escrita de cada id vence).
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        *,
+        dtype: str = "float32",
+        persist_delay: float = 2.0,
+        embedding_function: Callable[[list[str]], Any] | None = None,
+    ) -> None:
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"dtype inválido: {dtype} (use float32/float16)")
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.persist_delay = persist_delay
+        self._embedding_function = embedding_function
+        self._lock = threading.RLock()
+        self._persist_lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+        self._dirty = False
+        self._version = 0  # geração carregada do disco / gravada por último
+        # Alterações desde a última gravação, para mesclar com outro processo.
+        self._touched: set[str] = set()
+        self._removed: set[str] = set()
+        self._cleared = False
+        self._pointer_mtime = 0
+        self._clear_state()
+        self._load()
+        atexit.register(self.persist)
+
+    # -- estado ---------------------------------------------------------------
+
+    def _clear_state(self) -> None:
+        self._size = 0
+        self._vectors = np.empty((0, 0), dtype=self.dtype)
+        self._ints = {name: np.empty(0, dtype=np.int32) for name in ("source",) + _INT_FIELDS}
+        self._ids: list[str] = []
+        self._documents: list[str] = []
+        self._extra: list[dict | None] = []
+        self._index: dict[str, int] = {}
+        self._sources: list[str] = []
+        self._source_codes: dict[str, int] = {}
+
+    def _load(self) -> None:
+        for attempt in range(3):
+            try:
+                return self._load_current()
+            except FileNotFoundError:
+                # Outro processo trocou `CURRENT` e apagou a pasta entre as leituras.
+                self._clear_state()
+                if attempt == 2:
+                    raise
+
+    def _load_current(self) -> None:
+        pointer = self.path / "CURRENT"
+        if not pointer.exists():
+            return
+        self._pointer_mtime = pointer.stat().st_mtime_ns
+        folder = self.path / pointer.read_text(encoding="utf-8").strip()
+        info = json.loads((folder / "store.json").read_text(encoding="utf-8"))
+        if info.get("version") != STORE_VERSION:
+            raise RuntimeError(f"Versão do vector store não suportada: {info.get('version')}")
+        self._version = info["generation"]
+        self._size = info["rows"]
+        if self._size:
+            # mmap somente leitura; a primeira escrita copia para memória.
+            self._vectors = np.load(folder / "embeddings.npy", mmap_mode="r")
+        if self._vectors.dtype != self.dtype and self._size:
+            self._vectors = self._vectors.astype(self.dtype)
+        for name in self._ints:
+            self._ints[name] = np.load(folder / f"{name}.npy")
+        self._ids = read_text_column(folder, "ids")
+        self._documents = read_text_column(folder, "documents")
+        self._extra = [json.loads(raw) if raw else None for raw in read_text_column(folder, "extra")]
+        self._index = {id_: i for i, id_ in enumerate(self._ids)}
+        self._sources = info["sources"]
+        self._source_codes = {s: i for i, s in enumerate(self._sources)}
+
+    def _ensure_capacity(self, rows: int, dim: int) -> None:
+        if self._vectors.shape[1:] != (dim,) and self._size:
+            raise ValueError(f"Dimensão {dim} diferente da coleção ({self._vectors.shape[1]})")
+        same_dim = self._vectors.shape[1:] == (dim,)
+        capacity = self._vectors.shape[0] if same_dim else 0
+        if rows <= capacity and not isinstance(self._vectors, np.memmap):
+            return
+        new_capacity = max(rows, capacity * 2, 1024)
+        vectors = np.zeros((new_capacity, dim), dtype=self.dtype)
+        if self._size:
+            vectors[: self._size] = self._vectors[: self._size]
+        self._vectors = vectors
+        for name, column in self._ints.items():
+            grown = np.full(new_capacity, _MISSING, dtype=np.int32)
+            grown[: self._size] = column[: self._size]
+            self._ints[name] = grown
+
+    def _mark_dirty(self) -> None:
+        self._dirty = True
+        if self.persist_delay <= 0:
+            return  # gravado pelo chamador, fora do lock
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.persist_delay, self.persist)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh(self) -> None:
+        """Recarrega se outro processo (ex.: `cli ingest`) gravou uma versão nova."""
+        if self._dirty:
+            return
+        try:
+            mtime = (self.path / "CURRENT").stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._pointer_mtime:
+            with self._lock:
+                if not self._dirty and mtime != self._pointer_mtime:
+                    self._clear_state()
+                    self._load()
+
+    # -- API no formato do Chroma ---------------------------------------------
+
+    def count(self) -> int:
+        self._refresh()
+        return self._size
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Any = None,
+        metadatas: Sequence[dict] | None = None,
+        documents: Sequence[str] | None = None,
+    ) -> None:
+        if not ids:
+            return
+        if embeddings is None:
+            if documents is None or self._embedding_function is None:
+                raise ValueError("upsert sem embeddings exige documents e embedding_function")
+            embeddings = self._embedding_function(list(documents))
+        vectors = _normalize(embeddings)
+        if len(vectors) != len(ids):
+            raise ValueError("ids e embeddings com tamanhos diferentes")
+
+        with self._lock:
+            self._apply_upsert(ids, vectors, metadatas, documents)
+            self._touched.update(ids)
+            self._removed.difference_update(ids)
+            self._mark_dirty()
+        if self.persist_delay <= 0:
+            self.persist()
+
+    def _apply_upsert(
+        self,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        metadatas: Sequence[dict] | None,
+        documents: Sequence[str] | None,
+    ) -> None:
+        new = [id_ for id_ in dict.fromkeys(ids) if id_ not in self._index]
+        self._ensure_capacity(self._size + len(new), vectors.shape[1])
+        for id_ in new:
+            self._index[id_] = self._size
+            self._ids.append(id_)
+            self._documents.append("")
+            self._extra.append(None)
+            self._size += 1
+        rows = np.fromiter((self._index[id_] for id_ in ids), dtype=np.int64, count=len(ids))
+        self._vectors[rows] = vectors.astype(self.dtype)
+        for n, row in enumerate(rows.tolist()):
+            if documents is not None:
+                self._documents[row] = documents[n] or ""
+            if metadatas is not None:
+                self._set_metadata(row, metadatas[n] or {})
+
+    def _set_metadata(self, row: int, meta: dict) -> None:
+        source = meta.get("source")
+        if source is None:
+            self._ints["source"][row] = _MISSING
+        else:
+            code = self._source_codes.get(source)
+            if code is None:
+                code = self._source_codes[source] = len(self._sources)
+                self._sources.append(source)
+            self._ints["source"][row] = code
+        for name in _INT_FIELDS:
+            value = meta.get(name)
+            self._ints[name][row] = _MISSING if value is None else int(value)
+        extra = {k: v for k, v in meta.items() if k != "source" and k not in _INT_FIELDS}
+        self._extra[row] = extra or None
+
+    def delete(self, ids: Sequence[str] | None = None, where: dict | None = None) -> None:
+        with self._lock:
+            if ids is not None:
+                rows = {self._index[i] for i in ids if i in self._index}
+            else:
+                rows = set()
+            if where:
+                mask = self._where_mask(where)
+                candidates = np.flatnonzero(mask)
+                rows = set(candidates.tolist()) if ids is None else rows & set(candidates.tolist())
+            if not rows:
+                return
+            gone = [self._ids[r] for r in rows]
+            self._apply_delete(rows)
+            self._removed.update(gone)
+            self._touched.difference_update(gone)
+            self._mark_dirty()
+        if self.persist_delay <= 0:
+            self.persist()
+
+    def _apply_delete(self, rows: set[int]) -> None:
+        self._ensure_capacity(self._size, self._vectors.shape[1])  # sai do mmap
+        # Remove trocando pela última linha: O(1) por linha, sem buracos.
+        for row in sorted(rows, reverse=True):
+            last = self._size - 1
+            removed = self._ids[row]
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                for column in self._ints.values():
+                    column[row] = column[last]
+                self._ids[row] = self._ids[last]
+                self._documents[row] = self._documents[last]
+                self._extra[row] = self._extra[last]
+                self._index[self._ids[row]] = row
+            self._ids.pop()
+            self._documents.pop()
+            self._extra.pop()
+            del self._index[removed]
+            self._size -= 1
+
+    def _metadata(self, row: int) -> dict:
+        meta: dict = dict(self._extra[row] or {})
+        code = int(self._ints["source"][row])
+        if code != _MISSING:
+            meta["source"] = self._sources[code]
+        for name in _INT_FIELDS:
+            value = int(self._ints[name][row])
+            if value != _MISSING:
+                meta[name] = value
+        return meta
+
+    def _column(self, key: str) -> np.ndarray:
+        if key in _INT_FIELDS:
+            return self._ints[key][: self._size]
+        if key == "source":
+            return np.asarray(
+                [self._sources[c] if c != _MISSING else None for c in self._ints["source"][: self._size]],
+                dtype=object,
+            )
+        return np.asarray([(e or {}).get(key) for e in self._extra[: self._size]], dtype=object)
+
+    def _where_mask(self, where: dict) -> np.ndarray:
+        mask = np.ones(self._size, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for sub in condition:
+                    mask &= self._where_mask(sub)
+                continue
+            if key == "$or":
+                any_mask = np.zeros(self._size, dtype=bool)
+                for sub in condition:
+                    any_mask |= self._where_mask(sub)
+                mask &= any_mask
+                continue
+            if key == "source" and not isinstance(condition, dict):
+                # Caso comum: compara códigos inteiros em vez de strings.
+                code = self._source_codes.get(condition, -2)
+                mask &= self._ints["source"][: self._size] == code
+                continue
+            column = self._column(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, value in condition.items():
+                if op in ("$in", "$nin"):
+                    hit = np.isin(column, list(value))
+                    mask &= hit if op == "$in" else ~hit
+                elif op in _OPS:
+                    mask &= np.asarray(_OPS[op](column, value), dtype=bool)
+                else:
+                    raise ValueError(f"Operador de filtro não suportado: {op}")
+        return mask
+
+    def get(
+        self,
+        ids: Sequence[str] | None = None,
+        where: dict | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        include: Sequence[str] = ("documents", "metadatas"),
+    ) -> dict:
+        self._refresh()
+        with self._lock:
+            if ids is not None:
+                rows = [self._index[i] for i in ids if i in self._index]
+            else:
+                rows = list(range(self._size))
+            if where:
+                mask = self._where_mask(where)
+                rows = [r for r in rows if mask[r]]
+            start = offset or 0
+            rows = rows[start : start + limit if limit is not None else None]
+            return self._rows(rows, include)
+
+    def _rows(self, rows: list[int], include: Sequence[str]) -> dict:
+        out: dict[str, Any] = {"ids": [self._ids[r] for r in rows]}
+        out["documents"] = [self._documents[r] for r in rows] if "documents" in include else None
+        out["metadatas"] = [self._metadata(r) for r in rows] if "metadatas" in include else None
+        out["embeddings"] = (
+            np.asarray(self._vectors[rows], dtype=np.float32) if "embeddings" in include else None
+        )
+        return out
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: dict | None = None,
+        include: Sequence[str] = ("documents", "metadatas", "distances"),
+    ) -> dict:
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        self._refresh()
+        with self._lock:
+            size = self._size
+            result: dict[str, list] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            if not size:
+                for key in result:
+                    result[key] = [[] for _ in queries]
+                return result
+            # Um único produto (consultas x linhas); float16 é convertido na multiplicação.
+            scores = queries @ np.asarray(self._vectors[:size], dtype=np.float32).T
+            valid = size
+            if where:
+                mask = self._where_mask(where)
+                valid = int(mask.sum())
+                scores[:, ~mask] = -np.inf
+            k = max(0, min(n_results, valid))
+            if k == 0:
+                top = np.empty((len(queries), 0), dtype=np.int64)
+            elif k < size:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(size), (len(queries), size)).copy()
+            order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+            top = np.take_along_axis(top, order, axis=1)
+            for q, rows in enumerate(top.tolist()):
+                part = self._rows(rows, include)
+                result["ids"].append(part["ids"])
+                result["documents"].append(part["documents"] or [])
+                result["metadatas"].append(part["metadatas"] or [])
+                result["distances"].append((1.0 - scores[q, rows]).tolist())
+            return result
+
+    # -- persistência ---------------------------------------------------------
+
+    def _disk_generation(self) -> int:
+        """Geração apontada por `CURRENT` agora (0 se nada foi gravado)."""
+        try:
+            name = (self.path / "CURRENT").read_text(encoding="utf-8").strip()
+            info = json.loads((self.path / name / "store.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return 0
+        return int(info.get("generation", 0))
+
+    def _merge_from_disk(self) -> None:
+        """Relê a versão gravada por outro processo e reaplica as alterações locais."""
+        rows = [self._index[i] for i in self._touched if i in self._index]
+        ids = [self._ids[r] for r in rows]
+        vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+        metadatas = [self._metadata(r) for r in rows]
+        documents = [self._documents[r] for r in rows]
+        removed = set(self._removed)
+        self._clear_state()
+        self._load()
+        if ids:
+            self._apply_upsert(ids, vectors, metadatas, documents)
+        gone = {self._index[i] for i in removed if i in self._index}
+        if gone:
+            self._apply_delete(gone)
+
+    def persist(self) -> None:
+        """Grava o estado numa pasta nova e troca `CURRENT` para ela (atômico).
+
+        Serializado entre processos pelo `flock` em `<path>/.lock`. O estado é
+        copiado sob o lock da instância e gravado fora dele, sem travar buscas.
+        """
+        with self._persist_lock, file_lock(self.path / ".lock"):
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                on_disk = self._disk_generation()
+                if on_disk > self._version and not self._cleared:
+                    self._merge_from_disk()
+                size = self._size
+                vectors = np.array(self._vectors[:size], dtype=self.dtype)
+                ints = {name: column[:size].copy() for name, column in self._ints.items()}
+                ids, documents, extra = list(self._ids), list(self._documents), list(self._extra)
+                sources = list(self._sources)
+                pending = (self._touched, self._removed, self._cleared)
+                self._touched, self._removed, self._cleared = set(), set(), False
+                generation = max(on_disk, self._version) + 1
+                self._dirty = False
+            try:
+                self._write(generation, size, vectors, ints, ids, documents, extra, sources)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                    self._touched |= pending[0]
+                    self._removed |= pending[1]
+                    self._cleared = self._cleared or pending[2]
+                raise
+            self._version = generation
+
+    def _write(self, generation, size, vectors, ints, ids, documents, extra, sources) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        pointer = self.path / "CURRENT"
+        old = pointer.read_text(encoding="utf-8").strip() if pointer.exists() else None
+        # pid no nome: sem flock (Windows) dois processos nunca gravam na mesma pasta.
+        name = f"v{generation}-{os.getpid()}"
+        folder = self.path / name
+        shutil.rmtree(folder, ignore_errors=True)
+        folder.mkdir()
+
+        if size:
+            np.save(folder / "embeddings.npy", vectors)
+        for column, values in ints.items():
+            np.save(folder / f"{column}.npy", values)
+        write_text_column(folder, "ids", ids)
+        write_text_column(folder, "documents", documents)
+        write_text_column(
+            folder, "extra", (json.dumps(e, ensure_ascii=False) if e else "" for e in extra)
+        )
+        info = {
+            "version": STORE_VERSION,
+            "generation": generation,
+            "rows": size,
+            "dtype": self.dtype.name,
+            "sources": sources,
+        }
+        (folder / "store.json").write_text(json.dumps(info, ensure_ascii=False), encoding="utf-8")
+
+        tmp = self.path / f"CURRENT.{os.getpid()}.tmp"
+        tmp.write_text(name, encoding="utf-8")
+        os.replace(tmp, pointer)
+        self._pointer_mtime = pointer.stat().st_mtime_ns
+        if old and old != name:
+            shutil.rmtree(self.path / old, ignore_errors=True)
+
+    def clear(self) -> None:
+        """Esvazia a coleção (equivale ao `delete_collection` do Chroma)."""
+        with self._lock:
+            self._clear_state()
+            self._touched.clear()
+            self._removed.clear()
+            self._cleared = True
+            self._dirty = True
+        self.persist()
+
+
+_stores: dict[str, NumpyVectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def numpy_store(
+    name: str,
+    *,
+    root: Path,
+    dtype: str,
+    persist_delay: float,
+    embedding_function: Callable[[list[str]], Any] | None = None,
+) -> NumpyVectorStore:
+    """Uma instância por coleção no processo (o estado vive em memória)."""
+    with _stores_lock:
+        store = _stores.get(name)
+        if store is None:
+            store = _stores[name] = NumpyVectorStore(
+                root / name,
+                dtype=dtype,
+                persist_delay=persist_delay,
+                embedding_function=embedding_function,
+            )
+        return store
@@ -1,30 +1,149 @@
 from __future__ import annotations
 
 import asyncio
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable
 
 from watchfiles import awatch
 
-from .rag import ingest_paths
+from .chunker import is_supported_file
+from .rag import sync_paths
 from .settings import settings
 
 
+@dataclass
+class _Pending:
+    last_event: float
+    stat: tuple[int, float] | None = None
+    stat_since: float = 0.0
+
+
+@dataclass
+class _Batch:
+    changed: set[Path] = field(default_factory=set)
+    deleted: set[Path] = field(default_factory=set)
+
+    def __bool__(self) -> bool:
+        return bool(self.changed or self.deleted)
+
+
+def _stat(path: Path) -> tuple[int, float] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime
+
+
+def _collect_ready(pending: dict[Path, _Pending], now: float, settle: float) -> _Batch:
+    """Separa os caminhos estáveis: sem eventos e com tamanho/mtime parados há `settle` s.
+
+    Exclusões esperam os demais caminhos estabilizarem (até 5x `settle`) para
+    que a metade "nova" de uma renomeação caia no mesmo lote.
+    """
+    batch = _Batch()
+    deleted: list[Path] = []
+    for path, item in list(pending.items()):
+        if now - item.last_event < settle:
+            continue
+        current = _stat(path)
+        if current is None:
+            deleted.append(path)
+            continue
+        if current != item.stat:
+            # Ainda sendo copiado (ou primeira verificação): espera mais um ciclo.
+            item.stat, item.stat_since = current, now
+            continue
+        if now - item.stat_since >= settle:
+            batch.changed.add(path)
+            del pending[path]
+
+    settling = len(pending) - len(deleted)
+    for path in deleted:
+        if settling and now - pending[path].last_event < settle * 5:
+            continue
+        batch.deleted.add(path)
+        del pending[path]
+    return batch
+
+
+async def _worker(
+    work: "asyncio.Queue[_Batch]",
+    *,
+    chunk_size: int | None,
+    overlap: int | None,
+    mode: str | None,
+) -> None:
+    """Consome lotes fora do event loop, um por vez."""
+    while True:
+        batch = await work.get()
+        started = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(
+                sync_paths,
+                sorted(batch.changed),
+                sorted(batch.deleted),
+                chunk_size=chunk_size,
+                overlap=overlap,
+                mode=mode,
+            )
+            print(
+                f"Ingestão automática: {result} "
+                f"({time.perf_counter() - started:.1f}s, fila: {work.qsize()})"
+            )
+        except Exception as exc:
+            print(f"Falha na ingestão automática: {type(exc).__name__}: {exc}")
+        finally:
+            work.task_done()
+
+
 async def watch_folder(
     folder: Path | str = settings.data_dir,
     *,
-    chunk_size: int = settings.chunk_size,
-    overlap: int = settings.chunk_overlap,
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    mode: str | None = None,
+    settle: float = settings.watch_settle_seconds,
+    queue_size: int = settings.watch_queue_size,
 ) -> None:
-    """Observa a pasta e reindexa quando novos arquivos chegam."""
+    """Observa a pasta e reindexa quando arquivos chegam, mudam ou somem.
+
+    Eventos são agrupados por caminho até o arquivo estabilizar (cópias em
+    andamento não são lidas pela metade); exclusões removem os chunks e
+    renomeações migram os ids. A indexação roda num worker em segundo plano
+    com fila limitada: se ele atrasar, a leitura de eventos espera.
+    """
     base = Path(folder)
     base.mkdir(parents=True, exist_ok=True)
     print(f"👀 Observando {base} por PDFs/TXTs novos...")
 
-    async for changes in awatch(base):
-        paths = {Path(path) for _, path in changes}
-        result = ingest_paths(paths, chunk_size=chunk_size, overlap=overlap)
-        print(f"Ingestão automática: {result}")
+    pending: dict[Path, _Pending] = {}
+    work: asyncio.Queue[_Batch] = asyncio.Queue(maxsize=max(1, queue_size))
+    worker = asyncio.create_task(
+        _worker(work, chunk_size=chunk_size, overlap=overlap, mode=mode)
+    )
+    tick_ms = max(100, int(settle * 1000 / 2))
+    try:
+        async for changes in awatch(base, rust_timeout=tick_ms, yield_on_timeout=True):
+            now = time.monotonic()
+            for _, raw in changes:
+                path = Path(raw)
+                if not is_supported_file(path):
+                    continue
+                item = pending.get(path)
+                if item is None:
+                    pending[path] = _Pending(last_event=now)
+                else:
+                    item.last_event = now
+
+            batch = _collect_ready(pending, now, settle)
+            if batch:
+                if work.full():
+                    print(f"Fila de indexação cheia ({work.qsize()}), aguardando...")
+                await work.put(batch)
+    finally:
+        worker.cancel()
 
 
 def run_watcher() -> None:
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import hashlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src import chroma_setup, chroma_writer, embedding, rag, snapshot, vector_store
+from src.settings import settings
+
+
+class FakeEngine(embedding.EmbeddingEngine):
+    """Encoder determinístico (hash do texto), sem carregar modelo."""
+
+    dim = 16
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__("fake-model", batch_size=8, **kwargs)
+        self.encoded = 0
+
+    def _encode_batch(self, texts):
+        self.encoded += len(texts)
+        out = []
+        for text in texts:
+            seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+            out.append(np.random.default_rng(seed).standard_normal(self.dim))
+        return np.stack(out).astype(np.float32)
+
+    @property
+    def dimension(self) -> int:
+        return self.dim
+
+    @property
+    def model(self):
+        return self  # nada a carregar
+
+
+def _clear_caches() -> None:
+    chroma_setup._embedding_function.cache_clear()
+    chroma_writer.chroma_writer.cache_clear()
+    rag.query_batcher.cache_clear()
+    rag._search_results.clear()
+    rag._query_vectors.clear()
+
+
+@pytest.fixture
+def rag_env(tmp_path, monkeypatch):
+    """Settings apontando para `tmp_path`, backend numpy e encoder falso.
+
+    Entrega `docs` (pasta vazia para os arquivos) e `engine` (o encoder).
+    """
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    processed = tmp_path / "processed"
+    monkeypatch.setattr(settings, "vector_backend", "numpy")
+    monkeypatch.setattr(settings, "chroma_host", None)
+    monkeypatch.setattr(settings, "vector_store_path", tmp_path / "vectors")
+    monkeypatch.setattr(settings, "vector_store_persist_delay", 0.0)
+    monkeypatch.setattr(settings, "processed_dir", processed)
+    monkeypatch.setattr(settings, "manifest_path", processed / "ingest_manifest.json")
+    monkeypatch.setattr(settings, "collection_name", "test_docs")
+    monkeypatch.setattr(settings, "ingest_workers", 1)
+    monkeypatch.setattr(vector_store, "_stores", {})
+
+    engine = FakeEngine()
+    for module in (embedding, rag, chroma_setup, snapshot):
+        monkeypatch.setattr(module, "get_engine", lambda: engine)
+    _clear_caches()
+    yield SimpleNamespace(docs=docs, engine=engine)
+    _clear_caches()
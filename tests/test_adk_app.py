@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from src.adk_app import _cache_scope
+from src.settings import settings
+
+AGENT = SimpleNamespace(instruction="Responda com citações.", model="openai/gpt-4o-mini")
+
+
+def test_agent_mode_scope_ignores_top_k():
+    scopes = {_cache_scope(AGENT, direct=False, top_k=k) for k in (None, 3, 8)}
+    assert len(scopes) == 1
+
+
+def test_direct_mode_scope_depends_on_effective_top_k():
+    default = _cache_scope(AGENT, direct=True, top_k=None)
+    assert default == _cache_scope(AGENT, direct=True, top_k=settings.top_k)
+    assert default != _cache_scope(AGENT, direct=True, top_k=settings.top_k + 1)
+    assert default != _cache_scope(AGENT, direct=False, top_k=None)
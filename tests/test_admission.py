@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from src.admission import AdmissionController, Rejected
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_waiting_users_are_served_round_robin():
+    async def scenario():
+        controller = AdmissionController(1, queue_size=10, per_user=10, timeout=5)
+        holder = await controller.acquire("x")
+        order: list[str] = []
+
+        async def ask(user: str) -> None:
+            ticket = await controller.acquire(user)
+            order.append(user)
+            await asyncio.sleep(0)
+            ticket.release()
+
+        tasks = []
+        for user in ("a", "a", "a", "b", "c"):
+            tasks.append(asyncio.create_task(ask(user)))
+            await asyncio.sleep(0)  # enfileira na ordem de chegada
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order, controller.stats()
+
+    order, stats = _run(scenario())
+    assert order == ["a", "b", "c", "a", "a"]
+    assert stats["active"] == 0 and stats["waiting"] == 0 and stats["admitted"] == 6
+
+
+def test_user_quota_and_full_queue_are_rejected():
+    async def scenario():
+        controller = AdmissionController(1, queue_size=3, per_user=2, timeout=5)
+        holder = await controller.acquire("x")
+        waiting = [asyncio.create_task(controller.acquire("a")) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as quota:
+            await controller.acquire("a")
+        waiting.append(asyncio.create_task(controller.acquire("b")))
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as full:
+            await controller.acquire("c")
+        holder.release()
+        for next_ticket in asyncio.as_completed(waiting):
+            (await next_ticket).release()
+        return quota.value, full.value, controller
+
+    quota, full, controller = _run(scenario())
+    assert (quota.status, quota.reason) == (429, "user_quota")
+    assert (full.status, full.reason) == (503, "queue_full")
+    assert quota.retry_after >= 1 and full.retry_after >= 1
+    assert controller.rejected == {"queue_full": 1, "user_quota": 1, "timeout": 0}
+    assert controller.active == 0 and controller.waiting == 0
+
+
+def test_timeout_leaves_the_queue_clean():
+    async def scenario():
+        controller = AdmissionController(1, queue_size=5, timeout=0.05)
+        holder = await controller.acquire("x")
+        with pytest.raises(Rejected) as timeout:
+            await controller.acquire("a")
+        stats = controller.stats()
+        holder.release()
+        ticket = await controller.acquire("a")  # vaga livre: entra direto
+        ticket.release()
+        return timeout.value, stats, controller
+
+    timeout, stats, controller = _run(scenario())
+    assert (timeout.status, timeout.reason) == (503, "timeout")
+    assert stats["waiting"] == 0 and stats["waiting_users"] == 0
+    assert controller.active == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        controller = AdmissionController(1, queue_size=5, timeout=5)
+        holder = await controller.acquire("x")
+        waiter = asyncio.create_task(controller.acquire("a"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        holder.release()
+        holder.release()  # idempotente
+        return controller
+
+    controller = _run(scenario())
+    assert controller.active == 0 and controller.waiting == 0
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import warnings
+
+import chromadb
+import numpy as np
+
+from src import chroma_setup
+from src.chroma_setup import EngineEmbeddingFunction
+from tests.conftest import FakeEngine
+
+
+def test_embedding_function_keeps_the_sentence_transformer_config(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(chroma_setup, "get_engine", lambda: engine)  # build_from_config
+    ef = EngineEmbeddingFunction(engine)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # nada de métodos "legacy" do Chroma
+        assert not ef.is_legacy()
+        assert ef.name() == "sentence_transformer"
+        config = ef.get_config()
+        EngineEmbeddingFunction.validate_config(config)
+
+    assert EngineEmbeddingFunction.build_from_config(config)._engine is engine
+    assert config == {
+        "model_name": "fake-model",
+        "device": "cpu",
+        "normalize_embeddings": False,
+        "kwargs": {},
+    }
+    vectors = ef(["um texto", "outro"])
+    np.testing.assert_array_equal(np.stack(vectors), engine.encode(["um texto", "outro"]))
+
+
+def test_collection_reopens_with_the_engine_function(tmp_path):
+    engine = FakeEngine()
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    collection = client.get_or_create_collection(
+        "docs", embedding_function=EngineEmbeddingFunction(engine), metadata={"hnsw:space": "cosine"}
+    )
+    collection.add(ids=["a", "b"], documents=["primeiro texto", "segundo texto"])
+
+    reopened = client.get_or_create_collection(
+        "docs", embedding_function=EngineEmbeddingFunction(engine)
+    )
+    hits = reopened.query(query_texts=["primeiro texto"], n_results=1)
+
+    assert hits["ids"] == [["a"]]
+    assert reopened.configuration_json["embedding_function"]["name"] == "sentence_transformer"
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import httpx
+import pytest
+from chromadb.errors import InvalidArgumentError, NotFoundError
+
+from src import chroma_writer as writer_module
+from src.chroma_writer import ChromaWriter, WriteStats, _is_transient
+
+
+def _status_error(status: int, body: str = "") -> Exception:
+    """Reproduz o `Exception(resp.text)` do cliente HTTP do Chroma."""
+    request = httpx.Request("POST", "http://chroma/api")
+    response = httpx.Response(status, text=body, request=request)
+    try:
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError:
+            raise Exception(response.text)
+    except Exception as exc:
+        return exc
+
+
+def test_only_transient_errors_are_retried():
+    assert _is_transient(_status_error(502))
+    assert _is_transient(_status_error(503, "<html>Service Unavailable</html>"))
+    assert _is_transient(httpx.ConnectError("recusada"))
+    assert _is_transient(NotFoundError("coleção sumiu"))
+    assert _is_transient(Exception(""))
+
+    assert not _is_transient(_status_error(400, "bad request"))
+    assert not _is_transient(_status_error(413))
+    assert not _is_transient(Exception("bug no cliente"))
+    assert not _is_transient(ValueError("dimensão errada"))
+    assert not _is_transient(InvalidArgumentError("ids duplicados"))
+
+
+class _Collection:
+    def __init__(self, errors: list[Exception]) -> None:
+        self.errors = errors
+        self.upserts = 0
+
+    def upsert(self, **batch) -> None:
+        if self.errors:
+            raise self.errors.pop(0)
+        self.upserts += 1
+
+
+@pytest.fixture
+def writer(rag_env, monkeypatch):
+    errors: list[Exception] = []
+    opened: list[_Collection] = []
+
+    def open_collection():
+        opened.append(_Collection(errors))  # falhas pendentes valem para qualquer reabertura
+        return opened[-1]
+
+    monkeypatch.setattr(writer_module, "get_collection", open_collection)
+    writer = ChromaWriter(retries=3, backoff=0)
+    writer.opened, writer.errors = opened, errors
+    return writer
+
+
+def test_collection_is_reopened_only_after_not_found(writer):
+    writer.errors.extend([_status_error(502), _status_error(504)])
+    stats = WriteStats()
+    writer._call(lambda c: c.upsert(ids=["a"]), stats)
+    assert stats.retries == 2
+    assert len(writer.opened) == 1
+
+    writer.errors.append(NotFoundError("recriada"))
+    writer._call(lambda c: c.upsert(ids=["a"]), stats)
+    assert len(writer.opened) == 2
+    assert writer.opened[-1].upserts == 1
+
+
+def test_permanent_error_is_raised_at_once(writer):
+    writer.errors.append(Exception("bug no cliente"))
+    stats = WriteStats()
+    with pytest.raises(Exception, match="bug no cliente"):
+        writer._call(lambda c: c.upsert(ids=["a"]), stats)
+    assert stats.retries == 0
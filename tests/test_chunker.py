@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from src import chunker
+from src.chunker import chunk_text_tokens, resolve_chunking
+from src.settings import settings
+
+
+class WordTokenizer:
+    """Um token por palavra ou pontuação, com offsets como os do `tokenizers`."""
+
+    def encode(self, text: str, add_special_tokens: bool = False):
+        return SimpleNamespace(
+            offsets=[m.span() for m in re.finditer(r"\w+|[^\w\s]", text)]
+        )
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text).offsets)
+
+
+TOKENIZER = WordTokenizer()
+
+
+def _sentences(n: int) -> list[str]:
+    return [f"s{i}a s{i}b s{i}c s{i}d." for i in range(n)]  # 5 tokens cada
+
+
+def test_chunks_respect_size_and_end_on_sentences():
+    text = " ".join(_sentences(20))
+    chunks = chunk_text_tokens(text, 16, 6, TOKENIZER)
+
+    assert len(chunks) > 1
+    assert all(TOKENIZER.count(c) <= 16 for c in chunks)
+    assert all(c.endswith(".") for c in chunks)
+    assert all(re.match(r"s\d+a ", c) for c in chunks)  # começam numa frase
+
+
+def test_overlap_repeats_the_last_sentence():
+    text = " ".join(_sentences(20))
+    chunks = chunk_text_tokens(text, 16, 6, TOKENIZER)
+
+    for prev, nxt in zip(chunks, chunks[1:]):
+        first_sentence = nxt[: nxt.index(".") + 1]
+        assert prev.endswith(first_sentence)
+    words = {w for c in chunks for w in re.findall(r"\w+", c)}
+    assert words == set(re.findall(r"\w+", text))
+
+
+def test_paragraph_break_wins_over_sentence_end():
+    first = " ".join(_sentences(2))  # 10 tokens, > metade da janela
+    text = first + "\n\n" + " ".join(_sentences(6)[2:])
+    chunks = chunk_text_tokens(text, 16, 0, TOKENIZER)
+
+    assert chunks[0] == first
+
+
+def test_overlap_must_be_smaller_than_size():
+    with pytest.raises(ValueError):
+        chunk_text_tokens("a b c", 4, 4, TOKENIZER)
+
+
+def test_resolve_chunking_clamps_overlap_in_both_modes(monkeypatch):
+    monkeypatch.setattr(chunker, "max_tokens", lambda: 128)
+    monkeypatch.setattr(settings, "chunk_overlap", 200)
+    monkeypatch.setattr(settings, "chunk_overlap_tokens", 64)
+
+    assert resolve_chunking("chars", 400, None) == ("chars", 400, 100)
+    assert resolve_chunking("chars", 400, 500) == ("chars", 400, 399)
+    assert resolve_chunking("chars", 1000, 150) == ("chars", 1000, 150)
+    assert resolve_chunking("tokens", 1000, None) == ("tokens", 128, 32)
+    assert resolve_chunking("tokens", 64, 80) == ("tokens", 64, 63)
+
+
+def test_resolve_chunking_minimum_depends_on_mode(monkeypatch):
+    monkeypatch.setattr(chunker, "max_tokens", lambda: 128)
+
+    assert resolve_chunking("tokens", 32, 0)[1] == 32
+    with pytest.raises(ValueError, match="mínimo"):
+        resolve_chunking("chars", 32, 0)
+    with pytest.raises(ValueError, match="mínimo"):
+        resolve_chunking("tokens", 16, 0)
+    with pytest.raises(ValueError, match="negativo"):
+        resolve_chunking("chars", 400, -1)
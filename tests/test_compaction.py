@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from src.compaction import compact_hits, merge_adjacent
+
+
+def _hit(chunk, text, *, source="a.pdf", page=1, distance=0.5):
+    return {"source": source, "page": page, "chunk": chunk, "text": text, "distance": distance}
+
+
+SHARED = "o trecho que os dois chunks compartilham no meio"
+
+
+def test_consecutive_chunks_merge_without_repeating_overlap():
+    hits = [
+        _hit(4, f"{SHARED} e depois segue", distance=0.3),
+        _hit(3, f"começa aqui e {SHARED}", distance=0.2),
+    ]
+
+    [segment] = merge_adjacent(hits)
+
+    assert segment["chunks"] == [3, 4]
+    assert segment["text"] == f"começa aqui e {SHARED} e depois segue"
+    assert segment["distance"] == 0.2 and segment["rank"] == 0
+
+
+def test_short_coincidental_overlap_is_not_removed():
+    [segment] = merge_adjacent([_hit(0, "fim do dado"), _hit(1, "do dado seguinte")])
+    assert segment["text"] == "fim do dado do dado seguinte"
+
+
+def test_gaps_pages_and_sources_stay_separate():
+    hits = [
+        _hit(1, "um"),
+        _hit(3, "três"),  # pulou o chunk 2
+        _hit(2, "dois", page=2),
+        _hit(2, "dois", source="b.pdf"),
+    ]
+
+    segments = merge_adjacent(hits)
+
+    assert [s["chunks"] for s in segments] == [[1], [3], [2], [2]]
+    assert [s["rank"] for s in segments] == [0, 1, 2, 3]
+
+
+def test_hits_without_chunk_or_source_pass_through_in_order():
+    hits = [
+        {"text": "sem origem", "distance": 0.1},
+        _hit(0, "início"),
+        _hit(1, "fim"),
+        {"source": "c.txt", "text": "sem chunk"},
+    ]
+
+    segments = merge_adjacent(hits)
+
+    assert [s["text"] for s in segments] == ["sem origem", "início fim", "sem chunk"]
+    assert segments[0]["chunks"] == [None] and segments[1]["chunks"] == [0, 1]
+
+
+def test_compact_hits_reports_merged_and_respects_budget():
+    hits = [_hit(0, "aaa bbb"), _hit(1, "bbb ccc"), _hit(5, "xxx " * 50, distance=0.9)]
+
+    result = compact_hits(
+        hits,
+        format_hit=lambda h: h.get("text", ""),
+        budget=20,
+        mmr_lambda=1.0,
+        count_tokens=lambda text: len(text.split()),
+    )
+
+    assert result.merged == 1 and result.dropped == 1
+    assert [h["chunks"] for h in result.hits] == [[0, 1]]
+    assert result.tokens_after <= 20 < result.tokens_before
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import numpy as np
+
+from src.embedding_cache import EmbeddingCache, cache_key
+
+MODEL = "fake-model"
+
+
+def _keys(*texts: str) -> list[bytes]:
+    return [cache_key(t, MODEL) for t in texts]
+
+
+def _vectors(n: int, dim: int = 4, start: int = 0) -> np.ndarray:
+    return np.arange(start, start + n * dim, dtype=np.float32).reshape(n, dim)
+
+
+def test_vectors_survive_reopen(tmp_path):
+    cache = EmbeddingCache(tmp_path, MODEL, capacity=10)
+    keys = _keys("a", "b", "c")
+    cache.put_many(keys, _vectors(3))
+    cache.flush()
+
+    reopened = EmbeddingCache(tmp_path, MODEL, capacity=10)
+    found = reopened.get_many(keys + _keys("d"))
+
+    assert sorted(found) == [0, 1, 2]
+    np.testing.assert_array_equal(np.stack([found[i] for i in range(3)]), _vectors(3))
+    assert reopened.stats()["hits"] == 3 and reopened.stats()["misses"] == 1
+
+
+def test_other_model_or_capacity_starts_empty(tmp_path):
+    cache = EmbeddingCache(tmp_path, MODEL, capacity=10)
+    cache.put_many(_keys("a"), _vectors(1))
+    cache.flush()
+
+    assert EmbeddingCache(tmp_path, "outro-modelo", capacity=10).get_many(_keys("a")) == {}
+    assert EmbeddingCache(tmp_path, MODEL, capacity=20).get_many(_keys("a")) == {}
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = EmbeddingCache(tmp_path, MODEL, capacity=20)
+    old = _keys(*(f"t{i}" for i in range(20)))
+    cache.put_many(old, _vectors(20))
+    assert len(cache.get_many(old[:5])) == 5  # os 5 primeiros viram os mais recentes
+
+    new = _keys(*(f"n{i}" for i in range(5)))
+    cache.put_many(new, _vectors(5, start=1000))
+
+    assert len(cache.get_many(new)) == 5
+    assert len(cache.get_many(old[:5])) == 5
+    assert cache.get_many(old[5:10]) == {}
+    assert cache.stats()["evictions"] == 5 and cache.stats()["entries"] == 20
+
+
+def test_batch_larger_than_capacity_keeps_what_fits(tmp_path):
+    cache = EmbeddingCache(tmp_path, MODEL, capacity=8)
+    keys = _keys(*(f"t{i}" for i in range(30)))
+    cache.put_many(keys, _vectors(30))
+
+    assert cache.stats()["entries"] == 8
+    assert len(cache.get_many(keys)) == 8
+
+
+def test_dimension_change_recreates_the_cache(tmp_path):
+    cache = EmbeddingCache(tmp_path, MODEL, capacity=10)
+    cache.put_many(_keys("a"), _vectors(1, dim=4))
+    cache.put_many(_keys("b"), _vectors(1, dim=8))
+
+    assert cache.get_many(_keys("a")) == {}
+    assert cache.get_many(_keys("b"))[0].shape == (8,)
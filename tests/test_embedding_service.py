@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import stat
+import threading
+
+import pytest
+
+from src.embedding_service import _HEADER, RemoteEmbeddingEngine, _recv_exactly, serve
+from tests.conftest import FakeEngine
+
+
+class _FakeService:
+    """Servidor mínimo do protocolo: responde `info`, conta pedidos recebidos.
+
+    `close_after` fecha a conexão depois de N respostas (serviço reiniciado);
+    `silent` recebe o pedido e nunca responde (encode longo).
+    """
+
+    def __init__(self, path, *, close_after: int | None = None, silent: bool = False) -> None:
+        self.requests = 0
+        self.connections = 0
+        self.close_after = close_after
+        self.silent = silent
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(str(path))
+        self._listener.listen()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            with conn:
+                answered = 0
+                while True:
+                    try:
+                        (size,) = _HEADER.unpack(_recv_exactly(conn, _HEADER.size))
+                        _recv_exactly(conn, size)
+                    except OSError:
+                        break
+                    self.requests += 1
+                    if self.silent:
+                        continue
+                    payload = b"J" + json.dumps({"ok": True}).encode()
+                    conn.sendall(_HEADER.pack(len(payload)) + payload)
+                    answered += 1
+                    if answered == self.close_after:
+                        break
+
+    def close(self) -> None:
+        self._listener.close()
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return tmp_path / "embed.sock"
+
+
+def test_reconnects_once_after_service_restart(socket_path):
+    service = _FakeService(socket_path, close_after=1)
+    engine = RemoteEmbeddingEngine(socket_path, "fake-model", timeout=2)
+
+    assert engine.info() == {"ok": True}
+    assert engine.info() == {"ok": True}  # conexão velha: BrokenPipe no envio, reconecta
+    assert service.requests == 2 and service.connections == 2
+    service.close()
+
+
+def test_timeout_after_send_is_not_retried(socket_path):
+    service = _FakeService(socket_path, silent=True)
+    engine = RemoteEmbeddingEngine(socket_path, "fake-model", timeout=0.2)
+
+    with pytest.raises(ConnectionError):
+        engine.info()
+    assert service.requests == 1 and service.connections == 1
+    service.close()
+
+
+def test_missing_socket_fails_after_one_reconnect(socket_path):
+    engine = RemoteEmbeddingEngine(socket_path, "fake-model", timeout=0.2)
+    with pytest.raises(ConnectionError, match="indisponível"):
+        engine.info()
+
+
+def test_socket_is_bound_without_world_access(socket_path):
+    seen: dict = {}
+
+    async def scenario():
+        task = asyncio.create_task(serve(socket_path, FakeEngine()))
+        while not socket_path.exists():
+            await asyncio.sleep(0.01)
+        seen["mode"] = stat.S_IMODE(os.stat(socket_path).st_mode)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    umask = os.umask(0o022)
+    try:
+        asyncio.run(scenario())
+        assert os.umask(0o022) == 0o022  # umask do processo restaurado
+    finally:
+        os.umask(umask)
+    assert seen["mode"] == 0o660
+    assert not socket_path.exists()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from src.chroma_setup import collection_write_lock
+from src.jobs import IngestScheduler
+from src.rag import ingest_directory
+
+PARAMS = {"chunk_size": 200, "overlap": 20, "mode": "chars", "workers": 1}
+
+
+def _write(path, tag: str) -> None:
+    path.write_text(" ".join(f"{tag}palavra{i}" for i in range(120)), encoding="utf-8")
+
+
+def _wait(predicate, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "tempo esgotado"
+        time.sleep(0.01)
+
+
+def test_ingest_waits_for_another_writer_and_reloads_manifest(rag_env):
+    for name in ("a.txt", "b.txt"):
+        _write(rag_env.docs / name, name)
+    inside, release = threading.Event(), threading.Event()
+
+    def hold(progress):
+        inside.set()
+        release.wait(10)
+
+    # Outra "instância" (thread com seu próprio flock) no meio da ingestão.
+    other = threading.Thread(
+        target=ingest_directory, args=(rag_env.docs,), kwargs={**PARAMS, "progress": hold}
+    )
+    other.start()
+    assert inside.wait(10)
+
+    scheduler = IngestScheduler(max_workers=1)
+    try:
+        job, _ = scheduler.submit({"source_dir": str(rag_env.docs), **PARAMS})
+        _wait(lambda: job.status == "running")
+        time.sleep(0.2)
+        assert job.status == "running" and not job.progress  # esperando o lock
+
+        release.set()
+        other.join(10)
+        _wait(lambda: job.status not in ("queued", "running"))
+    finally:
+        release.set()
+        scheduler.shutdown()
+
+    assert job.status == "done", job.error
+    assert job.result["files"] == 0 and job.result["skipped"] == 2
+
+
+def test_write_lock_is_reentrant_in_the_same_thread(rag_env):
+    done = threading.Event()
+
+    def nested():
+        with collection_write_lock(), collection_write_lock():
+            done.set()
+
+    worker = threading.Thread(target=nested, daemon=True)
+    worker.start()
+    worker.join(5)
+    assert done.is_set()
+
+
+def test_identical_requests_coalesce_and_queued_job_cancels():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def run(**params):
+        calls.append(params["n"])
+        started.set()
+        release.wait(10)
+        return {"files": 0}
+
+    scheduler = IngestScheduler(max_workers=2, run=run)
+    try:
+        first, merged = scheduler.submit({"n": 1}, collection="c")
+        assert started.wait(5) and not merged
+        again, merged = scheduler.submit({"n": 1}, collection="c")
+        queued, _ = scheduler.submit({"n": 2}, collection="c")
+        assert merged and again is first
+
+        time.sleep(0.1)
+        assert queued.status == "queued"  # mesma coleção: espera o primeiro
+        scheduler.cancel(queued.id)
+        release.set()
+        _wait(lambda: first.status == "done")
+    finally:
+        release.set()
+        scheduler.shutdown()
+
+    assert queued.status == "cancelled" and calls == [1]
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+
+from src.chroma_setup import get_collection
+from src.manifest import IngestManifest, manifest_file
+from src.rag import ingest_directory
+from src.settings import settings
+
+
+def _write(path, words: int = 120, tag: str = "") -> None:
+    path.write_text(
+        " ".join(f"{tag}palavra{i}" for i in range(words)), encoding="utf-8"
+    )
+
+
+def _ingest(folder):
+    return ingest_directory(folder, chunk_size=200, overlap=20, mode="chars", workers=1)
+
+
+def _indexed_ids() -> set[str]:
+    return set(get_collection().get(include=[])["ids"])
+
+
+def _manifest_ids() -> set[str]:
+    return {i for record in IngestManifest.load() for i in record.chunk_ids}
+
+
+def test_unchanged_files_are_skipped(rag_env):
+    for name in ("a.txt", "b.txt"):
+        _write(rag_env.docs / name, tag=name)
+
+    first = _ingest(rag_env.docs)
+    encoded = rag_env.engine.encoded
+    second = _ingest(rag_env.docs)
+
+    assert first["files"] == 2 and first["chunks"] > 0
+    assert second["files"] == 0 and second["skipped"] == 2
+    assert rag_env.engine.encoded == encoded
+    assert _indexed_ids() == _manifest_ids()
+
+
+def test_changed_file_is_reindexed(rag_env):
+    _write(rag_env.docs / "a.txt", tag="a")
+    _write(rag_env.docs / "b.txt", tag="b")
+    _ingest(rag_env.docs)
+    before = IngestManifest.load().get(rag_env.docs / "a.txt")
+
+    _write(rag_env.docs / "a.txt", words=40, tag="novo")
+    result = _ingest(rag_env.docs)
+
+    after = IngestManifest.load().get(rag_env.docs / "a.txt")
+    assert result["files"] == 1 and result["skipped"] == 1
+    assert after.sha256 != before.sha256
+    assert len(after.chunk_ids) < len(before.chunk_ids)
+    assert _indexed_ids() == _manifest_ids()
+
+
+def test_deleted_file_is_purged(rag_env):
+    _write(rag_env.docs / "a.txt", tag="a")
+    _write(rag_env.docs / "b.txt", tag="b")
+    _ingest(rag_env.docs)
+    gone = IngestManifest.load().get(rag_env.docs / "b.txt").chunk_ids
+
+    (rag_env.docs / "b.txt").unlink()
+    result = _ingest(rag_env.docs)
+
+    assert result["removed"] == 1
+    assert IngestManifest.load().get(rag_env.docs / "b.txt") is None
+    assert not _indexed_ids() & set(gone)
+    assert _indexed_ids() == _manifest_ids()
+
+
+def test_relative_and_absolute_spellings_share_records(rag_env, monkeypatch):
+    _write(rag_env.docs / "a.txt", tag="a")
+    monkeypatch.chdir(rag_env.docs.parent)
+
+    _ingest("docs")
+    ids = _indexed_ids()
+    again = _ingest(rag_env.docs.resolve())
+
+    assert again["files"] == 0 and again["skipped"] == 1
+    assert _indexed_ids() == ids
+    assert IngestManifest.load().get("docs/a.txt") is not None
+
+
+def test_collections_keep_separate_manifests(rag_env, monkeypatch):
+    _write(rag_env.docs / "a.txt", tag="a")
+    _ingest(rag_env.docs)
+
+    monkeypatch.setattr(settings, "collection_name", "outra")
+    other = _ingest(rag_env.docs)
+    monkeypatch.setattr(settings, "collection_name", "test_docs")
+    back = _ingest(rag_env.docs)
+
+    assert other["files"] == 1
+    assert back["files"] == 0 and back["skipped"] == 1
+    assert manifest_file("test_docs") != manifest_file("outra")
+    assert manifest_file("outra").exists()
+
+
+def test_legacy_manifest_is_migrated(rag_env, monkeypatch):
+    monkeypatch.chdir(rag_env.docs.parent)
+    _write(rag_env.docs / "a.txt", tag="a")
+    settings.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    settings.manifest_path.write_text(
+        json.dumps(
+            {
+                "version": 1,
+                "collection": "test_docs",
+                "files": [
+                    {
+                        "path": "docs/a.txt",
+                        "size": 1,
+                        "mtime": 0.0,
+                        "sha256": "x",
+                        "chunk_ids": ["a-1"],
+                    }
+                ],
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    manifest = IngestManifest.load()
+    manifest.save()
+
+    record = manifest.get(rag_env.docs / "a.txt")
+    assert record is not None and record.path == str((rag_env.docs / "a.txt").resolve())
+    assert manifest_file().exists()
+    assert IngestManifest.load().get("docs/a.txt").chunk_ids == ["a-1"]
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import logging
+
+from src import metrics
+
+
+def test_failing_callback_is_logged_once_and_skipped(monkeypatch, caplog):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    healthy = metrics.Gauge("test_healthy", "Sempre responde.")
+    broken = metrics.Gauge("test_broken", "Fonte com erro.")
+    healthy.set(3)
+    state = {"fail": True}
+
+    def read():
+        if state["fail"]:
+            raise RuntimeError("fonte fora do ar")
+        return 7
+
+    broken.set_function(read)
+    with caplog.at_level(logging.ERROR, logger="src.metrics"):
+        first = registry.render()
+        registry.render()
+
+    assert "test_healthy 3.0" in first and "test_broken " not in first
+    failures = [r for r in caplog.records if "test_broken" in r.getMessage()]
+    assert len(failures) == 1 and failures[0].exc_info is not None
+
+    state["fail"] = False
+    assert "test_broken 7.0" in registry.render()
+    state["fail"] = True
+    caplog.clear()
+    with caplog.at_level(logging.ERROR, logger="src.metrics"):
+        registry.render()
+    assert len(caplog.records) == 1  # voltou a falhar: loga de novo
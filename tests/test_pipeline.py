@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import sys
+
+import pytest
+
+from src import pipeline
+from src.pipeline import extract_pool, iter_file_chunks, shutdown_pool, start_pool
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for n in range(4):
+        path = tmp_path / f"doc{n}.txt"
+        path.write_text(" ".join(f"doc{n}-palavra{i}" for i in range(300)), encoding="utf-8")
+        paths.append(path)
+    yield paths
+    shutdown_pool()
+
+
+def _chunks(paths, workers: int) -> list[tuple[str, list[str]]]:
+    return [
+        (path.name, [c.text for c in chunks])
+        for path, chunks in iter_file_chunks(
+            paths, chunk_size=200, overlap=20, mode="chars", workers=workers
+        )
+    ]
+
+
+def test_pool_matches_sequential_and_is_reused(files):
+    main = sys.modules["__main__"]
+    assert start_pool(2) == 2
+    pool = pipeline._pool
+    pids = set(pool._processes)
+
+    first = _chunks(files, workers=2)
+    second = _chunks(files, workers=2)
+
+    assert first == second == _chunks(files, workers=1)
+    assert pipeline._pool is pool
+    assert len(pids) == 2 and set(pool._processes) == pids  # nenhum processo novo
+    assert sys.modules["__main__"] is main
+
+
+def test_abandoned_ingest_keeps_the_pool(files):
+    stream = iter_file_chunks(files, chunk_size=200, overlap=20, mode="chars", workers=2)
+    next(stream)
+    stream.close()  # consumidor desistiu (ex.: ingestão cancelada)
+
+    pool = pipeline._pool
+    assert [name for name, _ in _chunks(files, workers=2)] == [p.name for p in files]
+    assert pipeline._pool is pool
+
+
+def test_other_worker_count_replaces_the_pool(files):
+    pool = extract_pool(2)
+    assert extract_pool(2) is pool
+    assert extract_pool(3) is not pool
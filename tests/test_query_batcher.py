@@ -0,0 +1,47 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.query_batcher import QueryBatcher
+
+
+def _encode(texts):
+    return np.asarray([[len(t), ord(t[0])] for t in texts], dtype=np.float32)
+
+
+def test_results_follow_submission_order():
+    batcher = QueryBatcher(_encode, max_batch=8, max_wait_ms=1)
+    texts = [f"{chr(97 + i % 26)}{'x' * i}" for i in range(50)]
+    with ThreadPoolExecutor(8) as pool:
+        vectors = list(pool.map(batcher.encode, texts))
+    for text, vector in zip(texts, vectors):
+        assert vector.tolist() == [len(text), ord(text[0])]
+    assert batcher.stats()["requests"] == 50
+
+
+def test_lone_query_does_not_wait_for_window():
+    batcher = QueryBatcher(_encode, max_wait_ms=500)
+    batcher.encode("aquece")
+    started = time.perf_counter()
+    batcher.encode("sozinha")
+    assert time.perf_counter() - started < 0.2
+
+
+def test_waits_for_more_queries_only_while_model_busy():
+    busy = threading.Event()
+    sizes = []
+
+    def encode(texts):
+        sizes.append(len(texts))
+        return _encode(texts)
+
+    batcher = QueryBatcher(encode, max_batch=8, max_wait_ms=300, busy=busy.is_set)
+    busy.set()
+    futures = [batcher.submit("a")]
+    time.sleep(0.05)
+    futures += [batcher.submit("b"), batcher.submit("c")]
+    busy.clear()
+    assert [f.result(timeout=2).tolist()[1] for f in futures] == [97, 98, 99]
+    assert sizes == [3]
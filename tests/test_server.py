@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import server
+from src.admission import AdmissionController
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    controller = AdmissionController(1, queue_size=0, timeout=1)
+    monkeypatch.setattr(server, "admission", controller)
+    return controller
+
+
+def test_stream_ticket_released_when_client_leaves_before_start(admission):
+    started = []
+
+    async def body():
+        started.append(True)
+        yield "event: x\n\n"
+
+    async def scenario():
+        ticket = await admission.acquire("u")
+        response = server._AdmittedStream(body(), ticket, media_type="text/event-stream")
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("cliente caiu")
+
+        scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+        with pytest.raises(Exception):
+            await response(scope, receive, send)
+
+    asyncio.run(scenario())
+    assert admission.active == 0
+    assert not started
+
+
+def test_stream_ticket_released_once_after_streaming(admission):
+    sent = []
+
+    async def body():
+        yield "event: a\n\n"
+        yield "event: b\n\n"
+
+    async def scenario():
+        ticket = await admission.acquire("u")
+        response = server._AdmittedStream(body(), ticket, media_type="text/event-stream")
+
+        async def receive():
+            await asyncio.sleep(10)
+
+        async def send(message):
+            sent.append(message)
+
+        await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+
+    asyncio.run(scenario())
+    assert admission.active == 0 and admission.admitted == 1
+    assert b"".join(m.get("body", b"") for m in sent) == b"event: a\n\nevent: b\n\n"
+
+
+@pytest.mark.parametrize(
+    ("path", "payload"),
+    [
+        ("/search/batch", {"questions": ["a", "b"]}),
+        ("/debug/search", {"question": "a"}),
+    ],
+)
+def test_search_endpoints_go_through_admission(admission, monkeypatch, path, payload):
+    async def fake_search(question, *, top_k):
+        return []
+
+    monkeypatch.setattr(server, "search_many", lambda qs, top_k: [[] for _ in qs])
+    monkeypatch.setattr(server, "search_async", fake_search)
+    client = TestClient(server.app)
+
+    assert client.post(path, json=payload).status_code == 200
+    assert admission.admitted == 1 and admission.active == 0
+
+    admission.active = admission.limit  # servidor lotado, fila de tamanho 0
+    busy = client.post(path, json=payload)
+    assert busy.status_code == 503 and "Retry-After" in busy.headers
+
+
+def test_ingest_rejects_chunk_size_below_mode_minimum():
+    client = TestClient(server.app)
+    response = client.post("/ingest", json={"chunk_size": 50, "mode": "chars"})
+    assert response.status_code == 422 and "mínimo" in response.json()["detail"]
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from google.adk.events import Event, EventActions
+from google.genai import types
+
+from src.sessions import BoundedSessionService
+
+APP = "rag"
+
+
+def _event(author: str, text: str = "oi", **actions) -> Event:
+    role = "user" if author == "user" else "model"
+    return Event(
+        author=author,
+        invocation_id="inv",
+        content=types.Content(role=role, parts=[types.Part(text=text)]),
+        actions=EventActions(**actions),
+    )
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+async def _conversation(service, session_id: str, turns: int, text: str = "oi"):
+    session = await service.create_session(app_name=APP, user_id="u", session_id=session_id)
+    for _ in range(turns):
+        await service.append_event(session, _event("user", text))
+        await service.append_event(session, _event("agent", text))
+    return session
+
+
+async def _get(service, session_id: str):
+    return await service.get_session(app_name=APP, user_id="u", session_id=session_id)
+
+
+def test_history_is_trimmed_at_a_user_turn():
+    service = BoundedSessionService(max_events=3, max_tokens=0)
+
+    async def scenario():
+        await _conversation(service, "s", turns=3)
+        return await _get(service, "s")
+
+    session = _run(scenario())
+    assert [e.author for e in session.events] == ["user", "agent"]
+    assert service.stats()["trimmed_events"] == 4
+
+
+def test_token_budget_keeps_the_last_turn():
+    service = BoundedSessionService(max_events=0, max_tokens=10)
+
+    async def scenario():
+        await _conversation(service, "s", turns=4, text="x" * 200)
+        return await _get(service, "s")
+
+    session = _run(scenario())
+    assert [e.author for e in session.events] == ["user", "agent"]
+    assert service.stats()["bytes_held"] == sum(
+        len(e.model_dump_json(exclude_none=True)) for e in session.events
+    )
+
+
+def test_idle_sessions_are_evicted():
+    service = BoundedSessionService(idle_ttl=0.05)
+
+    async def scenario():
+        await _conversation(service, "velha", turns=1)
+        await asyncio.sleep(0.1)
+        await _conversation(service, "nova", turns=1)
+        return await _get(service, "velha"), await _get(service, "nova")
+
+    old, new = _run(scenario())
+    assert old is None and new is not None
+    assert service.stats()["evictions"] == {"idle": 1, "memory": 0}
+
+
+def test_memory_cap_evicts_least_recently_used():
+    probe = BoundedSessionService(max_tokens=0)
+    _run(_conversation(probe, "p", turns=2, text="p" * 300))
+    cap = probe.stats()["bytes_held"] * 5 // 2  # cabem duas conversas, não três
+    service = BoundedSessionService(max_tokens=0, max_total_bytes=cap)
+
+    async def scenario():
+        await _conversation(service, "a", turns=2, text="a" * 300)
+        await _conversation(service, "b", turns=2, text="b" * 300)
+        await _get(service, "a")  # "a" passa a ser a mais recente
+        await _conversation(service, "c", turns=2, text="c" * 300)
+        return [await _get(service, s) for s in ("a", "b", "c")]
+
+    a, b, c = _run(scenario())
+    assert a is not None and b is None and c is not None
+    stats = service.stats()
+    assert stats["evictions"]["memory"] == 1
+    assert stats["bytes_held"] <= cap
+
+
+def test_evicted_sessions_spill_to_sqlite(tmp_path):
+    service = BoundedSessionService(idle_ttl=0.05, db_path=tmp_path / "sessions.db")
+
+    async def scenario():
+        await _conversation(service, "s", turns=2)
+        await asyncio.sleep(0.1)
+        await _conversation(service, "outra", turns=1)
+        return await _get(service, "s")
+
+    session = _run(scenario())
+    assert session is not None and len(session.events) == 4
+    stats = service.stats()
+    assert stats["spilled"] == 1 and stats["restored"] == 1
+
+
+def test_event_after_eviction_recreates_the_session():
+    service = BoundedSessionService(idle_ttl=0.05)
+
+    async def scenario():
+        session = await _conversation(service, "s", turns=1)
+        time.sleep(0.1)
+        await service.append_event(
+            session, _event("agent", "fim", state_delta={"k": 1, "app:modo": "rag"})
+        )
+        return await _get(service, "s")
+
+    session = _run(scenario())
+    assert session is not None
+    assert [e.author for e in session.events] == ["user", "agent", "agent"]
+    assert session.state["k"] == 1 and session.state["app:modo"] == "rag"
+    assert service.stats()["recreated"] == 1
+    assert "app:modo" not in service._entries[(APP, "u", "s")].session.state
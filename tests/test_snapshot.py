@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from src.chroma_setup import get_collection
+from src.chroma_writer import chroma_writer
+from src.file_lock import file_lock
+from src.manifest import IngestManifest
+from src.rag import ingest_directory
+from src.settings import settings
+from src.snapshot import export_snapshot, import_snapshot, load_info
+
+
+def _rows() -> dict[str, tuple]:
+    got = get_collection().get(include=["embeddings", "documents", "metadatas"])
+    return {
+        id_: (np.asarray(emb, dtype=np.float32), doc, meta)
+        for id_, emb, doc, meta in zip(
+            got["ids"], got["embeddings"], got["documents"], got["metadatas"]
+        )
+    }
+
+
+@pytest.fixture
+def indexed(rag_env):
+    for name in ("a.txt", "b.txt", "c.txt"):
+        (rag_env.docs / name).write_text(
+            " ".join(f"{name}-{i}" for i in range(150)), encoding="utf-8"
+        )
+    ingest_directory(rag_env.docs, chunk_size=200, overlap=20, workers=1)
+    return rag_env
+
+
+def test_round_trip(indexed, tmp_path, monkeypatch):
+    before = _rows()
+    files = {r.path for r in IngestManifest.load()}
+    out = tmp_path / "snap"
+
+    exported = export_snapshot(out, dtype="float32", batch_size=7)
+    # Outro nó: coleção vazia, writer novo.
+    monkeypatch.setattr(settings, "collection_name", "restored")
+    chroma_writer.cache_clear()
+    imported = import_snapshot(out, batch_size=5)
+
+    assert exported["rows"] == imported["rows"] == len(before)
+    after = _rows()
+    assert after.keys() == before.keys()
+    for id_, (emb, doc, meta) in before.items():
+        np.testing.assert_allclose(after[id_][0], emb, rtol=1e-6)
+        assert after[id_][1:] == (doc, meta)
+    assert {r.path for r in IngestManifest.load()} == files
+
+
+def test_export_holds_the_write_lock(indexed, tmp_path):
+    lock = settings.processed_dir / f".{settings.collection_name}.ingest.lock"
+    seen = []
+
+    def progress(done, total):
+        with file_lock(lock, blocking=False) as acquired:
+            seen.append(acquired)
+
+    export_snapshot(tmp_path / "snap", batch_size=4, progress=progress)
+
+    assert seen and not any(seen)
+
+
+def test_shrinking_collection_writes_only_rows_read(indexed, tmp_path, monkeypatch):
+    collection = get_collection()
+    real = collection.count()
+    monkeypatch.setattr(collection, "count", lambda: real + 3)
+    out = tmp_path / "snap"
+
+    result = export_snapshot(out, dtype="float16", batch_size=4)
+
+    embeddings = np.load(out / "embeddings.npy", mmap_mode="r")
+    assert result["rows"] == load_info(out)["rows"] == real
+    assert embeddings.shape[0] == real
+    assert np.all(np.abs(embeddings).sum(axis=1) > 0)
+    assert not (out / "embeddings.npy.part").exists()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from src.vector_store import NumpyVectorStore
+
+
+def _store(path, **kwargs) -> NumpyVectorStore:
+    return NumpyVectorStore(path, persist_delay=0, **kwargs)
+
+
+def _fill(store: NumpyVectorStore) -> None:
+    store.upsert(
+        ids=["a0", "a1", "b0", "c0"],
+        embeddings=np.eye(4, dtype=np.float32),
+        metadatas=[
+            {"source": "a.pdf", "page": 1, "chunk": 0, "lang": "pt"},
+            {"source": "a.pdf", "page": 2, "chunk": 1, "lang": "en"},
+            {"source": "b.pdf", "page": 1, "chunk": 0, "lang": "pt"},
+            {"source": "c.txt", "chunk": 0},
+        ],
+        documents=["a zero", "a um", "b zero", "c zero"],
+    )
+
+
+@pytest.mark.parametrize(
+    ("where", "expected"),
+    [
+        ({"source": "a.pdf"}, {"a0", "a1"}),
+        ({"source": "nenhum.pdf"}, set()),
+        ({"page": {"$gte": 2}}, {"a1"}),
+        ({"page": {"$ne": 1}}, {"a1", "c0"}),
+        ({"lang": "pt"}, {"a0", "b0"}),
+        ({"source": {"$in": ["b.pdf", "c.txt"]}}, {"b0", "c0"}),
+        ({"source": {"$nin": ["a.pdf"]}}, {"b0", "c0"}),
+        ({"$and": [{"source": "a.pdf"}, {"page": 1}]}, {"a0"}),
+        ({"$or": [{"source": "c.txt"}, {"lang": "en"}]}, {"a1", "c0"}),
+    ],
+)
+def test_where_filters_get_and_query(tmp_path, where, expected):
+    store = _store(tmp_path)
+    _fill(store)
+
+    assert set(store.get(where=where)["ids"]) == expected
+    hits = store.query([[1, 1, 1, 1]], n_results=10, where=where)
+    assert set(hits["ids"][0]) == expected
+    assert len(hits["distances"][0]) == len(expected)
+
+
+def test_query_ranks_by_cosine_and_respects_filter(tmp_path):
+    store = _store(tmp_path)
+    _fill(store)
+
+    hits = store.query([[0.1, 1, 0, 0], [1, 0, 0, 0]], n_results=2, where={"source": "a.pdf"})
+
+    assert hits["ids"] == [["a1", "a0"], ["a0", "a1"]]
+    assert hits["distances"][1][0] == pytest.approx(0.0, abs=1e-6)
+    assert hits["metadatas"][0][0] == {"source": "a.pdf", "page": 2, "chunk": 1, "lang": "en"}
+
+
+def test_delete_by_where_and_reopen(tmp_path):
+    store = _store(tmp_path, dtype="float16")
+    _fill(store)
+    store.delete(where={"source": "a.pdf"})
+    store.upsert(ids=["b0"], embeddings=[[0, 0, 0, 1]], documents=["b novo"], metadatas=[{"source": "b.pdf"}])
+
+    reopened = _store(tmp_path, dtype="float16")
+
+    assert reopened.count() == 2
+    got = reopened.get(ids=["b0", "c0", "a0"], include=("documents", "metadatas", "embeddings"))
+    assert got["ids"] == ["b0", "c0"]
+    assert got["documents"] == ["b novo", "c zero"]
+    assert got["metadatas"][0] == {"source": "b.pdf"}
+    np.testing.assert_allclose(got["embeddings"][0], [0, 0, 0, 1])
+    assert reopened.query([[0, 0, 0, 1]], n_results=1)["ids"] == [["b0"]]
+
+
+def test_first_write_to_empty_store_after_reopen(tmp_path):
+    _store(tmp_path).clear()  # grava uma versão vazia
+    store = _store(tmp_path)
+    assert store.count() == 0
+
+    _fill(store)
+
+    assert _store(tmp_path).count() == 4
+
+
+def test_concurrent_writers_merge_on_persist(tmp_path):
+    first = NumpyVectorStore(tmp_path, persist_delay=60)
+    second = NumpyVectorStore(tmp_path, persist_delay=60)
+    first.upsert(ids=["x"], embeddings=[[1, 0]], documents=["de um"])
+    second.upsert(ids=["y"], embeddings=[[0, 1]], documents=["de outro"])
+
+    first.persist()
+    second.persist()  # a versão do disco é mais nova: mescla em vez de sobrescrever
+
+    assert sorted(_store(tmp_path).get()["ids"]) == ["x", "y"]
+
+
+def test_other_process_write_is_picked_up(tmp_path):
+    reader = _store(tmp_path)
+    assert reader.count() == 0
+
+    _fill(_store(tmp_path))
+
+    assert reader.count() == 4
+    assert reader.get(where={"source": "b.pdf"})["ids"] == ["b0"]